@@ -0,0 +1,467 @@
+# module: control_api
+# API de contrôle locale (tablette sur le réseau de scène) : HTTP + WebSocket sur asyncio, sans dépendance externe
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import threading
+import midi_input
+import test_utility
+
+# Clé de la poignée de main WebSocket (RFC 6455)
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+WS_OPCODE_TEXT = 0x1
+WS_OPCODE_CLOSE = 0x8
+WS_OPCODE_PING = 0x9
+WS_OPCODE_PONG = 0xA
+WS_CLOSE_MESSAGE_TOO_BIG = 1009
+
+# Taille maximale d'un corps de requête HTTP ou d'une trame WebSocket (les messages de l'API font moins de 100 octets)
+API_MAX_REQUEST_BYTES = 64 * 1024
+
+HTTP_REASONS = {101: 'Switching Protocols', 200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+                405: 'Method Not Allowed', 413: 'Payload Too Large'}
+
+API_HELP = {
+    'GET /state': "chanson courante et état connu de la table",
+    'POST /song': '{"pc": "2:5"} | {"query": "septembre"} | {"action": "next_song"}',
+    'POST /param': '{"command": "chant_emilie/send/facade", "value": "-5"}',
+    'GET /ws': "WebSocket : état poussé à chaque changement, accepte les mêmes messages JSON avec \"type\": \"song\" | \"param\"",
+}
+
+def get_control_api_config(config):
+    """
+    Retourne la configuration de l'API ("control_api" dans config.json) :
+    {'host': ..., 'port': ..., 'fader_rate_hz': ...}. Un port à 0 (ou absent) désactive l'API.
+    """
+    api_config = config.get('control_api', {})
+    return {
+        'host': api_config.get('host', '127.0.0.1'),
+        'port': int(api_config.get('port', 0)),
+        'fader_rate_hz': float(api_config.get('fader_rate_hz', 20)),
+    }
+
+def is_allowed_origin(headers):
+    """
+    Refuse les demandes envoyées par une page web d'un autre site (en-tête Origin d'un autre hôte) :
+    sans cela, n'importe quel onglet ouvert sur le réseau de scène pourrait piloter le contrôleur.
+    Les clients hors navigateur (application de la tablette, scripts) n'envoient pas d'en-tête Origin.
+    """
+    origin = headers.get('origin')
+    return origin is None or origin.split('://', 1)[-1] == headers.get('host', '')
+
+def get_websocket_accept(key):
+    """Valeur de l'en-tête Sec-WebSocket-Accept pour la clé Sec-WebSocket-Key du client."""
+    return base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode('ascii')).digest()).decode('ascii')
+
+def encode_websocket_frame(payload, opcode=WS_OPCODE_TEXT):
+    """Trame WebSocket serveur -> client (jamais masquée)."""
+    length = len(payload)
+    if length < 126:
+        header = bytes((0x80 | opcode, length))
+    elif length < 0x10000:
+        header = bytes((0x80 | opcode, 126)) + struct.pack('!H', length)
+    else:
+        header = bytes((0x80 | opcode, 127)) + struct.pack('!Q', length)
+    return header + payload
+
+async def read_websocket_frame(reader):
+    """
+    Lit une trame client -> serveur (masquée). Retourne (opcode, données démasquées).
+    Lève ValueError si la longueur annoncée dépasse API_MAX_REQUEST_BYTES (rien n'est lu au-delà de l'en-tête).
+    """
+    first, second = await reader.readexactly(2)
+    opcode = first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', await reader.readexactly(8))[0]
+    if length > API_MAX_REQUEST_BYTES:
+        raise ValueError(f"trame de {length} octets (maximum {API_MAX_REQUEST_BYTES})")
+    mask = await reader.readexactly(4) if second & 0x80 else b'\x00\x00\x00\x00'
+    payload = await reader.readexactly(length)
+    # démasquage en un seul XOR sur des entiers plutôt qu'octet par octet
+    mask_stream = (mask * (length // 4 + 1))[:length]
+    payload = (int.from_bytes(payload, 'big') ^ int.from_bytes(mask_stream, 'big')).to_bytes(length, 'big')
+    return opcode, payload
+
+class FaderCoalescer:
+    """
+    Regroupe les mouvements de fader reçus par l'API : seule la dernière valeur de chaque paramètre
+    est transmise, au plus une fois par intervalle. Un doigt rapide sur la tablette ne peut donc pas
+    saturer la liaison MIDI de la table (31250 bauds, environ 1 ms par message NRPN de 12 octets).
+    """
+
+    def __init__(self, push_param, interval):
+        self.push_param = push_param
+        self.interval = interval
+        self.pending = {}       # paramètre -> dernière valeur reçue
+        self.received_count = 0
+        self.sent_count = 0
+
+    def set(self, command, value):
+        self.pending[command] = value
+        self.received_count += 1
+
+    def flush(self):
+        """Transmet les valeurs en attente. Retourne leur nombre."""
+        pending, self.pending = self.pending, {}
+        for command, value in pending.items():
+            self.push_param(command, value)
+        self.sent_count += len(pending)
+        return len(pending)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.flush()
+
+class ControlApiServer:
+    """
+    Serveur HTTP/WebSocket tournant dans sa propre boucle asyncio (thread dédié).
+    Il ne touche jamais à l'état du contrôleur : les demandes sont transmises par push_event
+    (la file d'événements traitée par le thread principal), et l'état à publier est fourni
+    par le contrôleur via notify_state.
+    """
+
+    def __init__(self, push_event, host='127.0.0.1', port=0, fader_rate_hz=20):
+        self.push_event = push_event
+        self.host = host
+        self.port = port
+        self.coalescer = FaderCoalescer(self.push_param, 1.0 / fader_rate_hz)
+        self.state_json = b'{}'
+        self.websockets = set()
+        self.loop = None
+        self.server = None
+        self.ready = threading.Event()
+
+    def push_param(self, command, value):
+        # paramètre typé : le contrôleur n'y accepte qu'une ligne [MIX], [PEDALS] ou bpm, jamais une commande de la console
+        self.push_event(('param', (command, value)))
+
+    def handle_request(self, request):
+        """
+        Traite une demande JSON (corps d'un POST ou message WebSocket).
+        Retourne (code HTTP, réponse JSON).
+        """
+        request_type = request.get('type')
+        if request_type == 'song':
+            if 'pc' in request:
+                try:
+                    song_number = midi_input.parse_program_key(request['pc'])
+                except ValueError as e:
+                    return 400, {'error': str(e)}
+                self.push_event(('pc', song_number - 1))
+            elif 'query' in request:
+                self.push_event(('goto', str(request['query'])))
+            elif 'action' in request:
+                if request['action'] not in midi_input.TRIGGER_ACTIONS:
+                    return 400, {'error': f"action inconnue, attendu {midi_input.TRIGGER_ACTIONS}"}
+                self.push_event(('action', request['action']))
+            else:
+                return 400, {'error': "attendu 'pc', 'query' ou 'action'"}
+            return 200, {'queued': True}
+
+        if request_type == 'param':
+            if 'command' not in request or 'value' not in request:
+                return 400, {'error': "attendu 'command' et 'value'"}
+            self.coalescer.set(str(request['command']).strip().lower(), str(request['value']).strip())
+            return 200, {'queued': True}
+
+        return 400, {'error': "type de demande inconnu, attendu 'song' ou 'param'"}
+
+    def notify_state(self, state):
+        """Publie l'état du contrôleur (appelé depuis le thread principal)."""
+        state_json = json.dumps(state).encode('utf-8')
+        if self.loop is not None and state_json != self.state_json:
+            self.loop.call_soon_threadsafe(self.broadcast_state, state_json)
+
+    def broadcast_state(self, state_json):
+        self.state_json = state_json
+        frame = encode_websocket_frame(state_json)
+        for writer in list(self.websockets):
+            writer.write(frame)
+
+    async def send_http_response(self, writer, status, body):
+        payload = json.dumps(body).encode('utf-8') if not isinstance(body, bytes) else body
+        writer.write(
+            f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+            f"Connection: close\r\n\r\n".encode('ascii') + payload
+        )
+        await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1')
+                if line in ('\r\n', '\n', ''):
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            if len(request_line) < 2:
+                return
+            method, path = request_line[0].upper(), request_line[1].split('?', 1)[0]
+
+            if not is_allowed_origin(headers):
+                await self.send_http_response(writer, 403, {'error': "origine refusée"})
+            elif path == '/ws' and headers.get('upgrade', '').lower() == 'websocket':
+                await self.serve_websocket(reader, writer, headers)
+            elif path == '/state' and method == 'GET':
+                await self.send_http_response(writer, 200, self.state_json)
+            elif path in ('/song', '/param') and method == 'POST':
+                try:
+                    content_length = int(headers.get('content-length', 0))
+                    if content_length < 0:
+                        raise ValueError(f"Content-Length négatif : {content_length}")
+                except ValueError as e:
+                    await self.send_http_response(writer, 400, {'error': f"en-tête invalide : {e}"})
+                    return
+                if content_length > API_MAX_REQUEST_BYTES:
+                    await self.send_http_response(writer, 413, {'error': f"corps de {content_length} octets (maximum {API_MAX_REQUEST_BYTES})"})
+                    return
+                body = await reader.readexactly(content_length)
+                try:
+                    request = json.loads(body or b'{}')
+                    request['type'] = path[1:]
+                    status, response = self.handle_request(request)
+                except (ValueError, TypeError) as e:
+                    status, response = 400, {'error': f"JSON invalide : {e}"}
+                await self.send_http_response(writer, status, response)
+            elif path in ('/', '/state', '/song', '/param'):
+                await self.send_http_response(writer, 405 if path != '/' else 200, API_HELP)
+            else:
+                await self.send_http_response(writer, 404, API_HELP)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except ValueError:
+            pass    # ligne d'en-tête plus longue que la limite du StreamReader (64 Kio) : connexion fermée
+        finally:
+            writer.close()
+
+    async def serve_websocket(self, reader, writer, headers):
+        accept = get_websocket_accept(headers.get('sec-websocket-key', ''))
+        writer.write(
+            "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode('ascii')
+        )
+        writer.write(encode_websocket_frame(self.state_json))
+        self.websockets.add(writer)
+        try:
+            while True:
+                try:
+                    opcode, payload = await read_websocket_frame(reader)
+                except ValueError:
+                    # trame trop grande : fermeture avec le code 1009 (RFC 6455 7.4.1), le reste n'est pas lu
+                    writer.write(encode_websocket_frame(struct.pack('!H', WS_CLOSE_MESSAGE_TOO_BIG), WS_OPCODE_CLOSE))
+                    await writer.drain()
+                    break
+                if opcode == WS_OPCODE_CLOSE:
+                    writer.write(encode_websocket_frame(b'', WS_OPCODE_CLOSE))
+                    break
+                if opcode == WS_OPCODE_PING:
+                    writer.write(encode_websocket_frame(payload, WS_OPCODE_PONG))
+                elif opcode == WS_OPCODE_TEXT:
+                    try:
+                        status, response = self.handle_request(json.loads(payload))
+                    except (ValueError, TypeError, AttributeError) as e:
+                        response = {'error': f"JSON invalide : {e}"}
+                    if 'error' in response:
+                        writer.write(encode_websocket_frame(json.dumps(response).encode('utf-8')))
+                await writer.drain()
+        finally:
+            self.websockets.discard(writer)
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.ready.set()
+        coalescer_task = asyncio.ensure_future(self.coalescer.run())
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            coalescer_task.cancel()
+
+    def start_in_thread(self):
+        """Lance le serveur dans un thread dédié et attend qu'il écoute. Retourne le port utilisé."""
+        def run():
+            try:
+                asyncio.run(self.serve())
+            except asyncio.CancelledError:
+                pass    # arrêt demandé par stop()
+            except Exception as e:
+                print(f"/!/ API de contrôle arrêtée : {e}")
+                self.ready.set()
+        threading.Thread(target=run, daemon=True).start()
+        self.ready.wait(5.0)
+        return self.port
+
+    def stop(self):
+        if self.loop is not None and self.server is not None:
+            self.loop.call_soon_threadsafe(self.server.close)
+
+
+# ==============================================================================
+# UNITARY TESTS
+# ==============================================================================
+
+def _coalescer_scenario(moves):
+    # mouvements (paramètre, valeur) reçus pendant un intervalle, retourne ce qui est transmis
+    pushed = []
+    coalescer = FaderCoalescer(lambda command, value: pushed.append((command, value)), 0.05)
+    for command, value in moves:
+        coalescer.set(command, value)
+    coalescer.flush()
+    return pushed
+
+def _http_scenario(raw_request, websocket_message=None):
+    # démarre le serveur sur un port libre, envoie une requête brute et retourne
+    # (première ligne de la réponse, événements transmis au contrôleur)
+    events = []
+    server = ControlApiServer(events.append, '127.0.0.1', 0, 1000)
+
+    async def scenario():
+        serve_task = asyncio.ensure_future(server.serve())
+        while not server.ready.is_set():
+            await asyncio.sleep(0.001)
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+        writer.write(raw_request)
+        status_line = (await reader.readline()).decode('ascii').strip()
+        if websocket_message is not None:
+            mask = b'\x01\x02\x03\x04'
+            masked = bytes(byte ^ mask[i & 3] for i, byte in enumerate(websocket_message))
+            writer.write(bytes((0x81, 0x80 | len(masked))) + mask + masked)
+            await writer.drain()
+        await asyncio.sleep(0.02)
+        writer.close()
+        await asyncio.sleep(0.01)
+        server.server.close()
+        serve_task.cancel()
+        return status_line
+
+    status_line = asyncio.run(scenario())
+    return status_line, events
+
+_WEBSOCKET_HANDSHAKE = (b"GET /ws HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                        b"Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\nSec-WebSocket-Version: 13\r\n\r\n")
+
+def _websocket_oversized_scenario(announced_length):
+    # annonce une trame de announced_length octets sans l'envoyer,
+    # retourne (opcode, code de fermeture) de la trame reçue après l'état initial
+    server = ControlApiServer(lambda event: None, '127.0.0.1', 0, 1000)
+
+    async def scenario():
+        serve_task = asyncio.ensure_future(server.serve())
+        while not server.ready.is_set():
+            await asyncio.sleep(0.001)
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+        writer.write(_WEBSOCKET_HANDSHAKE)
+        while (await reader.readline()) not in (b'\r\n', b''):
+            pass
+        await read_websocket_frame(reader)      # état initial
+        writer.write(bytes((0x81, 0x80 | 127)) + struct.pack('!Q', announced_length) + b'\x01\x02\x03\x04')
+        await writer.drain()
+        opcode, payload = await asyncio.wait_for(read_websocket_frame(reader), 1.0)
+        writer.close()
+        server.server.close()
+        serve_task.cancel()
+        return opcode, struct.unpack('!H', payload)[0]
+
+    return asyncio.run(scenario())
+
+def _post(path, body, headers=''):
+    return f"POST {path} HTTP/1.1\r\nHost: localhost\r\n{headers}Content-Length: {len(body)}\r\n\r\n{body}".encode('ascii')
+
+TEST_PLAN: test_utility.TestPlan = [
+    {
+        "chapter_title": "1: WebSocket",
+        "tests": [
+            {
+                "test_title": "Clé d'acceptation (exemple de la RFC 6455)",
+                "function_under_test": get_websocket_accept,
+                "expected_return": 's3pPLMBiTxaQ9kYGzzhZRbK+xOo=',
+                "function_arguments": ['dGhlIHNhbXBsZSBub25jZQ==']
+            },
+            {
+                "test_title": "Trame texte serveur",
+                "function_under_test": encode_websocket_frame,
+                "expected_return": b'\x81\x02{}',
+                "function_arguments": [b'{}']
+            },
+        ]
+    },
+    {
+        "chapter_title": "2: Regroupement des mouvements de fader",
+        "tests": [
+            {
+                "test_title": "Seule la dernière valeur de chaque paramètre est transmise",
+                "function_under_test": _coalescer_scenario,
+                "expected_return": [('chant_emilie/send/facade', '-3'), ('facade/level', '-20')],
+                "function_arguments": [[('chant_emilie/send/facade', str(v)) for v in range(-10, -2)] + [('facade/level', '-20')]]
+            },
+        ]
+    },
+    {
+        "chapter_title": "3: Requêtes HTTP et WebSocket sur localhost",
+        "tests": [
+            {
+                "test_title": "Changement de chanson par numéro banque:programme",
+                "function_under_test": _http_scenario,
+                "expected_return": ('HTTP/1.1 200 OK', [('pc', 2 * 128 + 4)]),
+                "function_arguments": [_post('/song', '{"pc": "2:5"}')]
+            },
+            {
+                "test_title": "Réglage d'un paramètre (regroupé puis transmis)",
+                "function_under_test": _http_scenario,
+                "expected_return": ('HTTP/1.1 200 OK', [('param', ('chant_emilie/send/facade', '-5'))]),
+                "function_arguments": [_post('/param', '{"command": "Chant_Emilie/send/Facade", "value": -5}')]
+            },
+            {
+                "test_title": "Page web d'un autre site",
+                "function_under_test": _http_scenario,
+                "expected_return": ('HTTP/1.1 403 Forbidden', []),
+                "function_arguments": [_post('/song', '{"action": "next_song"}', 'Origin: http://example.com\r\n')]
+            },
+            {
+                "test_title": "Content-Length invalide",
+                "function_under_test": _http_scenario,
+                "expected_return": ('HTTP/1.1 400 Bad Request', []),
+                "function_arguments": [b"POST /song HTTP/1.1\r\nHost: localhost\r\nContent-Length: abc\r\n\r\n"]
+            },
+            {
+                "test_title": "Corps de requête trop grand (annoncé, non envoyé)",
+                "function_under_test": _http_scenario,
+                "expected_return": ('HTTP/1.1 413 Payload Too Large', []),
+                "function_arguments": [b"POST /song HTTP/1.1\r\nHost: localhost\r\nContent-Length: 1000000000\r\n\r\n"]
+            },
+            {
+                "test_title": "Demande invalide",
+                "function_under_test": _http_scenario,
+                "expected_return": ('HTTP/1.1 400 Bad Request', []),
+                "function_arguments": [_post('/song', '{"chanson": 3}')]
+            },
+            {
+                "test_title": "Chanson demandée par WebSocket",
+                "function_under_test": _http_scenario,
+                "expected_return": ('HTTP/1.1 101 Switching Protocols', [('goto', 'septembre')]),
+                "function_arguments": [_WEBSOCKET_HANDSHAKE, b'{"type": "song", "query": "septembre"}']
+            },
+            {
+                "test_title": "Trame WebSocket de 2^40 octets annoncée : fermeture 1009",
+                "function_under_test": _websocket_oversized_scenario,
+                "expected_return": (WS_OPCODE_CLOSE, WS_CLOSE_MESSAGE_TOO_BIG),
+                "function_arguments": [1 << 40]
+            },
+        ]
+    },
+]
+
+def run_unitary_tests():
+    return (test_utility.run_test_plan(TEST_PLAN))
@@ -0,0 +1,367 @@
+# module: control_socket
+# Socket de contrôle Unix : le contrôleur en cours d'exécution sert de démon, un client léger lui envoie des commandes
+#   python control_socket.py [--socket CHEMIN] COMMANDE [ARGUMENTS...]
+import asyncio
+import concurrent.futures
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import midi_input
+import test_utility
+
+CONTROL_SOCKET_TIMEOUT_S = 30.0     # attente maximale d'une commande exécutée par le thread principal
+CONTROL_SOCKET_MAX_REQUEST_BYTES = 64 * 1024    # longueur maximale d'une ligne de demande
+
+# commandes exécutées par le thread principal du contrôleur (entre deux événements), leur sortie est renvoyée au client
+CONTROL_COMMANDS = {
+    'edit': "add|update|delete \"SECTION/CLE[ = VALEUR]\" [\"critère --query\" ...] : mise à jour massive des chansons",
+    'query': "\"SECTION/CLE[ = VALEUR]\" ... : chansons dont les commandes vérifient tous les critères",
+    'reload': ": relit pc_mapping.json et les fichiers chansons modifiés",
+    'stats': ": chanson courante, messages envoyés par port, latences",
+    'ports': ": ports MIDI disponibles",
+}
+SONG_COMMAND_HELP = "song banque:programme | programme | next_song | previous_song | revert | titre : changement de chanson"
+
+def get_control_socket_config(config):
+    """
+    Retourne la configuration du socket de contrôle ("control_socket" dans config.json) : {'path': ...}.
+    Un chemin vide désactive le socket.
+    """
+    return {'path': config.get('control_socket', {}).get('path', '')}
+
+def parse_song_argument(argument):
+    """
+    Argument de la commande 'song' -> événement du contrôleur : numéro de chanson ('5', '2:5'),
+    action (next_song, previous_song, revert) ou titre à rechercher.
+    """
+    if argument in midi_input.TRIGGER_ACTIONS:
+        return ('action', argument)
+    try:
+        return ('pc', midi_input.parse_program_key(argument) - 1)
+    except ValueError:
+        return ('goto', argument)
+
+def get_help():
+    return '\n'.join([SONG_COMMAND_HELP] + [f"{command} {description}" for command, description in CONTROL_COMMANDS.items()])
+
+class ControlSocketServer:
+    """
+    Ecoute sur un socket Unix dans sa propre boucle asyncio (thread dédié). Une demande par ligne, en JSON :
+    {"command": ..., "args": [...]}, une réponse par ligne : {"ok": ..., "output": ...}.
+    Comme l'API de contrôle, le serveur ne touche jamais à l'état du contrôleur : les changements de chanson
+    passent par push_event, les autres commandes par run_command(commande, arguments) qui les confie au thread
+    principal et retourne un concurrent.futures.Future du couple (succès, sortie). Sans réponse dans le délai,
+    le Future est annulé : le thread principal ne l'exécute pas s'il ne l'a pas encore commencé.
+    """
+
+    def __init__(self, push_event, run_command, path, timeout=CONTROL_SOCKET_TIMEOUT_S):
+        self.push_event = push_event
+        self.run_command = run_command
+        self.path = path
+        self.timeout = timeout
+        self.loop = None
+        self.server = None
+        self.stopped = None
+        self.thread = None
+        self.ready = threading.Event()
+
+    async def handle_request(self, request):
+        command = request.get('command')
+        args = [str(arg) for arg in request.get('args', [])]
+        if command == 'song':
+            if len(args) != 1:
+                return {'ok': False, 'output': SONG_COMMAND_HELP}
+            self.push_event(parse_song_argument(args[0]))
+            return {'ok': True, 'output': ''}
+        if command == 'help':
+            return {'ok': True, 'output': get_help()}
+        if command not in CONTROL_COMMANDS:
+            return {'ok': False, 'output': f"Commande '{command}' inconnue.\n{get_help()}"}
+        future = self.run_command(command, args)
+        try:
+            ok, output = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            if future.cancel():
+                return {'ok': False, 'output': f"Pas de réponse du contrôleur après {self.timeout:g} s : commande annulée."}
+            return {'ok': False, 'output': f"Pas de réponse du contrôleur après {self.timeout:g} s : "
+                                           f"commande en cours, son résultat ne sera pas transmis."}
+        return {'ok': ok, 'output': output}
+
+    async def read_request_line(self, reader):
+        """
+        Retourne la prochaine ligne de demande (b'' en fin de connexion), ou None si elle dépasse
+        CONTROL_SOCKET_MAX_REQUEST_BYTES : elle est alors lue jusqu'au bout et ignorée, la connexion reste utilisable.
+        """
+        too_long = False
+        while True:
+            try:
+                line = await reader.readuntil(b'\n')
+            except asyncio.IncompleteReadError as e:
+                line = e.partial        # fin de connexion, dernière demande sans saut de ligne
+            except asyncio.LimitOverrunError as e:
+                too_long = True
+                await reader.readexactly(e.consumed)
+                continue
+            return None if too_long else line
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                line = await self.read_request_line(reader)
+                if line is None:
+                    response = {'ok': False, 'output': f"Demande de plus de {CONTROL_SOCKET_MAX_REQUEST_BYTES} octets ignorée."}
+                elif len(line) == 0:
+                    break
+                else:
+                    try:
+                        response = await self.handle_request(json.loads(line))
+                    except (ValueError, AttributeError) as e:
+                        response = {'ok': False, 'output': f"Demande invalide : {e}"}
+                writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        # seul l'utilisateur du contrôleur peut le piloter : le socket est créé directement en 0600,
+        # il n'est jamais accessible aux autres, même entre sa création et la mise en écoute
+        previous_umask = os.umask(0o177)
+        try:
+            self.server = await asyncio.start_unix_server(self.handle_connection, path=self.path,
+                                                          limit=CONTROL_SOCKET_MAX_REQUEST_BYTES)
+        finally:
+            os.umask(previous_umask)
+        self.stopped = self.loop.create_future()
+        self.ready.set()
+        try:
+            await self.stopped
+        finally:
+            self.server.close()
+            await self.server.wait_closed()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def start_in_thread(self):
+        """
+        Lance l'écoute dans un thread dédié et attend qu'elle soit prête. Lève une Exception si un contrôleur
+        répond déjà sur ce socket ; un fichier de socket orphelin (contrôleur arrêté brutalement) est supprimé.
+        """
+        if not hasattr(socket, 'AF_UNIX'):
+            raise Exception("sockets Unix indisponibles sur ce système")
+        if os.path.exists(self.path):
+            if is_server_running(self.path):
+                raise Exception(f"un contrôleur est déjà à l'écoute sur '{self.path}'")
+            os.unlink(self.path)
+        def run():
+            try:
+                asyncio.run(self.serve())
+            except Exception as e:
+                print(f"/!/ Socket de contrôle arrêté : {e}")
+                self.ready.set()
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        self.ready.wait(5.0)
+        if self.stopped is None:
+            raise Exception(f"écoute sur '{self.path}' impossible")
+
+    def stop(self):
+        if self.loop is not None and self.stopped is not None:
+            self.loop.call_soon_threadsafe(lambda: self.stopped.done() or self.stopped.set_result(None))
+            # le fichier du socket est supprimé par la boucle : attendre qu'elle ait fini avant la fin du processus
+            self.thread.join(2.0)
+
+
+# ==============================================================================
+# CLIENT
+# ==============================================================================
+
+def is_server_running(path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(path)
+            return True
+        except OSError:
+            return False
+
+def send_command(path, command, args, timeout=CONTROL_SOCKET_TIMEOUT_S + 5):
+    """Envoie une commande au contrôleur et retourne sa réponse {'ok': ..., 'output': ...}."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(path)
+        client.sendall(json.dumps({'command': command, 'args': list(args)}).encode('utf-8') + b'\n')
+        response = b''
+        while not response.endswith(b'\n'):
+            data = client.recv(65536)
+            if len(data) == 0:
+                break
+            response += data
+    return json.loads(response)
+
+def get_default_socket_path(config_file='config.json'):
+    """Chemin du socket lu dans config.json (sans charger le reste du contrôleur), ou chaîne vide."""
+    try:
+        with open(config_file, 'r') as f:
+            return get_control_socket_config(json.load(f))['path']
+    except (OSError, ValueError):
+        return ''
+
+def run_client(argv):
+    """Client léger : une commande, sa réponse sur la sortie standard. Retourne le code de sortie."""
+    path = ''
+    if len(argv) >= 2 and argv[0] == '--socket':
+        path, argv = argv[1], argv[2:]
+    if len(path) == 0:
+        path = get_default_socket_path()
+    if len(argv) == 0 or len(path) == 0:
+        print("Usage : control_socket.py [--socket CHEMIN] COMMANDE [ARGUMENTS...] "
+              "(chemin par défaut : \"control_socket\" de config.json)")
+        print(get_help())
+        return 2
+    try:
+        response = send_command(path, argv[0], argv[1:])
+    except (OSError, ValueError) as e:
+        print(f"/!/ Contrôleur injoignable sur '{path}' : {e}")
+        return 1
+    if len(response['output']) > 0:
+        print(response['output'].rstrip('\n'))
+    return 0 if response['ok'] else 1
+
+
+# ==============================================================================
+# UNITARY TESTS
+# ==============================================================================
+
+def _socket_scenario(requests):
+    # démarre un serveur sur un socket temporaire, envoie les demandes et retourne (réponses, événements reçus)
+    events = []
+    def run_command(command, args):
+        future = concurrent.futures.Future()
+        future.set_result((True, f"{command} {' '.join(args)}"))
+        return future
+    with tempfile.TemporaryDirectory() as directory:
+        server = ControlSocketServer(events.append, run_command, os.path.join(directory, 'test.sock'))
+        server.start_in_thread()
+        try:
+            responses = [send_command(server.path, command, args, 5.0) for command, args in requests]
+        finally:
+            server.stop()
+    return responses, events
+
+def _timeout_scenario():
+    # le thread principal ne traite pas la commande à temps : le client reçoit une erreur, la commande est annulée
+    # et le thread principal ne l'exécutera pas (cf. MidiShowController.execute_socket_command)
+    future = concurrent.futures.Future()
+    with tempfile.TemporaryDirectory() as directory:
+        server = ControlSocketServer(lambda event: None, lambda command, args: future, os.path.join(directory, 'test.sock'), 0.05)
+        server.start_in_thread()
+        try:
+            response = send_command(server.path, 'stats', [], 5.0)
+        finally:
+            server.stop()
+    return response['ok'], future.set_running_or_notify_cancel()
+
+def _same_connection_scenario(lines):
+    # envoie plusieurs lignes brutes sur une seule connexion et retourne les réponses
+    def run_command(command, args):
+        future = concurrent.futures.Future()
+        future.set_result((True, f"{command} {' '.join(args)}"))
+        return future
+    with tempfile.TemporaryDirectory() as directory:
+        server = ControlSocketServer(lambda event: None, run_command, os.path.join(directory, 'test.sock'))
+        server.start_in_thread()
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                client.settimeout(5.0)
+                client.connect(server.path)
+                client.sendall(b''.join(lines))
+                response = b''
+                while response.count(b'\n') < len(lines):
+                    data = client.recv(65536)
+                    if len(data) == 0:
+                        break
+                    response += data
+        finally:
+            server.stop()
+    return [json.loads(line) for line in response.splitlines()]
+
+def _socket_mode():
+    with tempfile.TemporaryDirectory() as directory:
+        server = ControlSocketServer(lambda event: None, lambda command, args: None, os.path.join(directory, 'test.sock'))
+        server.start_in_thread()
+        try:
+            return os.stat(server.path).st_mode & 0o777
+        finally:
+            server.stop()
+
+TEST_PLAN: test_utility.TestPlan = [
+    {
+        "chapter_title": "1: Commande 'song'",
+        "tests": [
+            {
+                "test_title": "Banque et programme",
+                "function_under_test": parse_song_argument,
+                "expected_return": ('pc', 132),
+                "function_arguments": ["1:5"]
+            },
+            {
+                "test_title": "Action",
+                "function_under_test": parse_song_argument,
+                "expected_return": ('action', 'next_song'),
+                "function_arguments": ["next_song"]
+            },
+            {
+                "test_title": "Titre",
+                "function_under_test": parse_song_argument,
+                "expected_return": ('goto', 'septembre'),
+                "function_arguments": ["septembre"]
+            },
+        ]
+    },
+    {
+        "chapter_title": "2: Echanges sur le socket Unix",
+        "tests": [
+            {
+                "test_title": "Changement de chanson, commande du thread principal, commande inconnue",
+                "function_under_test": _socket_scenario,
+                "expected_return": (
+                    [{'ok': True, 'output': ''}, {'ok': True, 'output': 'query PEDALS/alain_mfx'},
+                     {'ok': False, 'output': f"Commande 'play' inconnue.\n{get_help()}"}],
+                    [('pc', 4)],
+                ),
+                "function_arguments": [[('song', ['5']), ('query', ['PEDALS/alain_mfx']), ('play', [])]]
+            },
+            {
+                "test_title": "Demande plus longue que la limite : refusée, la suivante est traitée",
+                "function_under_test": _same_connection_scenario,
+                "expected_return": [{'ok': False, 'output': f"Demande de plus de {CONTROL_SOCKET_MAX_REQUEST_BYTES} octets ignorée."},
+                                    {'ok': True, 'output': 'stats '}],
+                "function_arguments": [[b'{"command": "query", "args": ["' + b'x' * (4 * CONTROL_SOCKET_MAX_REQUEST_BYTES) + b'"]}\n',
+                                        b'{"command": "stats"}\n']]
+            },
+            {
+                "test_title": "Socket accessible au seul utilisateur du contrôleur",
+                "function_under_test": _socket_mode,
+                "expected_return": 0o600,
+                "function_arguments": []
+            },
+            {
+                "test_title": "Commande sans réponse dans le délai : annulée",
+                "function_under_test": _timeout_scenario,
+                "expected_return": (False, False),
+                "function_arguments": []
+            },
+        ]
+    },
+]
+
+def run_unitary_tests():
+    return (test_utility.run_test_plan(TEST_PLAN))
+
+if __name__ == '__main__':
+    sys.exit(run_client(sys.argv[1:]))
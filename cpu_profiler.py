@@ -0,0 +1,167 @@
+# module: cpu_profiler
+# Modes --profile (cProfile par changement de chanson) et --sample-stacks (échantillonnage pour flamegraphs)
+import cProfile
+import io
+import os
+import pstats
+import signal
+import sys
+import time
+import test_utility
+
+PROFILE_TOP_COUNT = 15          # fonctions affichées par changement de chanson
+SAMPLING_INTERVAL_S = 0.005     # période d'échantillonnage des piles (temps CPU du processus)
+
+class SongChangeProfiler:
+    """Exécute chaque changement de chanson sous cProfile et affiche les fonctions les plus coûteuses (temps cumulé)."""
+
+    def __init__(self, top_count=PROFILE_TOP_COUNT, stream=None):
+        self.top_count = top_count
+        self.stream = stream
+
+    def start(self):
+        print(f"- Profilage actif : {self.top_count} fonctions les plus coûteuses affichées à chaque changement de chanson")
+
+    def run(self, description, function, *args):
+        """Appelle function(*args) sous cProfile, affiche le bilan et retourne le résultat de function."""
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            return profile.runcall(function, *args)
+        finally:
+            stream = self.stream if self.stream is not None else sys.stdout
+            print(f"[profil] {description} : {(time.perf_counter() - start) * 1000:.2f} ms (sous cProfile)", file=stream)
+            stats = pstats.Stats(profile, stream=stream)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top_count)
+
+def describe_code(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+def format_collapsed_stacks(stack_counts):
+    """
+    {(code le plus profond, ..., code racine): nombre d'échantillons} -> lignes au format "piles repliées"
+    de flamegraph.pl / speedscope : "racine;...;feuille nombre".
+    """
+    lines = []
+    for stack, count in stack_counts.items():
+        lines.append(f"{';'.join(describe_code(code) for code in reversed(stack))} {count}")
+    return sorted(lines)
+
+class StackSampler:
+    """
+    Echantillonneur de piles par signal : SIGPROF est émis toutes les interval_s secondes de temps CPU
+    et le handler relève la pile du thread principal (celui qui exécute les changements de chanson).
+    Le handler ne fait que remonter les frames et incrémenter un compteur par pile (objets code, sans
+    formatage) : le coût reste négligeable sur une répétition entière. Les piles sont écrites à l'arrêt.
+    setitimer n'existe pas sous Windows : l'échantillonnage y est indisponible.
+    """
+
+    def __init__(self, output_path, interval_s=SAMPLING_INTERVAL_S):
+        self.output_path = output_path
+        self.interval_s = interval_s
+        self.stack_counts = {}
+        self.sample_count = 0
+        self.previous_handler = None
+        self.running = False
+
+    def sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        stack = tuple(stack)
+        self.stack_counts[stack] = self.stack_counts.get(stack, 0) + 1
+        self.sample_count += 1
+
+    def start(self):
+        if not hasattr(signal, 'setitimer'):
+            print("/!/ Echantillonnage des piles indisponible sur ce système (pas de setitimer).")
+            return False
+        self.previous_handler = signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval_s, self.interval_s)
+        self.running = True
+        print(f"- Echantillonnage des piles toutes les {self.interval_s * 1000:g} ms CPU, écrites dans '{self.output_path}' à l'arrêt")
+        return True
+
+    def stop(self):
+        if not self.running:
+            return
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self.previous_handler)
+        self.running = False
+        try:
+            with open(self.output_path, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(format_collapsed_stacks(self.stack_counts)) + '\n')
+            print(f"- {self.sample_count} échantillons de piles écrits dans '{self.output_path}'")
+        except OSError as e:
+            print(f"/!/ Ecriture des piles dans '{self.output_path}' impossible : {e}")
+
+
+# ==============================================================================
+# UNITARY TESTS
+# ==============================================================================
+
+def _sum_of_squares(count):
+    return sum(i * i for i in range(count))
+
+def _busy_loop(duration_s):
+    # consomme du temps CPU (ITIMER_PROF ne compte pas le temps passé à dormir)
+    end = time.process_time() + duration_s
+    while time.process_time() < end:
+        _sum_of_squares(100)
+
+def _cprofile_scenario(count):
+    stream = io.StringIO()
+    result = SongChangeProfiler(5, stream).run("test", _sum_of_squares, count)
+    return result, '_sum_of_squares' in stream.getvalue()
+
+def _collapse_scenario():
+    return format_collapsed_stacks({
+        (_sum_of_squares.__code__, _busy_loop.__code__): 3,
+        (_busy_loop.__code__,): 1,
+    })
+
+def _sampling_scenario(duration_s):
+    if not hasattr(signal, 'setitimer'):
+        return True     # Windows : échantillonnage indisponible, rien à vérifier
+    sampler = StackSampler(os.devnull, 0.001)
+    sampler.start()
+    _busy_loop(duration_s)
+    sampler.stop()
+    # au moins un échantillon a été pris dans la boucle de calcul
+    return any(describe_code(_busy_loop.__code__) in line for line in format_collapsed_stacks(sampler.stack_counts))
+
+TEST_PLAN: test_utility.TestPlan = [
+    {
+        "chapter_title": "1: cProfile par changement de chanson",
+        "tests": [
+            {
+                "test_title": "Résultat transmis et fonction présente dans le bilan",
+                "function_under_test": _cprofile_scenario,
+                "expected_return": (328350, True),
+                "function_arguments": [100]
+            },
+        ]
+    },
+    {
+        "chapter_title": "2: Piles repliées (flamegraph)",
+        "tests": [
+            {
+                "test_title": "Racine en premier, nombre d'échantillons en fin de ligne",
+                "function_under_test": _collapse_scenario,
+                "expected_return": ['cpu_profiler.py:_busy_loop 1',
+                                    'cpu_profiler.py:_busy_loop;cpu_profiler.py:_sum_of_squares 3'],
+                "function_arguments": []
+            },
+            {
+                "test_title": "Echantillonnage par SIGPROF",
+                "function_under_test": _sampling_scenario,
+                "expected_return": True,
+                "function_arguments": [0.1]
+            },
+        ]
+    },
+]
+
+def run_unitary_tests():
+    return (test_utility.run_test_plan(TEST_PLAN))
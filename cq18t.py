@@ -1,5 +1,6 @@
 # cq18t.py library
 import re
+import numpy as np
 import utilities
 import test_utility
 
@@ -397,22 +398,84 @@ def get_pan_vcvf(pan):
     return vcvf_14
 
 
+# ==============================================================================
+# DECODAGE DES VALEURS (VCVF -> dB / PAN)
+# ==============================================================================
+
+# Tables inverses des tables VAL14 : une entrée par code 14 bits (16384), calculées une seule fois
+# par interpolation vectorisée. Décoder une valeur reçue de la table revient à une indexation.
+VCVF_CODE_COUNT = 1 << 14
+
+table_fader_db = None
+table_pan_percent = None
+
+def build_inverse_table(table_val14, below_value=None):
+    """
+    Retourne un tableau float32 {code 14 bits linéaire: valeur} inverse de la table table_val14.
+    Les codes au-delà du dernier point prennent sa valeur ; ceux en deçà du premier prennent below_value si donné.
+    """
+    table_hex = compute_table_val14_to_hex(table_val14)
+    codes = np.array([val16 for _, val16 in table_hex], dtype=np.float64)
+    values = np.array([dec_value for dec_value, _ in table_hex], dtype=np.float64)
+    inverse = np.interp(np.arange(VCVF_CODE_COUNT), codes, values).astype(np.float32)
+    if below_value is not None:
+        inverse[:int(codes[0])] = below_value
+    return inverse
+
+def get_fader_db(vcvf_14):
+    """Valeur de fader codée sur 2x7 bits (cf. get_fader_vcvf) -> dB. -inf en dessous du premier point de la table."""
+    global table_fader_db
+    if table_fader_db is None:
+        table_fader_db = build_inverse_table(TABLE_VCVF_FADER_VAL14, float('-inf'))
+    return float(table_fader_db[convert_14bits_to_hex(vcvf_14)])
+
+def get_pan_percent(vcvf_14):
+    """Valeur de pan codée sur 2x7 bits (cf. get_pan_vcvf) -> pourcentage, de -100 (gauche) à 100 (droite)."""
+    global table_pan_percent
+    if table_pan_percent is None:
+        table_pan_percent = build_inverse_table(TABLE_VCVF_PAN_VAL14)
+    return float(table_pan_percent[convert_14bits_to_hex(vcvf_14)])
+
+def format_pan(percent):
+    """Pourcentage de pan -> texte au format des fichiers chansons ('left 30%', 'center', 'right 5%')."""
+    percent = int(round(percent))
+    if percent == 0:
+        return 'center'
+    return f"{'left' if percent < 0 else 'right'} {abs(percent)}%"
+
+def describe_vcvf_value(action, vcvf_14):
+    """Texte lisible d'une valeur NRPN selon l'action du paramètre (cf. build_nrpn_name_table)."""
+    if action in ('send', 'level'):
+        value_db = get_fader_db(vcvf_14)
+        return '-inf' if value_db == float('-inf') else f"{value_db:+.1f} dB"
+    if action == 'pan':
+        return format_pan(get_pan_percent(vcvf_14))
+    if action == 'mute':
+        return 'ON' if vcvf_14 & 0x7F else 'OFF'
+    return utilities.dec_to_aligned_hex(vcvf_14)
+
+
 # ==============================================================================
 # BUILD MIDI MESSAGES FOR CQ18T
 # ==============================================================================
 
+CQ_SCENE_COUNT = 128    # scènes 1 à 128, rappelées par Program Change (scène - 1)
+
+def is_valid_scene(scene_id):
+    return 1 <= scene_id <= CQ_SCENE_COUNT
+
 def cq_get_midi_msg_set_scene(midi_channel, scene_id):
     channel = midi_channel -1
-    msg = [ 0xB0 | channel, 0x00, 0x00 , 0xC0 | channel , scene_id - 1]
+    msg = bytes(( 0xB0 | channel, 0x00, 0x00 , 0xC0 | channel , scene_id - 1))
     return msg
 
 def cq_get_midi_msg_press_softkey(midi_channel, softkey_canonical_name):
     channel = midi_channel -1
     softkey_code = get_softkey_midicode_by_name(softkey_canonical_name)
     if softkey_code == CQ_HEXVALUE_ERROR:
-        return []
+        return b''
         
-    msg = [ 0x90 | channel, softkey_code, 0x7F , 0x80 | channel , softkey_code, 0x00]
+    msg = bytes(( 0x90 | channel, softkey_code, 0x7F , 0x80 | channel , softkey_code, 0x00))
     return msg
     
 def cq_get_midi_msg_set_fader_to_bus(midi_channel, in_canonical_name, bus_canonical_name, value_db):
@@ -420,7 +483,7 @@ def cq_get_midi_msg_set_fader_to_bus(midi_channel, in_canonical_name, bus_canoni
 
     fader_vcvf_14 = get_fader_to_bus_vcvf(in_canonical_name, bus_canonical_name)
     if fader_vcvf_14 == CQ_HEXVALUE_ERROR:
-        return []
+        return b''
 
     fader_msb = (fader_vcvf_14 & 0x7F00) >> 8
     fader_lsb = fader_vcvf_14 & 0x007F
@@ -430,11 +493,11 @@ def cq_get_midi_msg_set_fader_to_bus(midi_channel, in_canonical_name, bus_canoni
     value_lsb = value_vcvf_14 & 0x007F
 
 
-    msg = [ 0xB0 | channel, 0x63, fader_msb, 
+    msg = bytes(( 0xB0 | channel, 0x63, fader_msb, 
             0xB0 | channel, 0x62, fader_lsb, 
             0xB0 | channel, 0x06, value_msb, 
             0xB0 | channel, 0x26, value_lsb
-          ]
+          ))
           
 #    print(f"DEBUG cq_get_midi_msg_set_fader_to_bus: msg = {msg}")
     
@@ -445,7 +508,7 @@ def cq_get_midi_msg_set_pan_to_bus(midi_channel, in_canonical_name, bus_canonica
     
     pan_vcvf_14 = get_pan_to_bus_vcvf(in_canonical_name, bus_canonical_name)
     if pan_vcvf_14 == CQ_HEXVALUE_ERROR:
-        return []
+        return b''
 
     pan_msb = (pan_vcvf_14 & 0x7F00) >> 8
     pan_lsb = pan_vcvf_14 & 0x007F
@@ -455,13 +518,13 @@ def cq_get_midi_msg_set_pan_to_bus(midi_channel, in_canonical_name, bus_canonica
     value_lsb = value_vcvf_14 & 0x007F
 
     if pan_vcvf_14 == 0x0000:
-        return []
+        return b''
 
-    msg = [ 0xB0 | channel, 0x63, pan_msb, 
+    msg = bytes(( 0xB0 | channel, 0x63, pan_msb, 
             0xB0 | channel, 0x62, pan_lsb, 
             0xB0 | channel, 0x06, value_msb, 
             0xB0 | channel, 0x26, value_lsb
-          ]
+          ))
     return msg
 
 def cq_get_midi_msg_set_bus_fader(midi_channel, bus_canonical_name, value_db):
@@ -469,7 +532,7 @@ def cq_get_midi_msg_set_bus_fader(midi_channel, bus_canonical_name, value_db):
 
     fader_vcvf_14 = get_bus_fader_vcvf(bus_canonical_name)
     if fader_vcvf_14 == CQ_HEXVALUE_ERROR:
-        return []
+        return b''
 
     fader_msb = (fader_vcvf_14 & 0x7F00) >> 8
     fader_lsb = fader_vcvf_14 & 0x007F
@@ -479,11 +542,11 @@ def cq_get_midi_msg_set_bus_fader(midi_channel, bus_canonical_name, value_db):
     value_lsb = value_vcvf_14 & 0x007F
 
 
-    msg = [ 0xB0 | channel, 0x63, fader_msb, 
+    msg = bytes(( 0xB0 | channel, 0x63, fader_msb, 
             0xB0 | channel, 0x62, fader_lsb, 
             0xB0 | channel, 0x06, value_msb, 
             0xB0 | channel, 0x26, value_lsb
-          ]
+          ))
     return msg
 
 def cq_get_midi_msg_set_mute_channel(midi_channel, channel_canonical_name, mute_on):
@@ -491,7 +554,7 @@ def cq_get_midi_msg_set_mute_channel(midi_channel, channel_canonical_name, mute_
 
     mute_vcvf_14 = get_channel_mute_vcvf(channel_canonical_name)
     if mute_vcvf_14 == CQ_HEXVALUE_ERROR:
-        return []
+        return b''
 
     mute_msb = (mute_vcvf_14 & 0x7F00) >> 8
     mute_lsb = mute_vcvf_14 & 0x007F
@@ -500,16 +563,106 @@ def cq_get_midi_msg_set_mute_channel(midi_channel, channel_canonical_name, mute_
     if mute_on:
         mute_val = 0x01
     
-    msg = [ 0xB0 | channel, 0x63, mute_msb, 
+    msg = bytes(( 0xB0 | channel, 0x63, mute_msb, 
             0xB0 | channel, 0x62, mute_lsb, 
             0xB0 | channel, 0x06, 0x00, 
             0xB0 | channel, 0x26, mute_val
-          ]
+          ))
     return msg
 
 def cq_get_midi_tap_tempo(midi_channel, softkey_canonical_name):
     return cq_get_midi_msg_press_softkey(midi_channel, softkey_canonical_name)
 
+def cq_get_nrpn_from_midi_msg(midi_msg):
+    """
+    Retourne (paramètre, valeur), codés sur 2x7 bits, d'un message NRPN complet
+    tel que construit par les fonctions cq_get_midi_msg_set_xxx (CC 99/98/6/38).
+    Retourne None si le message n'a pas ce format.
+    """
+    if len(midi_msg) != 12:
+        return None
+    if (midi_msg[1], midi_msg[4], midi_msg[7], midi_msg[10]) != (0x63, 0x62, 0x06, 0x26):
+        return None
+
+    param_14 = (midi_msg[2] << 8) | midi_msg[5]
+    value_14 = (midi_msg[8] << 8) | midi_msg[11]
+    return param_14, value_14
+
+
+# ==============================================================================
+# DECODAGE DU FLUX NRPN EMIS PAR LA CQ18T
+# ==============================================================================
+
+CQ_FADER_BUSES = ['MAIN', 'OUT1', 'OUT2', 'OUT3', 'OUT4', 'OUT5', 'OUT6', 'FX1', 'FX2', 'FX3', 'FX4']
+CQ_PAN_BUSES = ['MAIN', 'OUT1', 'OUT2', 'OUT3', 'OUT4', 'OUT5', 'OUT6']
+
+def build_nrpn_name_table(preferred_names=()):
+    """
+    Construit la table inverse {paramètre 14 bits: (action, canal, bus)} à partir des tables
+    de la CQ18T, avec action parmi 'send', 'pan', 'level', 'mute' (bus vaut '' si non applicable).
+    Plusieurs noms partagent parfois le même paramètre (IN1 et ST1/2 par exemple) :
+    les noms de preferred_names (typiquement les clés de "channel_names") sont alors retenus.
+    """
+    table = {}
+
+    def add_entry(param_14, entry, name):
+        if param_14 == CQ_HEXVALUE_ERROR:
+            return
+        if param_14 not in table or name in preferred_names:
+            table[param_14] = entry
+
+    for name in CQ_MUTE_CHANNELS_MAP:
+        add_entry(get_channel_mute_vcvf(name), ('mute', name, ''), name)
+    for name in CQ_BUS_FADER_MAP:
+        add_entry(get_bus_fader_vcvf(name), ('level', name, ''), name)
+    for name in CQ_FADER_TO_MAIN_MAP:
+        for bus in CQ_FADER_BUSES:
+            add_entry(get_fader_to_bus_vcvf(name, bus), ('send', name, bus), name)
+    for name in CQ_PAN_TO_MAIN_MAP:
+        for bus in CQ_PAN_BUSES:
+            add_entry(get_pan_to_bus_vcvf(name, bus), ('pan', name, bus), name)
+
+    return table
+
+class NrpnStreamDecoder:
+    """
+    Décodeur en flux des NRPN reçus de la CQ18T (CC 99, 98, 6 puis 38).
+    L'état est de taille fixe (4 valeurs par canal MIDI) : un balayage continu de fader
+    ne fait grandir aucune file, seule la dernière valeur reçue est conservée.
+    """
+
+    def __init__(self):
+        self.param_msb = [0] * 16
+        self.param_lsb = [0] * 16
+        self.value_msb = [0] * 16
+        self.param_ready = [False] * 16
+
+    def feed(self, midi_data):
+        """
+        Traite un message MIDI reçu. Retourne (canal 1-16, paramètre 14 bits, valeur 14 bits)
+        quand un NRPN est complet (réception du CC 38), None sinon.
+        """
+        if len(midi_data) != 3 or (midi_data[0] & 0xF0) != 0xB0:
+            return None
+
+        channel = midi_data[0] & 0x0F
+        cc_number = midi_data[1]
+        cc_value = midi_data[2]
+
+        if cc_number == 0x63:
+            self.param_msb[channel] = cc_value
+            self.param_ready[channel] = False
+        elif cc_number == 0x62:
+            self.param_lsb[channel] = cc_value
+            self.param_ready[channel] = True
+        elif cc_number == 0x06:
+            self.value_msb[channel] = cc_value
+        elif cc_number == 0x26 and self.param_ready[channel]:
+            param_14 = (self.param_msb[channel] << 8) | self.param_lsb[channel]
+            value_14 = (self.value_msb[channel] << 8) | cc_value
+            return channel + 1, param_14, value_14
+        return None
+
 
 
 
@@ -517,6 +670,37 @@ def cq_get_midi_tap_tempo(midi_channel, softkey_canonical_name):
 # UNITARY TESTS
 # ==============================================================================
 
+def _nrpn_name(param_14, preferred_names):
+    return build_nrpn_name_table(preferred_names).get(param_14)
+
+def _fader_round_trip_errors():
+    # tous les codes entre le premier et le dernier point de la table : décoder puis réencoder redonne le code
+    table_hex = compute_table_val14_to_hex(TABLE_VCVF_FADER_VAL14)
+    errors = 0
+    for code in range(table_hex[0][1], table_hex[-1][1] + 1):
+        vcvf_14 = convert_hex_to_14bits(code)
+        if get_fader_vcvf(get_fader_db(vcvf_14)) != vcvf_14:
+            errors += 1
+    return errors
+
+def _pan_round_trip_within_quantization():
+    # tous les pourcentages entiers : encoder puis décoder redonne le pourcentage à un demi-pas de code près
+    # (le pas le plus grand de la table vaut 0,023 %), à la précision float32 de la table inverse près
+    table_hex = compute_table_val14_to_hex(TABLE_VCVF_PAN_VAL14)
+    half_step = max((high[0] - low[0]) / (high[1] - low[1]) for low, high in zip(table_hex, table_hex[1:]) if high[1] > low[1]) / 2
+    max_error = max(abs(get_pan_percent(get_pan_vcvf(format_pan(percent))) - percent) for percent in range(-100, 101))
+    return max_error <= half_step + 1e-5
+
+def _decode_stream(midi_bytes):
+    # découpe le flux en messages de 3 octets et retourne les NRPN décodés
+    decoder = NrpnStreamDecoder()
+    decoded = []
+    for i in range(0, len(midi_bytes), 3):
+        nrpn = decoder.feed(midi_bytes[i:i + 3])
+        if nrpn is not None:
+            decoded.append(nrpn)
+    return decoded
+
 TEST_PLAN: test_utility.TestPlan = [
     {
         "chapter_title": "1: Test des fonctions de conversion",
@@ -751,6 +935,47 @@ TEST_PLAN: test_utility.TestPlan = [
             },
         ]
     },
+    {
+        "chapter_title": "Chapitre 2.8: Décodage des valeurs (tables inverses VCVF -> dB / pan)",
+        "tests": [
+            {
+                "test_title": "Fader 0dB",
+                "function_under_test": get_fader_db,
+                "expected_return": 0.0,
+                "function_arguments": [0x6200]
+            },
+            {
+                "test_title": "Fader Off",
+                "function_under_test": get_fader_db,
+                "expected_return": float('-inf'),
+                "function_arguments": [0x0000]
+            },
+            {
+                "test_title": "Fader -6dB affiché",
+                "function_under_test": describe_vcvf_value,
+                "expected_return": '-6.0 dB',
+                "function_arguments": ['send', 0x4B00]
+            },
+            {
+                "test_title": "Pan left 30% affiché",
+                "function_under_test": describe_vcvf_value,
+                "expected_return": 'left 30%',
+                "function_arguments": ['pan', 0x2C65]
+            },
+            {
+                "test_title": "Aller-retour de tous les codes de fader de la table",
+                "function_under_test": _fader_round_trip_errors,
+                "expected_return": 0,
+                "function_arguments": []
+            },
+            {
+                "test_title": "Aller-retour de tous les pans entiers (écart maximal : un demi-pas de code)",
+                "function_under_test": _pan_round_trip_within_quantization,
+                "expected_return": True,
+                "function_arguments": []
+            },
+        ]
+    },
 
     {
         "chapter_title": "Chapitre 3.1: Construction des messages MIDI - Gestion des Scènes",
@@ -758,7 +983,7 @@ TEST_PLAN: test_utility.TestPlan = [
             {
                 "test_title": "Message MIDI de sélection de scène",
                 "function_under_test": cq_get_midi_msg_set_scene,
-                "expected_return": [0xB0, 0x00, 0x00, 0xC0, 0x0B],
+                "expected_return": bytes([0xB0, 0x00, 0x00, 0xC0, 0x0B]),
                 "function_arguments": [1, 12]
             },
         ]
@@ -769,13 +994,13 @@ TEST_PLAN: test_utility.TestPlan = [
             {
                 "test_title": "Message MIDI d'activation de Soft Key",
                 "function_under_test": cq_get_midi_msg_press_softkey,
-                "expected_return": [0x90, 0x31, 0x7F, 0x80, 0x31, 0x00],
+                "expected_return": bytes([0x90, 0x31, 0x7F, 0x80, 0x31, 0x00]),
                 "function_arguments": [1, 'Soft Key #2']
             },
             {
                 "test_title": "Message MIDI d'activation de Soft Key qui n'existe pas",
                 "function_under_test": cq_get_midi_msg_press_softkey,
-                "expected_return": [],
+                "expected_return": b'',
                 "function_arguments": [1, 'Soft Key #4']
             },
         ]
@@ -789,11 +1014,89 @@ TEST_PLAN: test_utility.TestPlan = [
             {
                 "test_title": "Fader IN3 à -6dB to Bus Main",
                 "function_under_test": cq_get_midi_msg_set_fader_to_bus,
-                "expected_return": [0xB0, 0x63, 0x40, 0xB0, 0x62, 0x02, 0xB0, 0x06, 0x4B, 0xB0, 0x26, 0x00],
+                "expected_return": bytes([0xB0, 0x63, 0x40, 0xB0, 0x62, 0x02, 0xB0, 0x06, 0x4B, 0xB0, 0x26, 0x00]),
                 "function_arguments": [1, 'IN3', 'MAIN', -6]
             },
         ]
     },
+    {
+        "chapter_title": "Chapitre 3.5: Décodage des messages NRPN construits",
+        "tests": [
+            {
+                "test_title": "Paramètre et valeur d'un message Fader IN3 à -6dB to Bus Main",
+                "function_under_test": cq_get_nrpn_from_midi_msg,
+                "expected_return": (0x4002, 0x4B00),
+                "function_arguments": [[0xB0, 0x63, 0x40, 0xB0, 0x62, 0x02, 0xB0, 0x06, 0x4B, 0xB0, 0x26, 0x00]]
+            },
+            {
+                "test_title": "Nom du paramètre NRPN Fader IN13 to Bus OUT4",
+                "function_under_test": _nrpn_name,
+                "expected_return": ('send', 'IN13', 'OUT4'),
+                "function_arguments": [0x4157, ()]
+            },
+            {
+                "test_title": "Nom du paramètre NRPN partagé, nom préféré retenu",
+                "function_under_test": _nrpn_name,
+                "expected_return": ('send', 'ST9/10', 'MAIN'),
+                "function_arguments": [0x4008, ('ST9/10',)]
+            },
+            {
+                "test_title": "Décodage en flux d'un NRPN (Fader IN3 à -6dB to Bus Main, canal 2)",
+                "function_under_test": _decode_stream,
+                "expected_return": [(2, 0x4002, 0x4B00)],
+                "function_arguments": [[0xB1, 0x63, 0x40, 0xB1, 0x62, 0x02, 0xB1, 0x06, 0x4B, 0xB1, 0x26, 0x00]]
+            },
+            {
+                "test_title": "Décodage d'un balayage de fader (CC 6/38 répétés sans nouvelle adresse)",
+                "function_under_test": _decode_stream,
+                "expected_return": [(1, 0x4002, 0x4B00), (1, 0x4002, 0x4C10)],
+                "function_arguments": [[0xB0, 0x63, 0x40, 0xB0, 0x62, 0x02, 0xB0, 0x06, 0x4B, 0xB0, 0x26, 0x00,
+                                        0xB0, 0x06, 0x4C, 0xB0, 0x26, 0x10]]
+            },
+            {
+                "test_title": "CC 38 sans adresse NRPN ignoré",
+                "function_under_test": _decode_stream,
+                "expected_return": [],
+                "function_arguments": [[0xB0, 0x06, 0x4B, 0xB0, 0x26, 0x00]]
+            },
+            {
+                "test_title": "Message de scène non décodé comme NRPN",
+                "function_under_test": cq_get_nrpn_from_midi_msg,
+                "expected_return": None,
+                "function_arguments": [[0xB0, 0x00, 0x00, 0xC0, 0x0B]]
+            },
+        ]
+    },
+    {
+        # médiane sur plusieurs centaines d'appels : seuils larges (machine chargée, chapitres en parallèle)
+        "chapter_title": "Chapitre 4: Performances des conversions et des constructions de messages",
+        "tests": [
+            {
+                "test_title": "Valeur de fader interpolée",
+                "function_under_test": get_fader_vcvf,
+                "expected_return": 0x0E0D,
+                "function_arguments": [-42],
+                "iterations": 500,
+                "max_duration_us": 50
+            },
+            {
+                "test_title": "Message fader IN3 à -6dB to Bus Main",
+                "function_under_test": cq_get_midi_msg_set_fader_to_bus,
+                "expected_return": bytes([0xB0, 0x63, 0x40, 0xB0, 0x62, 0x02, 0xB0, 0x06, 0x4B, 0xB0, 0x26, 0x00]),
+                "function_arguments": [1, 'IN3', 'MAIN', -6],
+                "iterations": 500,
+                "max_duration_us": 100
+            },
+            {
+                "test_title": "Décodage d'une valeur de fader (table inverse)",
+                "function_under_test": get_fader_db,
+                "expected_return": -6.0,
+                "function_arguments": [0x4B00],
+                "iterations": 500,
+                "max_duration_us": 20
+            },
+        ]
+    },
 
 ]
 
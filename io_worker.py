@@ -0,0 +1,348 @@
+# module: io_worker
+# Processus d'E/S MIDI optionnel : les ports de sortie rtmidi vivent dans un processus minimal
+# qui lit des messages déjà encodés dans un buffer circulaire en mémoire partagée
+import multiprocessing
+import platform
+import struct
+import time
+from multiprocessing import shared_memory
+import metrics
+import realtime
+import test_utility
+
+# En-tête du segment partagé : entiers 64 bits, chacun écrit par un seul des deux processus
+# (le producteur écrit WRITE_INDEX, le worker tout le reste) : aucun verrou n'est nécessaire.
+HEADER_WRITE_INDEX = 0      # octets écrits depuis le début (producteur)
+HEADER_READ_INDEX = 1       # octets lus depuis le début (worker)
+HEADER_STOP = 2             # passe à 1 pour demander l'arrêt du worker (producteur)
+HEADER_SEND_ERRORS = 3      # erreurs d'envoi rtmidi (worker)
+HEADER_LATENCY_COUNT = 4    # latence producteur -> envoi : nombre, somme et maximum en ns (worker)
+HEADER_LATENCY_SUM_NS = 5
+HEADER_LATENCY_MAX_NS = 6
+HEADER_LATENCY_BUCKETS = 7  # un compteur par borne de metrics.LATENCY_BUCKETS, plus un au-delà
+HEADER_SLOTS = HEADER_LATENCY_BUCKETS + len(metrics.LATENCY_BUCKETS) + 1
+HEADER_SIZE = HEADER_SLOTS * 8
+
+# Enregistrement : index du port (u16), longueur (u16), horodatage perf_counter_ns (u64), puis les octets MIDI
+RECORD_HEADER = struct.Struct('<HHQ')
+IO_WORKER_SPIN_POLLS = 200          # lectures à vide avant de s'endormir (les rafales arrivent groupées)
+IO_WORKER_IDLE_SLEEP_S = 0.0002     # pause du worker quand le buffer reste vide
+IO_WORKER_START_TIMEOUT_S = 10.0
+IO_WORKER_FULL_TIMEOUT_S = 0.5      # attente maximale de place dans le buffer avant d'abandonner un message
+# processeurs à ordre des écritures total (TSO) : cf. SharedRingBuffer.put
+TSO_MACHINES = ('x86_64', 'amd64', 'i386', 'i686', 'x86')
+
+def get_io_worker_config(config):
+    """
+    Retourne la configuration du processus d'E/S ("io_worker" dans config.json) :
+    {'enabled': ..., 'ring_bytes': ...}. Désactivé par défaut : les ports sont alors ouverts dans le processus principal.
+    """
+    worker_config = config.get('io_worker', {})
+    return {'enabled': bool(worker_config.get('enabled', False)), 'ring_bytes': int(worker_config.get('ring_bytes', 65536))}
+
+class SharedRingBuffer:
+    """
+    Buffer circulaire à un producteur et un consommateur dans un segment multiprocessing.shared_memory.
+    Les index de lecture et d'écriture ne font que croître (position = index modulo capacité) ;
+    le producteur publie un enregistrement en avançant WRITE_INDEX une fois les octets copiés,
+    le consommateur libère la place en avançant READ_INDEX : sans verrou ni appel système.
+    Python n'offre pas de barrière mémoire : la publication repose sur l'ordre des écritures du processeur,
+    garanti sur x86 / x86-64 (TSO) mais pas sur ARM (Raspberry Pi...), où le worker pourrait lire un
+    enregistrement incomplet. Cf. TSO_MACHINES et l'avertissement de IoWorker.start.
+    """
+
+    def __init__(self, name=None, capacity=65536):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=HEADER_SIZE + capacity)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.capacity = self.shm.size - HEADER_SIZE
+        self.header = self.shm.buf[:HEADER_SIZE].cast('Q')
+        self.data = self.shm.buf[HEADER_SIZE:HEADER_SIZE + self.capacity]
+        if self.owner:
+            for slot in range(HEADER_SLOTS):
+                self.header[slot] = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def copy_in(self, position, data):
+        offset = position % self.capacity
+        first = min(len(data), self.capacity - offset)
+        self.data[offset:offset + first] = data[:first]
+        self.data[:len(data) - first] = data[first:]
+
+    def copy_out(self, position, length):
+        offset = position % self.capacity
+        first = min(length, self.capacity - offset)
+        return bytes(self.data[offset:offset + first]) + bytes(self.data[:length - first])
+
+    def put(self, port_index, midi_msg):
+        """Ajoute un message pour le port port_index. Retourne False si le buffer est plein (le worker ne suit pas)."""
+        write_index = self.header[HEADER_WRITE_INDEX]
+        record_size = RECORD_HEADER.size + len(midi_msg)
+        if write_index + record_size - self.header[HEADER_READ_INDEX] > self.capacity:
+            return False
+        self.copy_in(write_index, RECORD_HEADER.pack(port_index, len(midi_msg), time.perf_counter_ns()))
+        self.copy_in(write_index + RECORD_HEADER.size, midi_msg)
+        # x86 uniquement : les écritures des octets ci-dessus sont visibles avant celle de WRITE_INDEX
+        self.header[HEADER_WRITE_INDEX] = write_index + record_size
+        return True
+
+    def get(self):
+        """Retourne le message suivant (index du port, horodatage en ns, octets) ou None si le buffer est vide."""
+        read_index = self.header[HEADER_READ_INDEX]
+        if read_index == self.header[HEADER_WRITE_INDEX]:
+            return None
+        port_index, length, timestamp_ns = RECORD_HEADER.unpack(self.copy_out(read_index, RECORD_HEADER.size))
+        midi_msg = self.copy_out(read_index + RECORD_HEADER.size, length)
+        self.header[HEADER_READ_INDEX] = read_index + RECORD_HEADER.size + length
+        return port_index, timestamp_ns, midi_msg
+
+    def record_latency(self, latency_ns):
+        # appelé par le worker uniquement
+        header = self.header
+        header[HEADER_LATENCY_COUNT] += 1
+        header[HEADER_LATENCY_SUM_NS] += latency_ns
+        if latency_ns > header[HEADER_LATENCY_MAX_NS]:
+            header[HEADER_LATENCY_MAX_NS] = latency_ns
+        bucket = 0
+        while bucket < len(metrics.LATENCY_BUCKETS) and latency_ns > metrics.LATENCY_BUCKETS[bucket] * 1e9:
+            bucket += 1
+        header[HEADER_LATENCY_BUCKETS + bucket] += 1
+
+    def get_latency_histogram(self):
+        """Copie des compteurs de latence du worker dans un metrics.Histogram (export, bilan)."""
+        histogram = metrics.Histogram()
+        histogram.counts = [self.header[HEADER_LATENCY_BUCKETS + i] for i in range(len(histogram.counts))]
+        histogram.count = self.header[HEADER_LATENCY_COUNT]
+        histogram.sum = self.header[HEADER_LATENCY_SUM_NS] / 1e9
+        return histogram
+
+    def close(self):
+        self.header.release()
+        self.data.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+class RingOutputPort:
+    """Port de sortie du processus principal : send_message() dépose le message dans le buffer partagé."""
+
+    def __init__(self, ring, port_index):
+        self.ring = ring
+        self.port_index = port_index
+        self.dropped_messages = 0
+
+    def send_message(self, midi_msg):
+        # buffer plein (rafale plus grande que le buffer) : attendre que le worker libère de la place,
+        # sans bloquer indéfiniment si le worker est arrêté
+        deadline = None
+        while not self.ring.put(self.port_index, midi_msg):
+            if deadline is None:
+                deadline = time.perf_counter() + IO_WORKER_FULL_TIMEOUT_S
+            elif time.perf_counter() > deadline:
+                self.dropped_messages += 1
+                raise Exception(f"buffer partagé plein depuis {IO_WORKER_FULL_TIMEOUT_S:g} s, le processus d'E/S ne suit pas")
+            time.sleep(0)
+
+    def close(self):
+        pass
+
+class _NullPort:
+    # port sans sortie (port '' : tests et benchmark)
+    def send_message(self, midi_msg):
+        pass
+    def close(self):
+        pass
+
+def run_io_worker(ring_name, port_parts, connection, realtime_config=None):
+    """
+    Boucle du processus d'E/S : ouvre les ports de sortie, passe en ordonnancement temps réel si configuré
+    (cf. realtime), puis envoie les messages du buffer dans l'ordre et mesure leur latence depuis leur dépôt.
+    Rien d'autre ne tourne dans ce processus.
+    """
+    ring = SharedRingBuffer(ring_name)
+    ports = []
+    try:
+        for port_part in port_parts:
+            if len(port_part) == 0:
+                ports.append(_NullPort())
+                continue
+            import rtmidi
+            midi_out = rtmidi.MidiOut()
+            port_index = next((i for i, name in enumerate(midi_out.get_ports()) if port_part.lower() in name.lower()), None)
+            if port_index is None:
+                raise Exception(f"Interface MIDI de sortie '{port_part}' non trouvée.")
+            midi_out.open_port(port_index)
+            ports.append(midi_out)
+    except Exception as e:
+        connection.send(('error', str(e)))
+        ring.close()
+        return
+    realtime_report = ''
+    if realtime_config is not None and realtime.is_realtime_enabled(realtime_config):
+        realtime_report = realtime.apply_realtime(realtime_config)
+    connection.send(('ready', realtime_report))
+
+    header = ring.header
+    empty_polls = 0
+    while header[HEADER_STOP] == 0 or header[HEADER_READ_INDEX] != header[HEADER_WRITE_INDEX]:
+        record = ring.get()
+        if record is None:
+            empty_polls += 1
+            if empty_polls > IO_WORKER_SPIN_POLLS:
+                time.sleep(IO_WORKER_IDLE_SLEEP_S)
+            continue
+        empty_polls = 0
+        port_index, timestamp_ns, midi_msg = record
+        try:
+            ports[port_index].send_message(midi_msg)
+        except Exception as e:
+            header[HEADER_SEND_ERRORS] += 1
+            print(f"/!/ Erreur d'envoi du message MIDI ({midi_msg.hex(' ')}): {e}")
+        ring.record_latency(time.perf_counter_ns() - timestamp_ns)
+
+    for port in ports:
+        port.close()
+    ring.close()
+
+class IoWorker:
+    """Démarrage, ports et arrêt du processus d'E/S vus du processus principal."""
+
+    def __init__(self, port_parts, ring_bytes=65536, realtime_config=None):
+        self.port_parts = list(port_parts)
+        self.realtime_config = realtime_config
+        self.ring = SharedRingBuffer(capacity=ring_bytes)
+        self.process = None
+
+    def start(self):
+        """
+        Lance le processus et attend l'ouverture de ses ports. Lève une Exception en cas d'échec.
+        Le processus est lancé par 'spawn' et non par fork : les threads rtmidi des entrées déjà ouvertes
+        (et leurs verrous) ne sont pas dupliqués dans un processus où ils ne tourneraient plus.
+        """
+        if platform.machine().lower() not in TSO_MACHINES:
+            print(f"/!/ Processus d'E/S MIDI sur {platform.machine()} : l'ordre des écritures en mémoire partagée "
+                  f"n'est garanti que sur x86, des messages pourraient être lus incomplets")
+        context = multiprocessing.get_context('spawn')
+        parent_connection, child_connection = context.Pipe(duplex=False)
+        self.process = context.Process(target=run_io_worker, name='midi-io',
+                                       args=(self.ring.name, self.port_parts, child_connection, self.realtime_config), daemon=True)
+        self.process.start()
+        if not parent_connection.poll(IO_WORKER_START_TIMEOUT_S):
+            self.stop()
+            raise Exception("le processus d'E/S MIDI n'a pas démarré")
+        status, message = parent_connection.recv()
+        if status != 'ready':
+            self.stop()
+            raise Exception(message)
+        print(f"- Processus d'E/S MIDI démarré (pid {self.process.pid}, buffer partagé de {self.ring.capacity} octets)")
+        if len(message) > 0:
+            print(f"- Temps réel du processus d'E/S : {message}")
+
+    def get_port(self, port_index):
+        return RingOutputPort(self.ring, port_index)
+
+    def describe_latency(self):
+        histogram = self.ring.get_latency_histogram()
+        if histogram.count == 0:
+            return "aucun message"
+        return (f"{histogram.count} messages, latence moyenne {histogram.sum / histogram.count * 1e6:.0f} µs, "
+                f"maximum {self.ring.header[HEADER_LATENCY_MAX_NS] / 1000:.0f} µs, "
+                f"{self.ring.header[HEADER_SEND_ERRORS]} erreur(s) d'envoi")
+
+    def stop(self):
+        """Demande l'arrêt (après envoi des messages en attente), attend le processus et libère le segment partagé."""
+        if self.process is not None:
+            self.ring.header[HEADER_STOP] = 1
+            self.process.join(2.0)
+            if self.process.is_alive():
+                self.process.terminate()
+            print(f"- Processus d'E/S MIDI arrêté : {self.describe_latency()}")
+            self.process = None
+        self.ring.close()
+
+def benchmark_io_worker(message_count=20000):
+    """Mesure la latence entre le dépôt d'un message par le processus principal et son envoi par le worker."""
+    worker = IoWorker([''], 65536)
+    worker.start()
+    start = time.perf_counter()
+    for i in range(message_count):
+        while not worker.ring.put(0, bytes((0xB0, 0x07, i & 0x7F))):
+            time.sleep(0)   # buffer plein : on laisse le worker rattraper
+        if i % 100 == 0:
+            time.sleep(0.001)   # rafales de 100 messages, comme un changement de chanson
+    duration = time.perf_counter() - start
+    while worker.ring.header[HEADER_READ_INDEX] != worker.ring.header[HEADER_WRITE_INDEX]:
+        time.sleep(0.001)
+    print(f"Processus d'E/S, {message_count} messages en {duration * 1000:.0f} ms : {worker.describe_latency()}")
+    worker.stop()
+
+
+# ==============================================================================
+# UNITARY TESTS
+# ==============================================================================
+
+def _ring_scenario(capacity, messages):
+    # dépose puis relit les messages (le buffer est plus petit que le total : il boucle sur lui-même)
+    ring = SharedRingBuffer(capacity=capacity)
+    received = []
+    try:
+        for port_index, midi_msg in messages:
+            if not ring.put(port_index, midi_msg):
+                received.append('plein')
+                continue
+            port_index, timestamp_ns, midi_msg = ring.get()
+            received.append((port_index, midi_msg))
+        # second dépôt sans lecture : le buffer se remplit
+        while ring.put(0, b'\xc0\x01'):
+            pass
+        received.append(ring.get()[2])
+    finally:
+        ring.close()
+    return received
+
+def _worker_scenario(message_count):
+    # messages envoyés par un vrai processus d'E/S (port nul) : tous sont envoyés et mesurés,
+    # y compris quand la rafale dépasse la taille du buffer (l'envoi attend que le worker libère de la place)
+    worker = IoWorker(['', ''], 256)
+    worker.start()
+    for i in range(message_count):
+        worker.get_port(i % 2).send_message(bytes((0xC0, i & 0x7F)))
+    worker.ring.header[HEADER_STOP] = 1
+    worker.process.join(5.0)
+    count = worker.ring.header[HEADER_LATENCY_COUNT]
+    worker.stop()
+    return count
+
+TEST_PLAN: test_utility.TestPlan = [
+    {
+        "chapter_title": "1: Buffer circulaire en mémoire partagée",
+        "tests": [
+            {
+                "test_title": "Messages à cheval sur la fin du buffer puis buffer plein",
+                "function_under_test": _ring_scenario,
+                "expected_return": [(0, b'\xb0\x63\x40'), (1, b'\xc5\x3a'), (0, b'\xb0\x06\x4b'), (2, b'\xf0\x43\x10\xf7'), b'\xc0\x01'],
+                "function_arguments": [40, [(0, b'\xb0\x63\x40'), (1, b'\xc5\x3a'), (0, b'\xb0\x06\x4b'), (2, b'\xf0\x43\x10\xf7')]]
+            },
+        ]
+    },
+    {
+        "chapter_title": "2: Processus d'E/S",
+        "tests": [
+            {
+                "test_title": "Tous les messages déposés sont envoyés",
+                "function_under_test": _worker_scenario,
+                "expected_return": 200,
+                "function_arguments": [200]
+            },
+        ]
+    },
+]
+
+def run_unitary_tests():
+    return (test_utility.run_test_plan(TEST_PLAN))
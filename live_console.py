@@ -0,0 +1,173 @@
+# module: live_console
+# Console interactive (--console) : commandes au format des fichiers chansons envoyées immédiatement
+import bisect
+import test_utility
+
+# readline n'existe pas sous Windows : la console fonctionne alors sans complétion
+try:
+    import readline
+except ImportError:
+    readline = None
+
+CONSOLE_COMMANDS = ('load', 'help', 'quit')
+MIX_ACTIONS = ('send', 'pan', 'mute', 'level')
+# clés de la section [SONG_INFO] exécutables depuis la console
+SONG_COMMANDS = ('bpm',)
+# lignes dont le programme compilé reste mémorisé (les moins récemment utilisées sont oubliées)
+CONSOLE_PROGRAM_CACHE_SIZE = 256
+
+CONSOLE_HELP = """Commandes de la console :
+  <voie>/send/<bus> = <dB>      ex: chant_emilie/send/facade = -3
+  <voie>/pan/<bus> = <pan>      ex: chant_alain/pan/facade = left 30
+  <voie>/mute = ON|OFF          ex: chant_olivier/mute = ON
+  <bus>/level = <dB>            ex: facade/level = -20
+  <pédale> = PC <n> | CC <n> <v>   ex: alain_mfx = PC 90
+  bpm = <tempo>                 ex: bpm = 120 (Midronome et tap tempo)
+  load <chanson>                charge la chanson la plus proche (titre ou nom de fichier)
+  help                          affiche cette aide
+  quit                          arrête le contrôleur
+Tab complète les noms de voies, bus, pédales et chansons."""
+
+def parse_console_line(line, pedal_map):
+    """
+    Analyse une ligne saisie dans la console. Retourne (type, argument) :
+    - ('load', requête), ('help', ''), ('quit', '')
+    - ('pedal', 'pédale/commande') si la clé est une pédale de pedal_map (noms en majuscules)
+    - ('song', 'clé/valeur') pour une clé de [SONG_INFO] (cf. SONG_COMMANDS)
+    - ('mix', 'clé/valeur') sinon, au format des lignes [MIX] d'un fichier chanson
+    - ('', '') pour une ligne vide ou un commentaire, ('error', message) si la ligne est invalide
+    Comme dans les fichiers chansons, la clé n'est pas sensible à la casse.
+    """
+    line = line.strip()
+    if len(line) == 0 or line.startswith('#'):
+        return '', ''
+
+    word, _, rest = line.partition(' ')
+    if word.lower() in CONSOLE_COMMANDS:
+        return word.lower(), rest.strip()
+
+    if '=' not in line:
+        return 'error', f"Ligne '{line}' invalide : attendu 'clé = valeur' ou une commande {CONSOLE_COMMANDS}"
+    key, value = line.split('=', 1)
+    return parse_param(key, value, pedal_map)
+
+def parse_param(key, value, pedal_map):
+    """
+    Analyse un paramètre 'clé = valeur' (console, API de contrôle, entrée OSC). Retourne ('pedal', ...),
+    ('song', ...) ou ('mix', 'clé/valeur') comme parse_console_line, ou ('error', message) : une clé vide,
+    contenant '=' ou commençant par une commande de la console (load, quit...) n'est jamais exécutée.
+    """
+    key, value = key.strip().lower(), value.strip()
+    words = key.replace('/', ' ').split()
+    if len(words) == 0 or words[0] in CONSOLE_COMMANDS or '=' in key:
+        return 'error', f"Paramètre '{key}' invalide : attendu une clé [MIX], [PEDALS] ou {SONG_COMMANDS}"
+    if key.upper() in pedal_map:
+        return 'pedal', f"{key}/{value}"
+    if key in SONG_COMMANDS:
+        return 'song', f"{key}/{value}"
+    return 'mix', f"{key}/{value}"
+
+class ConsoleCompleter:
+    """
+    Complétion (protocole readline) sur un vocabulaire trié : noms de voies et de bus,
+    actions [MIX], pédales, commandes de la console et noms de chansons.
+    '/', '=' et ' ' séparant les mots pour readline, seul le mot en cours est complété.
+    """
+
+    def __init__(self, words):
+        self.words = sorted({word.lower() for word in words if len(word) > 0})
+        self.matches = []
+
+    def get_matches(self, text):
+        text = text.lower()
+        start = bisect.bisect_left(self.words, text)
+        end = bisect.bisect_left(self.words, text + '\uffff', start)
+        return self.words[start:end]
+
+    def complete(self, text, state):
+        if state == 0:
+            self.matches = self.get_matches(text)
+        return self.matches[state] if state < len(self.matches) else None
+
+def run_console(push_line, completer, prompt='console> '):
+    """
+    Boucle de saisie (à lancer dans un thread) : chaque ligne est transmise à push_line,
+    qui la fait exécuter par le thread principal. S'arrête sur 'quit' ou fin de saisie (Ctrl+D).
+    """
+    if readline is not None:
+        readline.set_completer(completer.complete)
+        readline.parse_and_bind('tab: complete')
+    print(CONSOLE_HELP)
+    while True:
+        try:
+            line = input(prompt)
+        except EOFError:
+            line = 'quit'
+        push_line(line)
+        if line.strip().lower() == 'quit':
+            return
+
+
+# ==============================================================================
+# UNITARY TESTS
+# ==============================================================================
+
+_PEDALS = {'ALAIN_MFX': [6, 0]}
+
+TEST_PLAN: test_utility.TestPlan = [
+    {
+        "chapter_title": "1: Analyse des lignes de la console",
+        "tests": [
+            {
+                "test_title": "Ligne [MIX]",
+                "function_under_test": parse_console_line,
+                "expected_return": ('mix', 'chant_emilie/send/facade/-3'),
+                "function_arguments": ['Chant_Emilie/send/Facade = -3', _PEDALS]
+            },
+            {
+                "test_title": "Ligne [PEDALS]",
+                "function_under_test": parse_console_line,
+                "expected_return": ('pedal', 'alain_mfx/PC 90'),
+                "function_arguments": ['alain_mfx = PC 90', _PEDALS]
+            },
+            {
+                "test_title": "Ligne [SONG_INFO]",
+                "function_under_test": parse_console_line,
+                "expected_return": ('song', 'bpm/120'),
+                "function_arguments": ['BPM = 120', _PEDALS]
+            },
+            {
+                "test_title": "Chargement d'une chanson",
+                "function_under_test": parse_console_line,
+                "expected_return": ('load', 'ca plane'),
+                "function_arguments": ['load ca plane', _PEDALS]
+            },
+            {
+                "test_title": "Ligne invalide",
+                "function_under_test": parse_console_line,
+                "expected_return": ('error', "Ligne 'facade' invalide : attendu 'clé = valeur' ou une commande ('load', 'help', 'quit')"),
+                "function_arguments": ['facade', _PEDALS]
+            },
+            {
+                "test_title": "Paramètre : une commande de la console n'est pas un paramètre",
+                "function_under_test": parse_param,
+                "expected_return": ('error', "Paramètre 'quit' invalide : attendu une clé [MIX], [PEDALS] ou ('bpm',)"),
+                "function_arguments": ['quit', '', _PEDALS]
+            },
+        ]
+    },
+    {
+        "chapter_title": "2: Complétion",
+        "tests": [
+            {
+                "test_title": "Mots commençant par la saisie",
+                "function_under_test": ConsoleCompleter(['CHANT_EMILIE', 'CHANT_ALAIN', 'FACADE', 'send']).get_matches,
+                "expected_return": ['chant_alain', 'chant_emilie'],
+                "function_arguments": ['Chant']
+            },
+        ]
+    },
+]
+
+def run_unitary_tests():
+    return (test_utility.run_test_plan(TEST_PLAN))
@@ -0,0 +1,175 @@
+# module: mem_profiler
+# Mode --memprofile : snapshots tracemalloc autour de chaque changement de chanson pour détecter les fuites
+import gc
+import os
+import tracemalloc
+import test_utility
+
+# psutil est optionnel : sans lui, la mémoire résidente est lue dans /proc (Linux uniquement)
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+MEMPROFILE_TOP_COUNT = 5            # sites d'allocation affichés par changement de chanson
+MEMPROFILE_FRAMES = 4               # profondeur des piles enregistrées par tracemalloc
+RSS_WINDOW = 10                     # changements de chanson observés pour la tendance de la RSS
+RSS_GROWTH_WARNING = 1024 * 1024    # croissance (octets) sur la fenêtre au-delà de laquelle on alerte
+
+def get_rss_bytes():
+    """Retourne la mémoire résidente du processus en octets, ou None si elle n'est pas mesurable."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def is_steady_growth(samples, min_growth=RSS_GROWTH_WARNING):
+    """
+    Vrai si la fenêtre de mesures ne fait que croître (jamais de baisse) et a pris au moins min_growth.
+    Un pic isolé suivi d'une libération ne déclenche pas l'alerte, une montée régulière si.
+    """
+    if len(samples) < 2:
+        return False
+    never_decreasing = all(later >= earlier for earlier, later in zip(samples, samples[1:]))
+    return never_decreasing and samples[-1] - samples[0] >= min_growth
+
+def format_size(size):
+    sign = '-' if size < 0 else '+'
+    size = abs(size)
+    if size >= 1024 * 1024:
+        return f"{sign}{size / (1024 * 1024):.1f} Mo"
+    if size >= 1024:
+        return f"{sign}{size / 1024:.1f} Ko"
+    return f"{sign}{size} o"
+
+class SongChangeMemoryProfiler:
+    """
+    Encadre chaque changement de chanson (begin/end) par deux snapshots tracemalloc.
+    end() affiche la mémoire nette retenue par la transition et les sites d'allocation
+    qui la retiennent, puis surveille la tendance de la RSS sur les derniers changements.
+    Le premier changement remplit les caches (compilations, fichiers chansons) : sa mémoire
+    retenue est normale, c'est une croissance qui continue au fil des changements qui signale une fuite.
+    """
+
+    def __init__(self, top_count=MEMPROFILE_TOP_COUNT, rss_window=RSS_WINDOW, rss_growth_warning=RSS_GROWTH_WARNING):
+        self.top_count = top_count
+        self.rss_window = rss_window
+        self.rss_growth_warning = rss_growth_warning
+        self.rss_samples = []
+        self.before = None
+        self.transitions = 0
+        self.total_retained = 0
+        # les snapshots de tracemalloc ne sont pas des fuites du contrôleur
+        self.filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(MEMPROFILE_FRAMES)
+        print(f"- Profilage mémoire actif : snapshot tracemalloc à chaque changement de chanson"
+              f"{'' if get_rss_bytes() is not None else ' (RSS non mesurable : installer psutil)'}")
+
+    def take_snapshot(self):
+        # les cycles en attente du ramasse-miettes ne sont pas de la mémoire retenue
+        gc.collect()
+        return tracemalloc.take_snapshot().filter_traces(self.filters)
+
+    def begin(self):
+        self.before = self.take_snapshot()
+
+    def end(self, description):
+        """Compare au snapshot pris par begin(), affiche le bilan de la transition et retourne la mémoire nette retenue."""
+        if self.before is None:
+            return 0
+        after = self.take_snapshot()
+        differences = after.compare_to(self.before, 'traceback')
+        self.before = None
+        retained = sum(difference.size_diff for difference in differences)
+        self.transitions += 1
+        self.total_retained += retained
+
+        print(f"[mémoire] {description} : {format_size(retained)} retenus "
+              f"(cumul {format_size(self.total_retained)} sur {self.transitions} changement(s))")
+        for difference in differences[:self.top_count]:
+            if difference.size_diff <= 0:
+                break
+            frame = difference.traceback[0]
+            print(f"    {format_size(difference.size_diff):>10} {difference.count_diff:+6d} blocs  {frame.filename}:{frame.lineno}")
+
+        rss = get_rss_bytes()
+        if rss is not None:
+            self.rss_samples = (self.rss_samples + [rss])[-self.rss_window:]
+            if len(self.rss_samples) == self.rss_window and is_steady_growth(self.rss_samples, self.rss_growth_warning):
+                print(f"/!/ La mémoire résidente croît à chaque changement de chanson : "
+                      f"{format_size(self.rss_samples[-1] - self.rss_samples[0])} sur les {self.rss_window} derniers "
+                      f"(RSS {self.rss_samples[-1] // 1024} Ko). Fuite probable.")
+        return retained
+
+    def stop(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        if self.transitions > 0:
+            print(f"[mémoire] Bilan : {format_size(self.total_retained)} retenus sur {self.transitions} changement(s) de chanson")
+
+
+# ==============================================================================
+# UNITARY TESTS
+# ==============================================================================
+
+_leaked_blocks = []
+
+def _profile_scenario(leak_size):
+    # une transition qui conserve leak_size octets doit les retrouver comme mémoire retenue
+    profiler = SongChangeMemoryProfiler(top_count=0)
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start(MEMPROFILE_FRAMES)
+    profiler.begin()
+    _leaked_blocks.append(bytearray(leak_size))
+    retained = profiler.end("test")
+    if not was_tracing:
+        tracemalloc.stop()
+    _leaked_blocks.clear()
+    return leak_size <= retained < leak_size + 4096
+
+TEST_PLAN: test_utility.TestPlan = [
+    {
+        "chapter_title": "1: Tendance de la mémoire résidente",
+        "tests": [
+            {
+                "test_title": "Croissance régulière",
+                "function_under_test": is_steady_growth,
+                "expected_return": True,
+                "function_arguments": [[100, 150, 150, 300], 200]
+            },
+            {
+                "test_title": "Pic puis libération",
+                "function_under_test": is_steady_growth,
+                "expected_return": False,
+                "function_arguments": [[100, 500, 120, 400], 200]
+            },
+            {
+                "test_title": "Croissance trop faible",
+                "function_under_test": is_steady_growth,
+                "expected_return": False,
+                "function_arguments": [[100, 110, 120, 130], 200]
+            },
+        ]
+    },
+    {
+        "chapter_title": "2: Snapshots tracemalloc",
+        "tests": [
+            {
+                "test_title": "Mémoire retenue par une transition",
+                "function_under_test": _profile_scenario,
+                "expected_return": True,
+                "function_arguments": [100000]
+            },
+        ]
+    },
+]
+
+def run_unitary_tests():
+    return (test_utility.run_test_plan(TEST_PLAN))
@@ -0,0 +1,178 @@
+# module: metrics
+# Export des compteurs du contrôleur au format texte Prometheus (endpoint HTTP local ou fichier texte)
+import bisect
+import http.server
+import os
+import threading
+import test_utility
+
+# Bornes (en secondes) des histogrammes de latence
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+
+def get_metrics_config(config):
+    """
+    Retourne la configuration de l'export ("metrics" dans config.json) :
+    {'host': ..., 'port': ..., 'textfile': ..., 'interval_s': ...}.
+    Un port à 0 désactive l'endpoint HTTP, un textfile vide désactive l'écriture du fichier.
+    """
+    metrics_config = config.get('metrics', {})
+    return {
+        'host': metrics_config.get('host', '127.0.0.1'),
+        'port': int(metrics_config.get('port', 0)),
+        'textfile': metrics_config.get('textfile', ''),
+        'interval_s': float(metrics_config.get('interval_s', 15)),
+    }
+
+class Histogram:
+    """
+    Histogramme à bornes fixes. observe() ne fait qu'une recherche dichotomique et trois additions,
+    sans verrou : il n'est appelé que par le thread principal, l'export ne fait que lire.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)    # dernière case : au-delà de la plus grande borne
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+def format_labels(labels):
+    if len(labels) == 0:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels.items()) + '}'
+
+class MetricsRegistry:
+    """
+    Liste des métriques exportées. Les compteurs ne sont pas recopiés : chaque métrique est
+    une fonction qui lit, au moment de l'export, les compteurs que le contrôleur tient déjà
+    (entiers, buffers de sortie, file d'événements). Le chemin d'un changement de chanson
+    ne paie donc que ses propres incréments.
+    """
+
+    def __init__(self, prefix='midigig'):
+        self.prefix = prefix
+        self.metrics = []   # (nom, type, aide, fonction)
+
+    def add(self, name, metric_type, help_text, collect):
+        """collect() retourne [(labels, valeur)] pour counter/gauge, ou un Histogram."""
+        self.metrics.append((f"{self.prefix}_{name}", metric_type, help_text, collect))
+
+    def render(self):
+        lines = []
+        for name, metric_type, help_text, collect in self.metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            if metric_type == 'histogram':
+                histogram = collect()
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f"{name}_sum {histogram.sum}")
+                lines.append(f"{name}_count {histogram.count}")
+            else:
+                for labels, value in collect():
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        """Ecrit les métriques de manière atomique (fichier temporaire puis renommage)."""
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(temp_path, path)
+
+class MetricsExporter:
+    """Endpoint HTTP /metrics et/ou écriture périodique d'un fichier texte, dans des threads dédiés."""
+
+    def __init__(self, registry, host='127.0.0.1', port=0, textfile='', interval_s=15):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.textfile = textfile
+        self.interval_s = interval_s
+        self.http_server = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        registry = self.registry
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode('utf-8')
+                self.send_response(200 if self.path.split('?')[0] == '/metrics' else 404)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass    # pas de ligne de log à chaque collecte
+
+        if self.port > 0:
+            self.http_server = http.server.ThreadingHTTPServer((self.host, self.port), MetricsHandler)
+            threading.Thread(target=self.http_server.serve_forever, daemon=True).start()
+            print(f"- Métriques exportées sur http://{self.host}:{self.port}/metrics")
+        if len(self.textfile) > 0:
+            threading.Thread(target=self.write_periodically, daemon=True).start()
+            print(f"- Métriques écrites dans '{self.textfile}' toutes les {self.interval_s:g} s")
+
+    def write_periodically(self):
+        while not self.stopped.wait(self.interval_s):
+            try:
+                self.registry.write_textfile(self.textfile)
+            except OSError as e:
+                print(f"/!/ Ecriture des métriques dans '{self.textfile}' impossible : {e}")
+
+    def stop(self):
+        self.stopped.set()
+        if self.http_server is not None:
+            self.http_server.shutdown()
+
+
+# ==============================================================================
+# UNITARY TESTS
+# ==============================================================================
+
+def _render_scenario(latencies):
+    histogram = Histogram((0.01, 0.1))
+    for latency in latencies:
+        histogram.observe(latency)
+    registry = MetricsRegistry('test')
+    registry.add('sent_messages_total', 'counter', "Messages MIDI envoyés.",
+                 lambda: [({'port': 'CQ18'}, 12), ({'port': 'MIDIOUT2'}, 3)])
+    registry.add('latency_seconds', 'histogram', "Latence.", lambda: histogram)
+    return registry.render()
+
+TEST_PLAN: test_utility.TestPlan = [
+    {
+        "chapter_title": "1: Format texte Prometheus",
+        "tests": [
+            {
+                "test_title": "Compteur par port et histogramme cumulatif",
+                "function_under_test": _render_scenario,
+                "expected_return": (
+                    '# HELP test_sent_messages_total Messages MIDI envoyés.\n'
+                    '# TYPE test_sent_messages_total counter\n'
+                    'test_sent_messages_total{port="CQ18"} 12\n'
+                    'test_sent_messages_total{port="MIDIOUT2"} 3\n'
+                    '# HELP test_latency_seconds Latence.\n'
+                    '# TYPE test_latency_seconds histogram\n'
+                    'test_latency_seconds_bucket{le="0.01"} 1\n'
+                    'test_latency_seconds_bucket{le="0.1"} 3\n'
+                    'test_latency_seconds_bucket{le="+Inf"} 4\n'
+                    'test_latency_seconds_sum 0.605\n'
+                    'test_latency_seconds_count 4\n'
+                ),
+                "function_arguments": [[0.005, 0.05, 0.05, 0.5]]
+            },
+        ]
+    },
+]
+
+def run_unitary_tests():
+    return (test_utility.run_test_plan(TEST_PLAN))
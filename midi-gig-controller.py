@@ -4,15 +4,20 @@
 # - tester le BPM / tap tempo sur CQ
 # - coder le traitement des pédales d'effets
 
+import concurrent.futures
+import contextlib
+import io
 import json
 import os
 import re
+import gc
 import sys
+import threading
 import time
 from argparse import ArgumentParser
 import configparser 
 import numpy as np
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 
 # Nécessite l'installation: pip install python-rtmidi
 try:
@@ -22,8 +27,27 @@ except ImportError:
     print("La bibliothèque 'python-rtmidi' est requise. Veuillez l'installer: pip install python-rtmidi")
     sys.exit(1)
 
+import test_utility
 import utilities
 import cq18t
+import midi_input
+import midi_output
+import mix_planner
+import song_library
+import song_search
+import song_query
+import live_console
+import control_api
+import control_socket
+import osc_input
+import metrics
+import mem_profiler
+import cpu_profiler
+import smf_writer
+import io_worker
+import realtime
+import show_mode
+import setlist_report
 
 def get_port_by_name(midiio, name_part):
     """Trouve un port MIDI par une partie de son nom."""
@@ -65,7 +89,7 @@ def parse_mix_command(midi_channel, command, name_to_cq_map):
             midi_msg = cq18t.cq_get_midi_msg_set_fader_to_bus(midi_channel, input_channel_name, bus_channel_name, value)
                             
             # print(f"DEBUG parse_mix_command: midi_msg = {midi_msg}")
-            if midi_msg == []:
+            if len(midi_msg) == 0:
                 print(f"/!/ command {command} ignored")
                 desc = ''
             else:
@@ -85,7 +109,7 @@ def parse_mix_command(midi_channel, command, name_to_cq_map):
             
             midi_msg = cq18t.cq_get_midi_msg_set_pan_to_bus(midi_channel, input_channel_name, bus_channel_name, value)
             
-            if midi_msg == []:
+            if len(midi_msg) == 0:
                 print(f"/!/ command {command} ignored")
                 desc = ''
             else:
@@ -99,7 +123,7 @@ def parse_mix_command(midi_channel, command, name_to_cq_map):
             
             midi_msg = cq18t.cq_get_midi_msg_set_mute_channel(midi_channel, channel_name, value)
             
-            if midi_msg == []:
+            if len(midi_msg) == 0:
                 print(f"/!/ command {command} ignored")
                 desc = ''
             else:
@@ -112,7 +136,7 @@ def parse_mix_command(midi_channel, command, name_to_cq_map):
             
             midi_msg = cq18t.cq_get_midi_msg_set_bus_fader(midi_channel, bus_channel_name, value)
             
-            if midi_msg == []:
+            if len(midi_msg) == 0:
                 print(f"/!/ command {command} ignored")
                 desc = ''
             else:
@@ -127,11 +151,32 @@ def parse_mix_command(midi_channel, command, name_to_cq_map):
 
     except Exception as e:
         print(f"/!/ Erreur lors de l'analyse de la commande '{command}': {e}")
-        return [], ""
+        return b'', ""
 
 
 
 
+def is_valid_mix_key(key, name_to_cq_map):
+    """
+    Vérifie qu'une clé [MIX] sans sa valeur (Chant_Emilie/send/Facade, Chant_Olivier/mute, Facade/level...)
+    désigne un paramètre de la CQ-18T.
+    """
+    parts = [part.strip().upper() for part in key.split('/')]
+    if len(parts) < 2:
+        return False
+    channel_name = get_mix_canonical_name(parts[0], name_to_cq_map)
+    action = parts[1].lower()
+    if action == 'send' and len(parts) == 3:
+        return channel_name in cq18t.CQ_FADER_TO_MAIN_MAP and get_mix_canonical_name(parts[2], name_to_cq_map) in cq18t.CQ_FADER_BUSES
+    if action == 'pan' and len(parts) == 3:
+        return channel_name in cq18t.CQ_PAN_TO_MAIN_MAP and get_mix_canonical_name(parts[2], name_to_cq_map) in cq18t.CQ_PAN_BUSES
+    if action == 'mute' and len(parts) == 2:
+        return channel_name in cq18t.CQ_MUTE_CHANNELS_MAP
+    if action == 'level' and len(parts) == 2:
+        return channel_name in cq18t.CQ_BUS_FADER_MAP
+    return False
+
+
 # --- Contrôle de Pédales et Autres Périphériques ---
 
 def parse_pedal_command(pedal_name, command, pedal_map):
@@ -139,7 +184,7 @@ def parse_pedal_command(pedal_name, command, pedal_map):
     pedal_name = pedal_name.upper()
     
     if pedal_name not in pedal_map:
-        return [], f"Pedale '{pedal_name}' inconnue. Ignorée."
+        return b'', f"Pedale '{pedal_name}' inconnue. Ignorée."
         
     pedal_parameters = pedal_map[pedal_name]
     midi_channel = pedal_parameters[0] - 1 # 0-indexed
@@ -150,20 +195,20 @@ def parse_pedal_command(pedal_name, command, pedal_map):
     if parts[0].upper() == 'PC':
         pc_num = int(parts[1]) - 1 + pc_offset
         # [Program Change | channel, PC number]
-        midi_msg = [0xC0 | midi_channel, pc_num]
+        midi_msg = bytes((0xC0 | midi_channel, pc_num))
         desc = f"Pédale {pedal_name} (Ch {pedal_map[pedal_name]}): PC {pc_num + 1 - pc_offset} envoyé."
-        return [midi_msg], desc
+        return midi_msg, desc
         
     elif parts[0].upper() == 'CC':
         cc_num = int(parts[1])
         cc_val = int(parts[2])
         # [Control Change | channel, CC number, CC value]
-        midi_msg = [0xB0 | midi_channel, cc_num, cc_val]
+        midi_msg = bytes((0xB0 | midi_channel, cc_num, cc_val))
         desc = f"Pédale {pedal_name} (Ch {pedal_map[pedal_name]}): CC {cc_num}/{cc_val} envoyé."
-        return [midi_msg], desc
+        return midi_msg, desc
         
     else:
-        return [], f"Format de commande pédale inconnu: {command}. Attendu PC/CC."
+        return b'', f"Format de commande pédale inconnu: {command}. Attendu PC/CC."
 
 
 # --- Gestion des Fichiers et de la Configuration ---
@@ -187,65 +232,71 @@ def load_config(file_path):
         print(f"/!/ Erreur de lecture/parsing du fichier de configuration général '{file_path}': {e}")
         sys.exit(1)
 
-def load_mapping(file_path):
-    """Charge le fichier de mappage PC -> Nom de fichier de chanson."""
+def load_mapping(file_path, out=None):
+    """
+    Charge le fichier de mappage PC -> Nom de fichier de chanson.
+    Les clés sont "programme" (banque 0) ou "banque:programme" (cf. midi_input.parse_program_key).
+    """
     try:
         with open(file_path, 'r') as f:
             # Assurez-vous que les clés sont des entiers pour la recherche
-            mapping = {int(k): v for k, v in json.load(f).items()}
+            mapping = {midi_input.parse_program_key(k): v for k, v in json.load(f).items()}
             return mapping
     except Exception as e:
-        print(f"/!/ Erreur de lecture/parsing du fichier de mappage PC '{file_path}': {e}")
+        print(f"/!/ Erreur de lecture/parsing du fichier de mappage PC '{file_path}': {e}", file=out)
         sys.exit(1)
 
-def load_song_file(song_filename, songs_dir):
-    """Charge et parse un fichier de chanson (.ini-like)."""
-    filepath = os.path.join(songs_dir, song_filename)
-    parser = ConfigParser()
+def load_song_file(song_filename, library):
+    """Charge et parse un fichier de chanson (.ini-like), modèles inclus (cf. song_library)."""
     try:
-        # Lire le fichier en tant que dictionnaire pour éviter les problèmes de section [DEFAULT]
-        with open(filepath, 'r') as f:
-             # Ajouter une section factice si le fichier n'en a pas, puis le re-parser
-             content = "[commands]\n" + f.read()
-             parser.read_string(content)
-             
-        data = {
-            #'BPM': parser.getfloat('SONG_INFO', 'BPM', fallback=None),
-            'SONG_COMMANDS': parser.options('SONG_INFO') if parser.has_section('SONG_INFO') else [],
-            'MIX_COMMANDS': parser.options('MIX') if parser.has_section('MIX') else [],
-            'PEDAL_COMMANDS': parser.options('PEDALS') if parser.has_section('PEDALS') else [],
-            #'PEDAL_COMMANDS': []
-        }
-        
-        # Lire les commandes SONG
-        if parser.has_section('SONG_INFO'):
-            data['SONG_COMMANDS'] = [
-                f"{key}/{parser.get('SONG_INFO', key)}" 
-                for key in parser.options('SONG_INFO')
-            ]
-
-        # Lire les commandes CQ
-        if parser.has_section('MIX'):
-            data['MIX_COMMANDS'] = [
-                f"{key}/{parser.get('MIX', key)}" 
-                for key in parser.options('MIX')
-            ]
-        
-        # Lire les commandes des pédales et les formater (PedalName/Command)
-        if parser.has_section('PEDALS'):
-            data['PEDAL_COMMANDS'] = [
-                f"{key}/{parser.get('PEDALS', key)}"
-                for key in parser.options('PEDALS')
-            ]
-
+        data = library.get_song_data(song_filename)
         print(f"DEBUG : raw song_data after extraction: {data}")
         return data
         
     except Exception as e:
-        print(f"/!/ Erreur lors du chargement/parsing du fichier de chanson '{filepath}': {e}")
+        print(f"/!/ Erreur lors du chargement/parsing du fichier de chanson '{os.path.join(library.songs_dir, song_filename)}': {e}")
         return None
 
-def parse_command_arg(command_str: str) -> Optional[Tuple[str, str, Optional[str]]]:
+def get_song_scene(song_data):
+    """Retourne la scène de base déclarée par '[SONG_INFO] scene = N', ou None."""
+    for command_line in song_data['SONG_COMMANDS']:
+        song_param, value = command_line.split('/', 1)
+        if song_param.strip() == 'scene':
+            try:
+                scene_id = int(value)
+            except ValueError:
+                print(f"/!/ Scène '{value}' invalide. Ignorée.")
+                continue
+            if not cq18t.is_valid_scene(scene_id):
+                print(f"/!/ Scène {scene_id} hors plage 1-{cq18t.CQ_SCENE_COUNT}. Ignorée.")
+                continue
+            return scene_id
+    return None
+
+def get_scene_files(config):
+    """Scènes décrites dans "cq_scenes" de config.json : {numéro de scène: fichier}, numéros hors 1-128 ignorés."""
+    scene_files = {}
+    for key, scene_filename in config.get('cq_scenes', {}).items():
+        try:
+            scene_id = int(key)
+        except ValueError:
+            print(f"/!/ Scène '{key}' de cq_scenes invalide. Ignorée.")
+            continue
+        if not cq18t.is_valid_scene(scene_id):
+            print(f"/!/ Scène {scene_id} de cq_scenes hors plage 1-{cq18t.CQ_SCENE_COUNT}. Ignorée.")
+            continue
+        scene_files[scene_id] = scene_filename
+    return scene_files
+
+def get_song_title(song_data):
+    """Retourne le titre déclaré par '[SONG_INFO] title = ...', ou ''."""
+    for command_line in song_data['SONG_COMMANDS']:
+        song_param, value = command_line.split('/', 1)
+        if song_param.strip() == 'title':
+            return value.strip()
+    return ''
+
+def parse_command_arg(command_str: str, out=None) -> Optional[Tuple[str, str, Optional[str]]]:
     """
     Parse une chaîne de commande au format 'SECTION/CLE = VALEUR' ou 'SECTION/CLE'.
     Retourne (section, key, value) ou (section, key, None) pour la suppression.
@@ -262,7 +313,7 @@ def parse_command_arg(command_str: str) -> Optional[Tuple[str, str, Optional[str
     parts = section_key.strip().split("/", 1)
     
     if len(parts) != 2:
-        print(f"Erreur de format : La commande '{command_str}' doit être au format 'SECTION/CLE[ = VALEUR]'.")
+        print(f"Erreur de format : La commande '{command_str}' doit être au format 'SECTION/CLE[ = VALEUR]'.", file=out)
         return None
         
     section, key = parts[0].upper(), parts[1] # Mettre la section en majuscules pour correspondre
@@ -270,7 +321,7 @@ def parse_command_arg(command_str: str) -> Optional[Tuple[str, str, Optional[str
     return section, key, value
 
 
-def update_song_file(filepath: str, operation: str, section: str, key: str, value: Optional[str] = None) -> bool:
+def update_song_file(filepath: str, operation: str, section: str, key: str, value: Optional[str] = None, out=None) -> bool:
     """
     Effectue une opération (add, update, delete) sur une commande dans un fichier.
     
@@ -298,18 +349,18 @@ def update_song_file(filepath: str, operation: str, section: str, key: str, valu
         if current_value != value:
             config.set(section, key, value)
             file_modified = True
-            print(f"  ✅ {section}/{key} : {'Ajouté' if current_value is None else 'Mis à jour'} à '{value}'.")
+            print(f"  ✅ {section}/{key} : {'Ajouté' if current_value is None else 'Mis à jour'} à '{value}'.", file=out)
         else:
-            print(f"  ☑️ {section}/{key} : Valeur déjà définie sur '{value}'. Aucune modification.")
+            print(f"  ☑️ {section}/{key} : Valeur déjà définie sur '{value}'. Aucune modification.", file=out)
 
 
     elif operation == "delete":
         if config.has_section(section) and config.has_option(section, key):
             config.remove_option(section, key)
             file_modified = True
-            print(f"  ❌ {section}/{key} : Supprimé.")
+            print(f"  ❌ {section}/{key} : Supprimé.", file=out)
         else:
-            print(f"  ☑️ {section}/{key} : Clé non trouvée. Aucune suppression nécessaire.")
+            print(f"  ☑️ {section}/{key} : Clé non trouvée. Aucune suppression nécessaire.", file=out)
     
     # 3. Écrire le fichier si modifié
     if file_modified:
@@ -322,31 +373,36 @@ def update_song_file(filepath: str, operation: str, section: str, key: str, valu
     return False
 
 
-def mass_update_songs(directory_path: str, command_str: str, operation: str, file_extension: str = '.txt') -> int:
+def mass_update_songs(directory_path: str, command_str: str, operation: str, file_extension: str = '.txt',
+                      song_filenames: Optional[List[str]] = None, out=None) -> int:
     """
-    Applique la même opération (add/update/delete) à tous les fichiers de chansons.
+    Applique la même opération (add/update/delete) à tous les fichiers de chansons,
+    ou aux seuls song_filenames s'il est donné (résultat d'une requête --query).
+    Le compte-rendu est écrit dans out (sys.stdout par défaut).
     
     Retourne le nombre de fichiers modifiés.
     """
-    parsed_command = parse_command_arg(command_str)
+    parsed_command = parse_command_arg(command_str, out)
     if not parsed_command:
         return 0
     
     section, key, value = parsed_command
     modified_count = 0
     
-    print(f"\n--- Début de la mise à jour massive : Opération '{operation.upper()}' ---")
-    print(f"Cible : Section='{section}', Clé='{key}', Valeur='{value}'")
+    print(f"\n--- Début de la mise à jour massive : Opération '{operation.upper()}' ---", file=out)
+    print(f"Cible : Section='{section}', Clé='{key}', Valeur='{value}'", file=out)
+    if song_filenames is not None:
+        print(f"Restreinte aux {len(song_filenames)} chanson(s) de la requête", file=out)
 
-    for filename in os.listdir(directory_path):
-        if filename.endswith(file_extension):
+    for filename in sorted(os.listdir(directory_path)):
+        if filename.endswith(file_extension) and (song_filenames is None or filename in song_filenames):
             filepath = os.path.join(directory_path, filename)
-            print(f"\nTraitement du fichier : {filename}")
-            if update_song_file(filepath, operation, section, key, value):
+            print(f"\nTraitement du fichier : {filename}", file=out)
+            if update_song_file(filepath, operation, section, key, value, out):
                 modified_count += 1
 
-    print(f"\n--- Fin de la mise à jour ---")
-    print(f"{modified_count} fichier(s) modifié(s).")
+    print(f"\n--- Fin de la mise à jour ---", file=out)
+    print(f"{modified_count} fichier(s) modifié(s).", file=out)
     return modified_count
 
 
@@ -357,32 +413,111 @@ class MidiShowController:
     
     def __init__(self, config_file, mapping_file, test, verbose, veryverbose, update_mode, update_args):
         self.config = load_config(config_file)
+        self.mapping_file = mapping_file
         self.pc_map = load_mapping(mapping_file)
+        # tableau plat indexé par banque * 128 + programme : recherche O(1) même avec des milliers de chansons
+        self.program_index = midi_input.build_program_index(self.pc_map)
+        self.pc_numbers = sorted(self.pc_map)
+        self.use_bank_select = len(self.program_index) > midi_input.PROGRAMS_PER_BANK + 1
         self.test = test
         self.verbose = verbose | veryverbose
         self.veryverbose = veryverbose
         self.songs_dir = self.config.get("songs_directory", "song_sets")
+        # fichiers chansons et modèles, compilés une seule fois tant qu'ils ne sont pas modifiés
+        self.song_library = song_library.SongLibrary(self.songs_dir)
+        # index de recherche par titre / nom de fichier, construit une fois puis tenu à jour au chargement des chansons
+        self.song_index = song_search.SongSearchIndex()
+        # index inversé des commandes (SECTION/CLE = VALEUR -> chansons), pour --query et les mises à jour ciblées
+        self.command_index = song_query.SongCommandIndex()
+        # chanson -> numéro (cf. pc_mapping.json), pour rester dans la setlist quand c'est possible
+        self.song_numbers = {song_filename: song_number for song_number, song_filename in self.pc_map.items()}
+        self.index_songs()
         
-        self.midi_in = None
-        self.midi_out = None
-        self.midi_cq_out = None
+        self.midi_ins = []
+        self.output_ports = []
+        self.output_buffers = []    # buffer d'envoi de chaque sortie (partagé entre sorties d'un même port)
+        self.port_buffers = []      # un buffer par port physique
+        # horloge des envois temporisés (tap tempo) : remplacée par une horloge virtuelle en mode --render
+        self.clock = time.perf_counter
+        self.sleep = time.sleep
+        self.port_names = []        # nom (partie) de chaque port physique
         
-        self.input_name = self.config.get('midi_in_name_part')
-        self.input_channel = self.config.get('midi_in_channel', 1)
+        self.inputs = midi_input.get_midi_inputs_config(self.config)
+        self.input_clock = self.config.get('midi_in_clock', False)
+        self.cc_triggers, self.note_triggers = midi_input.parse_midi_triggers(self.config.get('midi_triggers', {}))
+        self.dispatch_tables = []
+        self.input_banks = [0] * len(self.inputs)  # banque courante (CC0/CC32) de chaque entrée
+        self.event_queue = midi_input.MidiEventQueue(self.config.get('duplicate_window_ms', 50) / 1000.0)
+        self.current_pc = None
+        self.clock_count = 0
+        self.clock_last_beat = None
+        self.clock_bpm = 0.0
         
-        self.cq_out_name = self.config.get('cq_out_name_part')
-        self.cq_midi_channel = self.config.get('cq_midi_channel', 1)
+        self.outputs = midi_output.get_midi_outputs_config(self.config)
+        self.encoding_groups = midi_output.group_outputs_by_encoding(self.outputs)
         self.cq_tap_tempo_softkey = self.config.get('cq_tap_tempo_softkey', '')
         self.name_to_cq_map = {
             v: k for k, v in self.config.get('channel_names', {}).items()            
         }
         
-        self.output_name = self.config.get('midi_out_name_part')
-        self.midronome_channel = self.config.get('midronome_channel', 16)
         self.pedal_map = self.config.get('pedals', {})
 
+        # Scènes de la CQ-18T dont le contenu est décrit (fichiers au format chanson, section [MIX])
+        self.scene_files = get_scene_files(self.config)
+        # sans scène déclarée par la chanson, rappel d'une scène choisi par le planificateur (cf. mix_planner)
+        self.cq_auto_scene = bool(self.config.get('cq_auto_scene', False))
+        self.scene_targets = {}     # canal -> {scène: cible compilée}
+        self.mix_states = {}        # canal -> état connu de la table (mix_planner.MixState)
+
+        # Synchronisation : décodage des NRPN émis par la CQ-18T quand l'ingé son bouge un fader
+        self.sync_ins = []
+        self.nrpn_decoders = []     # un décodeur par port de synchronisation : leurs flux ne se mélangent pas
+        self.sync_values = []       # par port de synchronisation : dernières valeurs NRPN en attente du thread principal
+        self.nrpn_names = cq18t.build_nrpn_name_table(tuple(self.config.get('channel_names', {}).keys()))
+        self.cq_to_name_map = {k.upper(): v for k, v in self.config.get('channel_names', {}).items()}
+
+        # Console interactive (--console) : programmes compilés mémorisés par ligne saisie (ordre d'utilisation, cf. live_console.CONSOLE_PROGRAM_CACHE_SIZE)
+        self.console_programs = {}
+        self.current_song = None
+        self.current_title = ''
+
+        # API HTTP/WebSocket locale (tablette), désactivée si "control_api" n'a pas de port
+        self.api_config = control_api.get_control_api_config(self.config)
+        self.control_api = None
+
+        # Entrée OSC sur UDP (rig de backing tracks), désactivée si "osc_input" n'a pas de port
+        self.osc_config = osc_input.get_osc_input_config(self.config)
+        self.osc_input = None
+
+        # Socket de contrôle Unix : le contrôleur lancé sert de démon au client léger (cf. control_socket)
+        self.socket_config = control_socket.get_control_socket_config(self.config)
+        self.control_socket = None
+        self.start_time = time.time()
+
+        # Métriques (format Prometheus) : simples compteurs incrémentés sans verrou, lus à l'export
+        self.metrics_config = metrics.get_metrics_config(self.config)
+        self.metrics_exporter = None
+        self.pc_received = [0] * len(self.inputs)
+        self.songs_executed = 0
+        self.song_change_latency = metrics.Histogram()
+        self.tap_tempo_lateness = metrics.Histogram()
+        self.pending_change_timestamp = None    # réception du dernier changement de chanson, jusqu'au premier envoi
+        self.memory_profiler = None             # mode --memprofile (cf. mem_profiler)
+        self.show = False                       # mode --show (cf. show_mode)
+        self.gc_monitor = None
+        self.allocation_check = None
+        # Processus d'E/S optionnel : les ports de sortie sont alors ouverts dans un processus dédié
+        self.io_worker_config = io_worker.get_io_worker_config(self.config)
+        self.io_worker = None
+        # Ordonnancement temps réel et affinité CPU du chemin de sortie (cf. realtime)
+        self.realtime_config = realtime.get_realtime_config(self.config)
+        self.report_config = setlist_report.get_report_config(self.config)     # mode --report
+        self.cpu_profiler = None                # mode --profile (cf. cpu_profiler)
+        self.stack_sampler = None               # mode --sample-stacks (cf. cpu_profiler)
+
         self.update_mode = update_mode
         self.update_args = update_args
+        self.query_strings = []     # critères --query : restreignent la mise à jour massive aux chansons trouvées
         
 
     def __enter__(self):
@@ -392,11 +527,31 @@ class MidiShowController:
         if self.update_mode in ("add", "delete", "update"):
             # Le contenu de args.add est la chaîne de commande (ex: "SONG_INFO/BPM = 45")
             # Notez que args.delete contient la chaîne de commande complète (ex: "SONG_INFO/BPM")
-            mass_update_songs(self.songs_dir, self.update_args, operation=self.update_mode)
+            song_filenames = None
+            if len(self.query_strings) > 0:
+                song_filenames = self.query_songs(self.query_strings)
+                if song_filenames is None:
+                    sys.exit(1)
+            mass_update_songs(self.songs_dir, self.update_args, operation=self.update_mode, song_filenames=song_filenames)
             sys.exit(0)
             
         else: # normal mode
+            # un contrôleur déjà lancé possède les ports : il se pilote par son socket (python control_socket.py)
+            if len(self.socket_config['path']) > 0 and control_socket.is_server_running(self.socket_config['path']):
+                print(f"/!/ Un contrôleur est déjà lancé (socket '{self.socket_config['path']}') : "
+                      f"utiliser 'python control_socket.py' pour le piloter.")
+                sys.exit(1)
             self.open_ports()
+            if self.show:
+                self.start_show_mode()
+            if self.api_config['port'] > 0:
+                self.start_control_api()
+            if self.osc_config['port'] > 0:
+                self.start_osc_input()
+            if len(self.socket_config['path']) > 0:
+                self.start_control_socket()
+            if self.metrics_config['port'] > 0 or len(self.metrics_config['textfile']) > 0:
+                self.start_metrics()
             return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -406,111 +561,293 @@ class MidiShowController:
     def open_ports(self):
         print("Initialisation des ports MIDI...")
         
-        # MIDI Input
-        self.midi_in = rtmidi.MidiIn()
-        try:
-            port_index, port_name = get_port_by_name(self.midi_in, self.input_name)
-            if port_index is not None:
-                self.midi_in.open_port(port_index)
-                print(f"- Port d'entrée ouvert: {port_name}")
-                # self.midi_in.ignore_types(timing=False)    # autorise la réception de la MIDI Clock
-                self.midi_in.set_callback(self.midi_callback)
-            else:
-                raise Exception(f"Interface MIDI de sortie '{self.input_name}' non trouvée.")
-        except Exception as e:
-            print(f"/!/ Erreur d'ouverture du port d'entrée MIDI ({self.input_name}): {e}")
-            self.close_ports()
-            sys.exit(1)        
-
-        # MIDI Output to the CQ mixer (specific MIDI interface)
-        if len(self.cq_out_name) > 0:
-            self.midi_cq_out = rtmidi.MidiOut()        
+        # MIDI Inputs : une callback par entrée, toutes alimentent la même file d'événements
+        for input_index, midi_in_config in enumerate(self.inputs):
+            name_part = midi_in_config['name_part']
+            midi_in = rtmidi.MidiIn()
             try:
-                port_index, port_name = get_port_by_name(self.midi_cq_out, self.cq_out_name)
+                port_index, port_name = get_port_by_name(midi_in, name_part)
                 if port_index is not None:
-                    self.midi_cq_out.open_port(port_index)
-                    print(f"- Port de sortie pour CQ ouvert: {port_name}")
+                    midi_in.open_port(port_index)
+                    print(f"- Port d'entrée ouvert: {port_name} (canal {midi_in_config['channel']})")
+                    # Filtrage au niveau rtmidi : la MIDI Clock n'est reçue que si 'midi_in_clock' est activé
+                    midi_in.ignore_types(sysex=True, timing=not self.input_clock, active_sense=True)
+                    self.dispatch_tables.append(self.build_dispatch_table(midi_in_config['channel']))
+                    self.midi_ins.append(midi_in)
+                    midi_in.set_callback(self.midi_callback, len(self.dispatch_tables) - 1)
                 else:
-                    raise Exception(f"Interface MIDI CQ de sortie '{self.cq_out_name}' non trouvée.")
+                    raise Exception(f"Interface MIDI d'entrée '{name_part}' non trouvée.")
             except Exception as e:
-                print(f"/!/ Erreur d'ouverture du port de sortie MIDI CQ ({self.cq_out_name}): {e}")
-                sys.exit(1)
-            
-        # MIDI Output to the other peripherals
-        if len(self.output_name) > 0:
-            self.midi_out = rtmidi.MidiOut()        
+                print(f"/!/ Erreur d'ouverture du port d'entrée MIDI ({name_part}): {e}")
+
+        if len(self.midi_ins) == 0:
+            print("/!/ Aucun port d'entrée MIDI n'a pu être ouvert.")
+            self.close_ports()
+            sys.exit(1)
+
+        # MIDI Outputs : un port physique partagé par plusieurs périphériques n'est ouvert qu'une fois
+        if self.io_worker_config['enabled']:
+            self.start_io_worker()
+        opened_ports = {}
+        for output in self.outputs:
+            port_part = output['port']
+            if port_part not in opened_ports and self.io_worker is not None:
+                # le port rtmidi est ouvert par le processus d'E/S, dans le même ordre
+                opened_ports[port_part] = midi_output.MidiOutputBuffer(self.io_worker.get_port(len(opened_ports)))
+                self.port_buffers.append(opened_ports[port_part])
+                self.port_names.append(port_part)
+            if port_part not in opened_ports:
+                midi_out = rtmidi.MidiOut()
+                try:
+                    port_index, port_name = get_port_by_name(midi_out, port_part)
+                    if port_index is not None:
+                        midi_out.open_port(port_index)
+                        opened_ports[port_part] = midi_output.MidiOutputBuffer(midi_out)
+                        self.port_buffers.append(opened_ports[port_part])
+                        self.port_names.append(port_part)
+                    else:
+                        raise Exception(f"Interface MIDI de sortie '{port_part}' non trouvée.")
+                except Exception as e:
+                    print(f"/!/ Erreur d'ouverture du port de sortie MIDI ({port_part}) pour '{output['name']}': {e}")
+                    self.close_ports()
+                    sys.exit(1)
+            self.output_ports.append(opened_ports[port_part].midi_out)
+            self.output_buffers.append(opened_ports[port_part])
+            print(f"- Port de sortie pour {output['name']} ({output['driver']}) ouvert: {port_part}")
+
+        # MIDI Inputs de synchronisation (optionnelles) : la table fonctionne sans
+        for output in self.outputs:
+            if len(output['sync_port']) == 0:
+                continue
+            sync_in = rtmidi.MidiIn()
             try:
-                port_index, port_name = get_port_by_name(self.midi_out, self.output_name)
+                port_index, port_name = get_port_by_name(sync_in, output['sync_port'])
                 if port_index is not None:
-                    self.midi_out.open_port(port_index)
-                    print(f"- Port de sortie pour Pédales ouvert: {port_name}")
+                    sync_in.open_port(port_index)
+                    sync_in.ignore_types(sysex=True, timing=True, active_sense=True)
+                    self.nrpn_decoders.append(cq18t.NrpnStreamDecoder())
+                    self.sync_values.append(midi_input.LatestValueStore())
+                    sync_in.set_callback(self.cq_sync_callback, len(self.nrpn_decoders) - 1)
+                    self.sync_ins.append(sync_in)
+                    print(f"- Port de synchronisation pour {output['name']} ouvert: {port_name}")
                 else:
-                    raise Exception(f"Interface MIDI de sortie '{self.output_name}' non trouvée.")
+                    raise Exception(f"Interface MIDI d'entrée '{output['sync_port']}' non trouvée.")
             except Exception as e:
-                print(f"/!/ Erreur d'ouverture du port de sortie MIDI ({self.output_name}): {e}")
-                sys.exit(1)
+                print(f"/!/ Synchronisation de '{output['name']}' désactivée ({output['sync_port']}): {e}")
         
 
+    def render_setlist(self, output_path):
+        """
+        Exécute toute la setlist (ordre de pc_mapping.json) sans matériel : chaque port de sortie est
+        une piste d'un fichier MIDI standard, écrite par le chemin d'envoi normal (compilation, buffers, flush).
+        Le temps est virtuel : tap tempo et pauses entre chansons sont datés sans attendre.
+        """
+        clock = smf_writer.VirtualClock()
+        port_parts = list(dict.fromkeys(output['port'] for output in self.outputs))
+        writer = smf_writer.SmfWriter(output_path, port_parts)
+        opened_ports = {}
+        for track_index, port_part in enumerate(port_parts, start=1):
+            opened_ports[port_part] = midi_output.MidiOutputBuffer(smf_writer.SmfTrackPort(writer, track_index, clock))
+            self.port_buffers.append(opened_ports[port_part])
+            self.port_names.append(port_part)
+        for output in self.outputs:
+            self.output_buffers.append(opened_ports[output['port']])
+        self.clock = clock.now
+        self.sleep = clock.sleep
+        self.test = False   # les messages sont écrits dans le fichier, jamais envoyés sur un port
+
+        for number in self.pc_numbers:
+            writer.add_marker(clock.now(), f"{number}: {self.pc_map[number]}")
+            self.execute_pc_commands(number - 1)
+            self.flush_outputs()
+            clock.sleep(smf_writer.RENDER_SONG_GAP_S)
+        writer.close()
+
+        sent_messages = sum(output_buffer.sent_messages for output_buffer in self.port_buffers)
+        print(f"\n- Setlist rendue dans '{output_path}' : {len(self.pc_numbers)} chansons, "
+              f"{sent_messages} messages sur {len(port_parts)} piste(s), {clock.now():.1f} s")
+
+    def report_setlist(self):
+        """
+        Estime le coût de chaque changement de chanson de la setlist (ordre de pc_mapping.json), sans matériel :
+        les transitions passent par le chemin d'envoi normal (compilation, planification du mix, buffers, flush)
+        vers des ports sans sortie, dans un temps virtuel (le tap tempo ne fait pas attendre).
+        Les compteurs de chaque port, relevés après chaque transition, sont analysés en une fois (cf. setlist_report).
+        """
+        start = time.perf_counter()
+        clock = smf_writer.VirtualClock()
+        port_parts = list(dict.fromkeys(output['port'] for output in self.outputs))
+        opened_ports = {}
+        for port_part in port_parts:
+            opened_ports[port_part] = midi_output.MidiOutputBuffer(setlist_report.NullPort())
+            self.port_buffers.append(opened_ports[port_part])
+            self.port_names.append(port_part)
+        for output in self.outputs:
+            self.output_buffers.append(opened_ports[output['port']])
+        self.clock = clock.now
+        self.sleep = clock.sleep
+        self.test = False   # les messages vont aux ports sans sortie, qui ne font que les compter
+
+        cumulative_messages = np.zeros((len(self.pc_numbers), len(port_parts)), dtype=np.int64)
+        cumulative_bytes = np.zeros((len(self.pc_numbers), len(port_parts)), dtype=np.int64)
+        tap_durations = np.zeros(len(self.pc_numbers))
+        errors = []
+        for i, number in enumerate(self.pc_numbers):
+            # les traces des transitions (chanson chargée, messages) ne font pas partie du rapport, leurs erreurs si
+            # (commande CQ ou pédale non exécutée...) : elles sont relevées et rattachées à la transition
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                transition_start = clock.now()
+                self.execute_pc_commands(number - 1)
+                self.flush_outputs()
+                tap_durations[i] = clock.now() - transition_start
+            errors.append(setlist_report.extract_errors(output.getvalue()))
+            for p, output_buffer in enumerate(self.port_buffers):
+                cumulative_messages[i, p] = output_buffer.sent_messages
+                cumulative_bytes[i, p] = output_buffer.sent_bytes
+
+        budget_s = self.report_config['latency_budget_ms'] / 1000
+        analysis = setlist_report.analyze_transitions(cumulative_messages, cumulative_bytes, tap_durations, budget_s)
+        transition_names = [f"{number}: {self.pc_map[number]}" for number in self.pc_numbers]
+        print(f"\n- Coût des changements de chanson (temps sur le câble à 31250 bauds, budget {budget_s * 1000:g} ms) :")
+        for line in setlist_report.format_report(transition_names, port_parts, analysis, budget_s, errors):
+            print(line)
+        print(f"- Rapport calculé en {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def preload_setlist(self):
+        """
+        Charge et compile toute la setlist et les scènes : commandes fusionnées, cibles [MIX] de chaque
+        CQ-18T, programmes [PEDALS]. Un changement de chanson ne fait ensuite plus ni lecture ni compilation.
+        Retourne le nombre de chansons préchargées.
+        """
+        preloaded = 0
+        for song_filename in self.pc_map.values():
+            song_data = load_song_file(song_filename, self.song_library)
+            if song_data is None:
+                continue
+            for channel, output_indexes in self.get_output_groups('cq18t'):
+                self.song_library.get_mix_target(song_data, channel, self.compile_mix_target)
+                self.get_scene_targets(channel)
+            if 'PEDAL_PROGRAM' not in song_data:
+                song_data['PEDAL_PROGRAM'] = self.compile_pedal_commands(song_data['PEDAL_COMMANDS'])
+            preloaded += 1
+        return preloaded
+
+    def start_show_mode(self):
+        """Précharge la setlist, fige les fichiers chansons, gèle le tas et mesure allocations et pauses du GC."""
+        preloaded = self.preload_setlist()
+        self.song_library.frozen = True
+        self.gc_monitor = show_mode.GcPauseMonitor()
+        self.allocation_check = show_mode.TransitionAllocationCheck(self.gc_monitor)
+        frozen_objects = show_mode.freeze_heap()
+        self.gc_monitor.start()
+        print(f"- Mode show : {preloaded} chansons préchargées, {frozen_objects} objets gelés, "
+              f"seuils du ramasse-miettes {gc.get_threshold()} (fichiers chansons figés jusqu'à l'arrêt)")
+
+    def start_realtime(self):
+        """
+        Passe le thread principal (réception des événements, planification et envoi des messages) en temps réel.
+        Appelé juste avant la boucle principale, une fois les autres threads lancés, pour qu'ils n'en héritent pas.
+        """
+        if self.test or not realtime.is_realtime_enabled(self.realtime_config):
+            return
+        print(f"- Temps réel du thread principal : {realtime.apply_realtime(self.realtime_config)}")
+
+    def start_io_worker(self):
+        """Lance le processus d'E/S qui possède les ports de sortie (cf. io_worker)."""
+        port_parts = list(dict.fromkeys(output['port'] for output in self.outputs))
+        self.io_worker = io_worker.IoWorker(port_parts, self.io_worker_config['ring_bytes'], self.realtime_config)
+        try:
+            self.io_worker.start()
+        except Exception as e:
+            print(f"/!/ Erreur de démarrage du processus d'E/S MIDI : {e}")
+            self.io_worker = None
+            self.close_ports()
+            sys.exit(1)
+
     def close_ports(self):
+        if self.control_api is not None:
+            self.control_api.stop()
+        if self.osc_input is not None:
+            self.osc_input.stop()
+        if self.control_socket is not None:
+            self.control_socket.stop()
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.stop()
+        if self.memory_profiler is not None:
+            self.memory_profiler.stop()
+        if self.gc_monitor is not None:
+            self.gc_monitor.stop()
+            print(f"- Show : {self.allocation_check.describe()}")
+            print(f"- Show : ramasse-miettes, {self.gc_monitor.describe()}")
+        if self.stack_sampler is not None:
+            self.stack_sampler.stop()
         if self.update_mode == "":
-            if self.midi_in: self.midi_in.close()
-            if self.midi_cq_out: self.midi_cq_out.close()
-            if self.midi_out: self.midi_out.close()
+            for midi_in in self.midi_ins: midi_in.close()
+            for sync_in in self.sync_ins: sync_in.close()
+            for midi_out in set(self.output_ports): midi_out.close()
+            if self.io_worker is not None:
+                self.io_worker.stop()
             print("\nPorts MIDI fermés.")
 
-    def send_midi(self, midi_output, midi_messages, description):
-        """Envoie un ou plusieurs messages MIDI et affiche si verbeux."""
-        
-        for msg in midi_messages:
-            
-            midi_chunks = utilities.split_list_into_chunks(msg)
-            for chunk in midi_chunks:
-        
-                if self.verbose:
-                    # Formatage de l'affichage: Time, Canal, Type de message, Description
-                    msg_type = (chunk[0] & 0xF0)
-                    channel = (chunk[0] & 0x0F) + 1
-                    
-                    if msg_type == 0xC0:
-                        msg_desc = f"PC {utilities.dec_to_aligned_hex(chunk[1])}"
-                    elif msg_type == 0x80:
-                        msg_desc = f"Note Off {utilities.dec_to_aligned_hex(chunk[1])} {utilities.dec_to_aligned_hex(chunk[2])} "
-                    elif msg_type == 0x90:
-                        msg_desc = f"Note On {utilities.dec_to_aligned_hex(chunk[1])} {utilities.dec_to_aligned_hex(chunk[2])} "
-                    elif msg_type == 0xB0 and chunk[1] in [0x60, 0x61, 0x62, 0x63, 0x06, 0x26]:
-                        msg_desc = f"NRPN: {hex(msg_type)} {utilities.dec_to_aligned_hex(chunk[1])} {utilities.dec_to_aligned_hex(chunk[2])}"
-                    elif msg_type == 0xB0:
-                        msg_desc = f"CC{chunk[1]}={utilities.dec_to_aligned_hex(chunk[2])}"
-                    else:
-                        msg_desc = f"Raw: {chunk}"
-                    
-                    print(f"[{time.strftime('%H:%M:%S')}] CH {channel:<2} | {msg_desc:<20} | {description}")
-
-                
-                if self.test == False:
-                    try:
-                        midi_output.send_message(chunk)
-                    except Exception as e:
-                        print(f"/!/ Erreur d'envoi du message MIDI ({chunk}): {e}")               
-                
+    def get_output_groups(self, driver):
+        """Retourne la liste des (canal, index des sorties) partageant le même encodage pour un driver."""
+        return [
+            (channel, output_indexes)
+            for (group_driver, channel), output_indexes in self.encoding_groups.items()
+            if group_driver == driver
+        ]
+
+    def send_program(self, output_indexes, program):
+        """
+        Ajoute un programme compilé [(octets MIDI, description), ...] au buffer d'envoi
+        de toutes les sorties d'un groupe. Les octets ne partent qu'au prochain flush_outputs().
+        """
+        for midi_msg, desc in program:
+            if self.verbose:
+                self.print_midi(midi_msg, desc)
+            for output_index in output_indexes:
+                # un buffer plein se vide en cours de transition : même règle qu'au flush (rien n'est envoyé en mode test)
+                self.output_buffers[output_index].write(midi_msg, send=not self.test)
+
+    def flush_outputs(self):
+        """Envoie le contenu des buffers de tous les ports (en mode test, les buffers sont seulement vidés)."""
+        for output_buffer in self.port_buffers:
+            output_buffer.flush(send=not self.test)
+        if self.pending_change_timestamp is not None:
+            # latence d'un changement de chanson : de la réception au premier envoi (mix et pédales)
+            self.song_change_latency.observe(time.perf_counter() - self.pending_change_timestamp)
+            self.pending_change_timestamp = None
+
+    def print_midi(self, midi_data, description):
+        """Affiche chaque message MIDI contenu dans midi_data (mode verbeux)."""
+        for status, midi_msg in utilities.iter_midi_messages(midi_data):
+            # Formatage de l'affichage: Time, Canal, Type de message, Description
+            channel = (status & 0x0F) + 1
+            msg_desc = midi_output.describe_midi_message(bytes((status,)) + midi_msg if midi_msg[0] != status else midi_msg)
+            print(f"[{time.strftime('%H:%M:%S')}] CH {channel:<2} | {msg_desc:<20} | {description}")
 
     def send_tap_tempo(self, bpm_str):
         
         TAPTEMPO_COUNT = 4
         
-        """Simule le Tap Tempo sur le CQ-18T en envoyant 20 SoftKey Note On/Off."""
+        """Simule le Tap Tempo sur chaque CQ-18T en envoyant des SoftKey Note On/Off."""
 
         bpm = float(bpm_str)        
         if bpm <= 0: return
         if self.verbose:
             print(f"tap tempo - bpm = {bpm}")
         
-        channel = self.cq_midi_channel - 1 
         tap_tempo_softkey = self.cq_tap_tempo_softkey 
 
-        midi_msg = cq18t.cq_get_midi_tap_tempo(self.cq_midi_channel, tap_tempo_softkey)
+        # un seul message par canal, envoyé à toutes les CQ-18T de ce canal
+        tap_programs = []
+        for channel, output_indexes in self.get_output_groups('cq18t'):
+            midi_msg = cq18t.cq_get_midi_tap_tempo(channel, tap_tempo_softkey)
+            if len(midi_msg) > 0:
+                tap_programs.append((output_indexes, midi_msg))
         
-        if midi_msg == []:
+        if len(tap_programs) == 0:
             return
             
 
@@ -521,13 +858,22 @@ class MidiShowController:
         if self.verbose:
             print(f"= Envoi du Tap Tempo ({bpm} BPM) au CQ18-T, {TAPTEMPO_COUNT} frappes)...")
 
+        # tout ce qui précède le tap tempo doit être parti avant la première frappe
+        self.flush_outputs()
+
+        # frappes calées sur l'heure de la première : les retards ne s'accumulent pas
+        first_tap = self.clock()
         i = 0
         for i in range(TAPTEMPO_COUNT): # X frappes pour une bonne précision
-            self.send_midi(self.midi_cq_out, [midi_msg], f"CQ18T Tap Tempo {i} {bpm}")
+            for output_indexes, midi_msg in tap_programs:
+                self.send_program(output_indexes, [(midi_msg, f"CQ18T Tap Tempo {i} {bpm}")])
+            self.flush_outputs()
+            if i > 0:
+                self.tap_tempo_lateness.observe(max(0.0, self.clock() - (first_tap + i * interval)))
             
             # Attendre l'intervalle du tempo
             if i < TAPTEMPO_COUNT-1:
-                time.sleep(interval) 
+                self.sleep(max(0.0, first_tap + (i + 1) * interval - self.clock()))
 
         if self.verbose:
             print("Tap Tempo terminé.")
@@ -547,94 +893,162 @@ class MidiShowController:
         bpm_msb = int(bpm / 128)
         bpm_lsb = int(bpm % 128)
         
-        channel = self.midronome_channel - 1 
-#        midi_msg = [0xB0 | channel, 0x57, (int(bpm)-60)]
-        midi_msg = [0xB0 | channel, 0x55, int(bpm_msb), 0xB0 | channel, 0x56, int(bpm_lsb)]
-        self.send_midi(self.midi_out, [midi_msg], f"Midronome BPM (CC) {bpm}")
+        for midronome_channel, output_indexes in self.get_output_groups('midronome'):
+            channel = midronome_channel - 1 
+#            midi_msg = [0xB0 | channel, 0x57, (int(bpm)-60)]
+            midi_msg = bytes((0xB0 | channel, 0x55, int(bpm_msb), 0xB0 | channel, 0x56, int(bpm_lsb)))
+            self.send_program(output_indexes, [(midi_msg, f"Midronome BPM (CC) {bpm}")])
+
+    def compile_mix_commands(self, midi_channel, mix_commands):
+        """Compile les commandes [MIX] en messages NRPN pour une CQ-18T sur le canal donné."""
+        program = []
+        for command in mix_commands:
+            try:
+                if '=' in command:
+                    key, value = command.split('=', 1)
+                    intelligible_command = f"{key.replace('/', '/')}/{value}"
+                else:
+                    intelligible_command = command
+            
+                messages, desc = parse_mix_command(midi_channel, intelligible_command, self.name_to_cq_map)
+                program.append((messages, desc))
         
+            except Exception as e:
+                print(f"/!/ Commande CQ non exécutée: {e}")
+        return program
+
+    def compile_pedal_commands(self, pedal_commands):
+        """Compile les commandes [PEDALS] en messages PC/CC (les canaux sont ceux de la table des pédales)."""
+        program = []
+        for command_line in pedal_commands:
+            try:
+                # Le format de fichier PEDALS utilise 'Delay_M=PC/5'
+                pedal_name, command = command_line.split('/', 1)
+                pedal_name = pedal_name.strip()
+                command = command.strip()
+                
+                midi_msg, desc = parse_pedal_command(pedal_name, command, self.pedal_map)
+                if len(midi_msg) == 0:
+                    print(f"/!/ {desc}")
+                else:
+                    program.append((midi_msg, desc))
+            except Exception as e:
+                print(f"/!/ Commande Pédale non exécutée: {e}")
+        return program
+
+    def get_scene_targets(self, midi_channel):
+        """Compile (une seule fois par canal) le contenu des scènes décrites dans 'cq_scenes'."""
+        if midi_channel not in self.scene_targets:
+            scene_targets = {}
+            for scene_id, scene_filename in self.scene_files.items():
+                scene_data = load_song_file(scene_filename, self.song_library)
+                if scene_data is None:
+                    continue
+                scene_targets[scene_id] = dict(self.song_library.get_mix_target(scene_data, midi_channel, self.compile_mix_target))
+            self.scene_targets[midi_channel] = scene_targets
+        return self.scene_targets[midi_channel]
+
+    def compile_mix_target(self, midi_channel, mix_commands):
+        """Compile les commandes [MIX] d'un fichier en cible pour le planificateur (cf. mix_planner.build_mix_target)."""
+        return mix_planner.build_mix_target(self.compile_mix_commands(midi_channel, mix_commands))
+
+    def execute_mix_plan(self, midi_channel, output_indexes, song_data, scene_id):
+        """Choisit le plan le moins coûteux (full, delta, scene+delta) pour un groupe de CQ-18T et l'envoie."""
+        # la chanson et ses modèles sont compilés séparément, une seule fois chacun
+        target = self.song_library.get_mix_target(song_data, midi_channel, self.compile_mix_target)
+        scenes = self.get_scene_targets(midi_channel)
+        state = self.mix_states.setdefault(midi_channel, mix_planner.MixState())
+
+        plan = mix_planner.plan_mix_transition(state, target, scene_id, scenes, self.cq_auto_scene)
+        costs = ', '.join(f"{plan_name}={cost}" for plan_name, cost in plan['costs'].items())
+        scene_desc = f" (scène {plan['scene']})" if plan['scene'] is not None else ''
+        print(f"Plan CQ-18T canal {midi_channel} : {plan['plan']}{scene_desc}, {len(plan['commands'])} NRPN, {plan['bytes']} octets [{costs}]")
+
+        if plan['scene'] is not None:
+            scene_msg = cq18t.cq_get_midi_msg_set_scene(midi_channel, plan['scene'])
+            self.send_program(output_indexes, [(scene_msg, f"Scene {plan['scene']}")])
+        self.send_program(output_indexes, [(midi_msg, desc) for param, (value, midi_msg, desc) in plan['commands']])
+        mix_planner.apply_plan(state, plan, scenes)
 
     def execute_commands(self, song_data):
-        """Exécute toutes les commandes pour la chanson chargée."""
+        """
+        Exécute toutes les commandes pour la chanson chargée.
+        Chaque groupe de sorties identiques (même driver, même canal) n'est compilé qu'une seule fois,
+        puis le programme obtenu est envoyé à toutes les sorties du groupe.
+        """
         
-        #print(f"DEBUG song_data['BPM'] = {song_data['BPM']}")
-
         # 2. Commandes CQ-18T (NRPN)
-        if len(song_data['MIX_COMMANDS']) > 0:
+        scene_id = get_song_scene(song_data)
+        if len(song_data['MIX_COMMANDS']) > 0 or scene_id is not None:
             print("\n--- Exécution des Commandes CQ-18T ---")
-            #print(self.name_to_cq_map)
-    
-            for command in song_data['MIX_COMMANDS']:
-                #print(command)
-                try:
-                    if '=' in command:
-                        key, value = command.split('=', 1)
-                        intelligible_command = f"{key.replace('/', '/')}/{value}"
-                    else:
-                        intelligible_command = command
-                
-                    # NOUVEAU: Appel avec le mappage de noms
-                    messages, desc = parse_mix_command(self.cq_midi_channel, intelligible_command, self.name_to_cq_map)
-                    # print(f"DEBUG execute_commands: messages = {messages} - desc = {desc}")
-                    
-                    self.send_midi(self.midi_cq_out, [messages], desc)
-            
-                except Exception as e:
-                    print(f"/!/ Commande CQ non exécutée: {e}")
-
-        #print(f"DEBUG 2 song_data['BPM'] = {song_data['BPM']}")
+            for channel, output_indexes in self.get_output_groups('cq18t'):
+                self.execute_mix_plan(channel, output_indexes, song_data, scene_id)
 
         # 3. Commandes Pédales d'Effets (PC/CC)
         if len(song_data['PEDAL_COMMANDS']) > 0:
             print("\n--- Exécution des Commandes Pédales d'Effets ---")
-            for command_line in song_data['PEDAL_COMMANDS']:
-                try:
-                    # Le format de fichier PEDALS utilise 'Delay_M=PC/5'
-                    pedal_name, command = command_line.split('/', 1)
-                    pedal_name = pedal_name.strip()
-                    command = command.strip()
-                    
-                    messages, desc = parse_pedal_command(pedal_name, command, self.pedal_map)
-                        
-                    self.send_midi(self.midi_out, messages, desc)
-                except Exception as e:
-                    print(f"/!/ Commande Pédale non exécutée: {e}")
+            # compilé une fois par chanson : le programme est gardé avec les commandes (cache de song_library)
+            program = song_data.get('PEDAL_PROGRAM')
+            if program is None:
+                program = song_data['PEDAL_PROGRAM'] = self.compile_pedal_commands(song_data['PEDAL_COMMANDS'])
+            for channel, output_indexes in self.get_output_groups('pedals'):
+                self.send_program(output_indexes, program)
             
             print("\n--- Exécution du set de commandes terminée ---")
 
-        #print(f"DEBUG 3 song_data['BPM'] = {song_data['BPM']}")
-    
         # 1. Gestion du BPM (Metronome et Tap Tempo CQ)
         if len(song_data['SONG_COMMANDS']) > 0:
             print("\n--- Exécution des Commandes Générales ---")
-            for command_line in song_data['SONG_COMMANDS']:
-                try:
-                    # Le format de fichier PEDALS utilise 'Delay_M=PC/5'
-                    song_param, value = command_line.split('/', 1)
-                    song_param = song_param.strip()
-                    value = value.strip()
-                    
-                    if song_param == 'bpm':
-                        print(f"BPM de la chanson: {value}")
-                        self.set_midronome_bpm(value)
-                        self.send_tap_tempo(value)
-                        
-                except Exception as e:
-                    print(f"/!/ Commande Générale non exécutée: {e}")
-            
+            self.execute_song_commands(song_data['SONG_COMMANDS'])
             print("\n--- Exécution du set de commandes générales terminée ---")
+
+        self.flush_outputs()
+
+    def execute_song_commands(self, song_commands):
+        """Exécute les commandes [SONG_INFO] (BPM du Midronome et tap tempo CQ)."""
+        for command_line in song_commands:
+            try:
+                # Le format de fichier PEDALS utilise 'Delay_M=PC/5'
+                song_param, value = command_line.split('/', 1)
+                song_param = song_param.strip()
+                value = value.strip()
+                
+                if song_param == 'bpm':
+                    print(f"BPM de la chanson: {value}")
+                    self.set_midronome_bpm(value)
+                    self.send_tap_tempo(value)
+                    
+            except Exception as e:
+                print(f"/!/ Commande Générale non exécutée: {e}")
                 
 
     def execute_pc_commands(self, pc_number):
         """Charge et exécute le set de commandes pour le numéro PC reçu."""
         
-        if pc_number+1 not in self.pc_map:
-            print(f"/!/ PC {pc_number} non mappé à une chanson. Ignoré.")
+        if pc_number < 0:
+            print(f"/!/ Numéro de PC {pc_number} hors plage. Ignoré.")
+            return
+        bank, program = divmod(pc_number, midi_input.PROGRAMS_PER_BANK)
+        pc_desc = f"PC {program} (banque {bank})" if bank > 0 else f"PC {program}"
+        song_filename = self.program_index[pc_number+1] if pc_number+1 < len(self.program_index) else None
+        if song_filename is None:
+            print(f"/!/ {pc_desc} non mappé à une chanson. Ignoré.")
             return
 
-        song_filename = self.pc_map[pc_number+1]
-        print(f"\n- Mappage trouvé : PC {pc_number} -> Fichier '{song_filename}'")
-        
-        song_data = load_song_file(song_filename, self.songs_dir)
+        self.current_pc = pc_number
+        print(f"\n- Mappage trouvé : {pc_desc} -> Fichier '{song_filename}'")
+        if self.cpu_profiler is not None:
+            self.cpu_profiler.run(f"{pc_desc} -> '{song_filename}'", self.execute_song_file, song_filename)
+        else:
+            self.execute_song_file(song_filename)
+
+    def execute_song_file(self, song_filename):
+        """Charge et exécute le set de commandes d'un fichier de chanson."""
+        song_data = load_song_file(song_filename, self.song_library)
+        self.current_song = song_filename
+        self.songs_executed += 1
+        if song_data is not None:
+            self.current_title = get_song_title(song_data)
 
         print(song_data)
         try:
@@ -643,50 +1057,510 @@ class MidiShowController:
         except Exception as e:
             print(f"Unexpected {e=}, {type(e)=}")
 
+        if song_data is not None:
+            # après l'envoi des messages MIDI : la chanson a pu être modifiée depuis son indexation
+            self.index_song(song_filename, song_data)
+
+    def index_song(self, song_filename, song_data):
+        """
+        Met à jour les index de recherche pour une chanson, seulement si song_library l'a relue ou recompilée
+        depuis la dernière indexation (ses commandes sont alors un nouvel objet, sans la marque 'INDEXED').
+        """
+        if song_data.get('INDEXED', False):
+            return
+        self.song_index.add_song(song_filename, get_song_title(song_data))
+        self.command_index.update_song(song_filename, song_data['SECTIONS'])
+        song_data['INDEXED'] = True
+
+    def index_songs(self, out=None):
+        """
+        Indexe les titres, noms et commandes de tous les fichiers de chansons du répertoire (une seule lecture au démarrage).
+        Les deux index sont ensuite tenus à jour quand une chanson chargée a été modifiée (cf. index_song).
+        """
+        try:
+            song_filenames = [filename for filename in os.listdir(self.songs_dir) if filename.endswith('.txt')]
+        except OSError as e:
+            print(f"/!/ Répertoire des chansons '{self.songs_dir}' illisible : {e}", file=out)
+            return
+        # fichiers supprimés depuis la dernière indexation (rechargement par le socket de contrôle)
+        for song_filename in set(self.command_index.song_ids) - set(song_filenames):
+            self.song_index.remove_song(song_filename)
+            self.command_index.remove_song(song_filename)
+        for song_filename in song_filenames:
+            try:
+                self.index_song(song_filename, self.song_library.get_song_data(song_filename))
+            except Exception as e:
+                print(f"/!/ Chanson '{song_filename}' non indexée : {e}", file=out)
+
+    def query_songs(self, query_strings, out=None):
+        """
+        Affiche et retourne les chansons qui vérifient tous les critères 'SECTION/CLE[ = VALEUR]' (cf. song_query),
+        ou None si un critère est invalide.
+        """
+        terms = [song_query.parse_query_term(query_string, out) for query_string in query_strings]
+        if None in terms:
+            return None
+        song_filenames = self.command_index.query(terms)
+        print(f"\n- Requête {' ET '.join(query_strings)} : {len(song_filenames)} chanson(s)", file=out)
+        for song_filename in song_filenames:
+            values = ', '.join(f"{term[0]}/{term[1]} = {self.command_index.get_value(song_filename, term[0], term[1])}"
+                               for term in dict.fromkeys(term[:2] for term in terms))
+            print(f"  {song_filename} ({values})", file=out)
+        return song_filenames
+
+    def goto_song(self, query):
+        """Charge la chanson dont le titre ou le nom de fichier est le plus proche de la saisie."""
+        song_filename = self.song_index.find_best(query)
+        if song_filename is None:
+            print(f"/!/ Aucune chanson ne correspond à '{query}'.")
+            return
+        if song_filename in self.song_numbers:
+            self.execute_pc_commands(self.song_numbers[song_filename] - 1)
+        else:
+            print(f"\n- Chanson hors setlist : '{query}' -> Fichier '{song_filename}'")
+            self.execute_song_file(song_filename)
+
+    def execute_trigger_action(self, action):
+        """Exécute une action déclenchée par un CC ou une Note (cf. 'midi_triggers')."""
+        if action == 'revert':
+            if self.current_pc is None:
+                print("/!/ Revert demandé mais aucune chanson n'a encore été chargée. Ignoré.")
+                return
+            # l'état de la table a pu être modifié à la main : on l'oublie pour tout renvoyer
+            self.mix_states.clear()
+            self.execute_pc_commands(self.current_pc)
+            return
+
+        step = 1 if action == 'next_song' else -1
+        current = None if self.current_pc is None else self.current_pc + 1
+        next_pc = midi_input.get_adjacent_pc(self.pc_numbers, current, step)
+        if next_pc is None:
+            print(f"/!/ Action '{action}' : pas de chanson disponible. Ignorée.")
+            return
+        self.execute_pc_commands(next_pc - 1)
+
+    def build_dispatch_table(self, midi_channel):
+        """
+        Construit la table de dispatch (256 entrées indexées par le status byte) pour un canal d'entrée.
+        Les CC ne sont traités que si des triggers ou des banques (pc_mapping.json) sont configurés,
+        les Notes que si des triggers sont configurés, la Clock que si elle est activée.
+        """
+        has_cc = any(action is not None for action in self.cc_triggers)
+        has_note = any(action is not None for action in self.note_triggers)
+        return midi_input.build_dispatch_table(
+            midi_channel,
+            on_program_change=self.on_program_change,
+            on_control_change=self.on_control_change if has_cc or self.use_bank_select else None,
+            on_note_on=self.on_note_on if has_note else None,
+            on_clock=self.on_clock if self.input_clock else None
+        )
+
+    def on_program_change(self, midi_data, source):
+        self.pc_received[source] += 1
+        # numéro de chanson (0-based) : banque courante de l'entrée * 128 + programme
+        self.event_queue.push(time.perf_counter(), source, ('pc', (self.input_banks[source] << 7) | midi_data[1]))
+
+    def on_control_change(self, midi_data, source):
+        if midi_data[1] == midi_input.MIDI_CC_BANK_SELECT_MSB:
+            self.input_banks[source] = (midi_data[2] << 7) | (self.input_banks[source] & 0x7F)
+            return
+        if midi_data[1] == midi_input.MIDI_CC_BANK_SELECT_LSB:
+            self.input_banks[source] = (self.input_banks[source] & 0x3F80) | midi_data[2]
+            return
+        action = self.cc_triggers[midi_data[1]]
+        # un footswitch envoie 127 à l'appui et 0 au relâchement : on ne déclenche qu'à l'appui
+        if action is not None and midi_data[2] > 0:
+            self.event_queue.push(time.perf_counter(), source, ('action', action))
+
+    def on_note_on(self, midi_data, source):
+        action = self.note_triggers[midi_data[1]]
+        # une Note On de vélocité nulle équivaut à une Note Off
+        if action is not None and midi_data[2] > 0:
+            self.event_queue.push(time.perf_counter(), source, ('action', action))
+
+    def on_clock(self, midi_data, source):
+        # 24 impulsions par noire : on ne calcule le tempo qu'une fois par temps
+        self.clock_count += 1
+        if self.clock_count < 24:
+            return
+        self.clock_count = 0
+        now = time.perf_counter()
+        if self.clock_last_beat is not None:
+            self.clock_bpm = 60.0 / (now - self.clock_last_beat)
+            if self.veryverbose:
+                print(f"[{time.strftime('%H:%M:%S')}] MIDI Clock : {self.clock_bpm:.1f} BPM")
+        self.clock_last_beat = now
+
     def midi_callback(self, message, data=None):
-        """Gère la réception des messages MIDI (appelé par rtmidi)."""
+        """Gère la réception des messages MIDI (appelé par rtmidi). data est l'index de l'entrée MIDI."""
         midi_data, delta_time = message
         
-        message_type = midi_data[0] & 0xF0
-        channel_received = (midi_data[0] & 0x0F) + 1 # 1-16
-        
-        if self.veryverbose:
+        if self.veryverbose and midi_data[0] != midi_input.MIDI_CLOCK:
             try:
-                print(f"[{time.strftime('%H:%M:%S')}] Received MIDI command {utilities.declist_to_hexlist(midi_data)} ")
-            #print(f"DEBUG Rx on channel {channel_received} - waiting commands on channel {self.input_channel}")
+                print(f"[{time.strftime('%H:%M:%S')}] Received MIDI command {utilities.declist_to_hexlist(midi_data)} from input {data}")
             except Exception as e:
                 print(f"/!/ erreur : declist_to_hexlist {e}")
         
-        # Vérifie si c'est un Program Change sur le canal d'entrée spécifié
-        if (message_type == 0xC0 and
-            channel_received == self.input_channel):
-            
-            pc_number = midi_data[1]
-            if self.verbose:
-                print(f"[{time.strftime('%H:%M:%S')}] Received PC command {pc_number}")
-            self.execute_pc_commands(pc_number)
+        # Un seul accès indexé par le status byte : les messages non gérés sont ignorés immédiatement
+        handler = self.dispatch_tables[data][midi_data[0]]
+        if handler is not None:
+            handler(midi_data, data)
+
+    def cq_sync_callback(self, message, data=None):
+        """
+        Reçoit la sortie MIDI d'une CQ-18T (appelé par rtmidi, data = index du port de synchronisation).
+        Les NRPN complets sont gardés dans le store du port (dernière valeur par paramètre) : l'état connu
+        de la table n'est modifié que par le thread principal, qui le parcourt pour planifier les transitions.
+        Un seul événement de réveil est déposé tant que le store n'a pas été vidé : un balayage de fader
+        ne fait pas attendre un Program Change derrière des centaines d'événements périmés.
+        """
+        midi_data, delta_time = message
+        nrpn = self.nrpn_decoders[data].feed(midi_data)
+        if nrpn is not None:
+            channel, param, value = nrpn
+            if self.sync_values[data].put((channel, param), value):
+                self.event_queue.push(time.perf_counter(), 'sync', ('nrpn', data), deduplicate=False)
+
+    def apply_sync_nrpn(self, sync_index):
+        """Met à jour l'état connu des tables avec les NRPN en attente d'un port de synchronisation (thread principal)."""
+        for (channel, param), value in self.sync_values[sync_index].take().items():
+            state = self.mix_states.setdefault(channel, mix_planner.MixState())
+            if len(self.encoding_groups.get(('cq18t', channel), [])) > 1:
+                # plusieurs tables partagent ce canal : celle qui a bougé diffère désormais des autres
+                state.forget_param(param)
+            else:
+                state.set_param(param, value)
+
+            if self.veryverbose:
+                action = self.nrpn_names[param][0] if param in self.nrpn_names else ''
+                print(f"[{time.strftime('%H:%M:%S')}] CQ-18T canal {channel} : {self.describe_nrpn(param)} = {cq18t.describe_vcvf_value(action, value)}")
+
+    def describe_nrpn(self, param):
+        """Retourne le nom lisible d'un paramètre NRPN (ex: CHANT_EMILIE/send/FACADE)."""
+        if param not in self.nrpn_names:
+            return f"NRPN {utilities.dec_to_aligned_hex(param)}"
+        action, channel_name, bus_name = self.nrpn_names[param]
+        channel_name = self.cq_to_name_map.get(channel_name, channel_name)
+        if len(bus_name) > 0:
+            return f"{channel_name}/{action}/{self.cq_to_name_map.get(bus_name, bus_name)}"
+        return f"{channel_name}/{action}"
+
+    def compile_console_command(self, command_type, command):
+        """
+        Compile une ligne [MIX] ou [PEDALS] de la console pour chaque groupe de sorties concerné.
+        Retourne [(index des sorties, programme, canal CQ-18T ou None)].
+        """
+        compiled = []
+        if command_type == 'pedal':
+            program = self.compile_pedal_commands([command])
+            for channel, output_indexes in self.get_output_groups('pedals'):
+                compiled.append((output_indexes, program, None))
+        else:
+            for channel, output_indexes in self.get_output_groups('cq18t'):
+                program = [(midi_msg, desc) for midi_msg, desc in self.compile_mix_commands(channel, [command]) if len(midi_msg) > 0]
+                compiled.append((output_indexes, program, channel))
+        return compiled
+
+    def execute_console_line(self, line):
+        """Exécute une ligne saisie dans la console (appelé par le thread principal, cf. process_events)."""
+        command_type, command = live_console.parse_console_line(line, self.pedal_map)
+        if command_type == '':
+            return
+        if command_type == 'error':
+            print(f"/!/ {command}")
+        elif command_type == 'help':
+            print(live_console.CONSOLE_HELP)
+        elif command_type == 'quit':
+            print("\nArrêt demandé depuis la console.")
+            sys.exit(0)
+        elif command_type == 'load':
+            self.goto_song(command)
+        elif command_type == 'song':
+            self.execute_song_commands([command])
+            self.flush_outputs()
+        else:
+            # une ligne déjà saisie (ou rappelée par l'historique) n'est pas recompilée
+            key = (command_type, command)
+            programs = self.console_programs.pop(key, None)
+            if programs is None:
+                programs = self.compile_console_command(command_type, command)
+                if len(self.console_programs) >= live_console.CONSOLE_PROGRAM_CACHE_SIZE:
+                    # les dict gardent l'ordre d'insertion : la première ligne est la moins récemment utilisée
+                    del self.console_programs[next(iter(self.console_programs))]
+            self.console_programs[key] = programs
+            self.send_console_programs(programs)
+
+    def is_valid_param_key(self, section, key):
+        """Vérifie une clé [MIX] ou [PEDALS] avant que l'entrée OSC ne mémorise son adresse (lecture seule, thread OSC)."""
+        if section == 'PEDALS':
+            return key.upper() in self.pedal_map
+        return is_valid_mix_key(key, self.name_to_cq_map)
+
+    def execute_param(self, key, value):
+        """
+        Exécute un paramètre 'clé = valeur' reçu de l'API de contrôle ou de l'OSC (thread principal) : ligne [MIX], [PEDALS]
+        ou bpm, jamais une commande de la console. Pas de mémo : un fader déplacé depuis la tablette
+        envoie une valeur différente à chaque fois.
+        """
+        command_type, command = live_console.parse_param(key, value, self.pedal_map)
+        if command_type == 'error':
+            print(f"/!/ {command}")
+        elif command_type == 'song':
+            self.execute_song_commands([command])
+            self.flush_outputs()
+        else:
+            self.send_console_programs(self.compile_console_command(command_type, command))
+
+    def send_console_programs(self, programs):
+        """Envoie des programmes compilés par compile_console_command et met à jour l'état connu des tables."""
+        for output_indexes, program, cq_channel in programs:
+            self.send_program(output_indexes, program)
+            if cq_channel is not None:
+                state = self.mix_states.setdefault(cq_channel, mix_planner.MixState())
+                for param, (value, midi_msg, desc) in mix_planner.build_mix_target(program).items():
+                    state.set_param(param, value)
+        self.flush_outputs()
+
+    def start_console(self):
+        """Lance la console interactive dans un thread : les lignes saisies passent par la file d'événements."""
+        words = list(self.name_to_cq_map) + list(self.pedal_map) + list(live_console.MIX_ACTIONS)
+        words += list(live_console.CONSOLE_COMMANDS) + [song_filename.rsplit('.', 1)[0] for song_filename in self.song_index.songs]
+        completer = live_console.ConsoleCompleter(words)
+        push_line = lambda line: self.event_queue.push(time.perf_counter(), 'console', ('console', line), deduplicate=False)
+        threading.Thread(target=live_console.run_console, args=(push_line, completer), daemon=True).start()
+
+    def start_control_api(self):
+        """Lance l'API HTTP/WebSocket dans son thread : les demandes passent par la file d'événements."""
+        push_event = lambda event: self.event_queue.push(time.perf_counter(), 'api', event, deduplicate=False)
+        self.control_api = control_api.ControlApiServer(push_event, self.api_config['host'], self.api_config['port'],
+                                                        self.api_config['fader_rate_hz'])
+        port = self.control_api.start_in_thread()
+        print(f"- API de contrôle à l'écoute sur http://{self.api_config['host']}:{port} (WebSocket : /ws)")
+        self.control_api.notify_state(self.get_state())
+
+    def start_osc_input(self):
+        """Lance l'écoute OSC dans son thread : les messages passent par la file d'événements, comme les PC MIDI."""
+        # changements de chanson et actions fusionnés avec leurs doublons MIDI, comme entre deux entrées MIDI
+        push_event = lambda event: self.event_queue.push(time.perf_counter(), 'osc', event,
+                                                         deduplicate=event[0] in ('pc', 'action'))
+        self.osc_input = osc_input.OscInputServer(push_event, self.osc_config['host'], self.osc_config['port'], self.is_valid_param_key)
+        port = self.osc_input.start_in_thread()
+        print(f"- Entrée OSC à l'écoute sur udp://{self.osc_config['host']}:{port}")
+
+    def start_control_socket(self):
+        """
+        Lance l'écoute du socket de contrôle dans son thread. Les changements de chanson passent par la file
+        d'événements comme ceux de l'API, les autres commandes y sont déposées avec un Future qui reçoit leur sortie.
+        """
+        push_event = lambda event: self.event_queue.push(time.perf_counter(), 'socket', event, deduplicate=False)
+        def run_command(command, args):
+            future = concurrent.futures.Future()
+            self.event_queue.push(time.perf_counter(), 'socket', ('socket', (command, tuple(args), future)), deduplicate=False)
+            return future
+        self.control_socket = control_socket.ControlSocketServer(push_event, run_command, self.socket_config['path'])
+        try:
+            self.control_socket.start_in_thread()
+        except Exception as e:
+            print(f"/!/ Socket de contrôle indisponible : {e}")
+            self.control_socket = None
+            return
+        print(f"- Socket de contrôle à l'écoute sur '{self.socket_config['path']}' (client : python control_socket.py help)")
+
+    def execute_socket_command(self, command, args, future):
+        """
+        Exécute une commande du socket de contrôle dans le thread principal et transmet sa sortie au client.
+        Une commande abandonnée par le client (délai dépassé, Future annulé) n'est pas exécutée.
+        """
+        if not future.set_running_or_notify_cancel():
+            print(f"/!/ Commande '{command}' du socket de contrôle abandonnée par le client : non exécutée.")
+            return
+        output = io.StringIO()
+        ok = False
+        try:
+            ok = self.run_socket_command(command, list(args), output)
+        except Exception as e:
+            output.write(f"/!/ Erreur : {e}\n")
+        future.set_result((ok, output.getvalue()))
+
+    def run_socket_command(self, command, args, out):
+        """
+        Commandes du socket de contrôle autres que les changements de chanson (cf. control_socket.CONTROL_COMMANDS).
+        Leur sortie est écrite dans out, jamais sur sys.stdout : les autres threads continuent d'afficher normalement.
+        """
+        if command == 'edit':
+            if len(args) < 2 or args[0] not in ('add', 'update', 'delete'):
+                print(f"Usage : edit {control_socket.CONTROL_COMMANDS['edit']}", file=out)
+                return False
+            song_filenames = None
+            if len(args) > 2:
+                song_filenames = self.query_songs(args[2:], out)
+                if song_filenames is None:
+                    return False
+            mass_update_songs(self.songs_dir, args[1], operation=args[0], song_filenames=song_filenames, out=out)
+            self.refresh_song_library(out)
+            return True
+        if command == 'query':
+            return self.query_songs(args, out) is not None
+        if command == 'reload':
+            return self.reload_library(out)
+        if command == 'stats':
+            self.print_stats(out)
+            return True
+        if command == 'ports':
+            list_midi_ports(out)
+            return True
+        return False
+
+    def refresh_song_library(self, out=None):
+        """Relit les fichiers chansons modifiés et met les index à jour (setlist recompilée en mode show)."""
+        frozen = self.song_library.frozen
+        self.song_library.frozen = False
+        self.index_songs(out)
+        if frozen:
+            self.preload_setlist()
+            self.song_library.frozen = True
+
+    def reload_library(self, out=None):
+        """Relit pc_mapping.json et les fichiers chansons modifiés, sans toucher aux ports. Retourne False en cas d'erreur."""
+        try:
+            pc_map = load_mapping(self.mapping_file, out)
+        except SystemExit:
+            return False    # erreur déjà affichée par load_mapping, l'ancien mappage est conservé
+        self.pc_map = pc_map
+        self.program_index = midi_input.build_program_index(self.pc_map)
+        self.pc_numbers = sorted(self.pc_map)
+        self.use_bank_select = len(self.program_index) > midi_input.PROGRAMS_PER_BANK + 1
+        self.song_numbers = {song_filename: song_number for song_number, song_filename in self.pc_map.items()}
+        self.refresh_song_library(out)
+        print(f"- Rechargé : {len(self.pc_map)} chansons dans la setlist, {len(self.song_index.songs)} fichiers indexés", file=out)
+        return True
+
+    def print_stats(self, out=None):
+        song_number = '-' if self.current_pc is None else self.current_pc + 1
+        print(f"- En service depuis {time.time() - self.start_time:.0f} s, chanson courante : {song_number} '{self.current_song}'", file=out)
+        print(f"- {self.songs_executed} chansons exécutées, {self.event_queue.qsize()} événement(s) en attente, "
+              f"{self.event_queue.dropped_count} doublon(s) fusionné(s)", file=out)
+        if self.song_change_latency.count > 0:
+            print(f"- Latence des changements de chanson : moyenne "
+                  f"{self.song_change_latency.sum / self.song_change_latency.count * 1000:.2f} ms sur {self.song_change_latency.count}", file=out)
+        for port_name, output_buffer in zip(self.port_names, self.port_buffers):
+            print(f"- Port '{port_name}' : {output_buffer.sent_messages} messages, {output_buffer.sent_bytes} octets, "
+                  f"{output_buffer.send_errors} erreur(s)", file=out)
+
+    def start_metrics(self):
+        """Déclare les métriques exportées (lues à l'export, sans coût sur le chemin des messages) et lance l'export."""
+        registry = metrics.MetricsRegistry()
+        registry.add('pc_received_total', 'counter', "Program Change MIDI reçus, par entrée.",
+                     lambda: [({'input': midi_in['name_part']}, count) for midi_in, count in zip(self.inputs, self.pc_received)])
+        registry.add('songs_executed_total', 'counter', "Chansons chargées et exécutées.",
+                     lambda: [({}, self.songs_executed)])
+        registry.add('midi_messages_sent_total', 'counter', "Messages MIDI envoyés, par port.",
+                     lambda: [({'port': name}, buffer.sent_messages) for name, buffer in zip(self.port_names, self.port_buffers)])
+        registry.add('midi_bytes_sent_total', 'counter', "Octets MIDI envoyés, par port.",
+                     lambda: [({'port': name}, buffer.sent_bytes) for name, buffer in zip(self.port_names, self.port_buffers)])
+        registry.add('midi_send_errors_total', 'counter', "Erreurs d'envoi MIDI, par port.",
+                     lambda: [({'port': name}, buffer.send_errors) for name, buffer in zip(self.port_names, self.port_buffers)])
+        registry.add('event_queue_depth', 'gauge', "Evénements en attente de traitement.",
+                     lambda: [({}, self.event_queue.qsize())])
+        registry.add('event_duplicates_total', 'counter', "Evénements fusionnés avec un doublon récent.",
+                     lambda: [({}, self.event_queue.dropped_count)])
+        registry.add('song_change_latency_seconds', 'histogram', "Délai entre la réception d'un changement de chanson et le premier envoi.",
+                     lambda: self.song_change_latency)
+        registry.add('tap_tempo_lateness_seconds', 'histogram', "Retard des frappes de tap tempo sur leur heure prévue.",
+                     lambda: self.tap_tempo_lateness)
+        if self.gc_monitor is not None:
+            registry.add('gc_pause_seconds', 'histogram', "Pauses du ramasse-miettes pendant le show.",
+                         lambda: self.gc_monitor.pauses)
+        if self.io_worker is not None:
+            registry.add('io_worker_latency_seconds', 'histogram', "Délai entre le dépôt d'un message et son envoi par le processus d'E/S.",
+                         lambda: self.io_worker.ring.get_latency_histogram())
+
+        self.metrics_exporter = metrics.MetricsExporter(registry, self.metrics_config['host'], self.metrics_config['port'],
+                                                        self.metrics_config['textfile'], self.metrics_config['interval_s'])
+        self.metrics_exporter.start()
+
+    def get_state(self):
+        """Etat publié par l'API : chanson courante et valeurs connues de chaque CQ-18T."""
+        song_number = None if self.current_pc is None else self.current_pc + 1
+        return {
+            'song_number': song_number,
+            'song': self.current_song,
+            'title': self.current_title,
+            'mix': {
+                str(channel): {self.describe_nrpn(param).lower(): value for param, value in state.params.items()}
+                for channel, state in self.mix_states.items()
+            },
+        }
 
-def list_midi_ports():
+    def describe_event_source(self, source):
+        return self.inputs[source]['name_part'] if isinstance(source, int) else source
+
+    def process_events(self, timeout=1.0):
+        """
+        Traite les événements reçus sur toutes les entrées, dans l'ordre d'arrivée.
+        Appelé en boucle par le thread principal, pour ne pas bloquer les callbacks rtmidi.
+        """
+        event_item = self.event_queue.pop(timeout)
+        if event_item is None:
+            return
+
+        timestamp, source, event = event_item
+        event_type, value = event
+        song_change = event_type in ('pc', 'action', 'goto')
+        if song_change:
+            self.pending_change_timestamp = timestamp
+            if self.memory_profiler is not None:
+                self.memory_profiler.begin()
+            if self.allocation_check is not None:
+                self.allocation_check.begin()
+        if event_type == 'pc':
+            if self.verbose:
+                print(f"[{time.strftime('%H:%M:%S')}] Received PC command {value} (input {self.describe_event_source(source)})")
+            self.execute_pc_commands(value)
+        elif event_type == 'action':
+            if self.verbose:
+                print(f"[{time.strftime('%H:%M:%S')}] Received trigger {value} (input {self.describe_event_source(source)})")
+            self.execute_trigger_action(value)
+        elif event_type == 'goto':
+            self.goto_song(value)
+        elif event_type == 'console':
+            self.execute_console_line(value)
+        elif event_type == 'param':
+            self.execute_param(*value)
+        elif event_type == 'nrpn':
+            self.apply_sync_nrpn(value)
+        elif event_type == 'socket':
+            self.execute_socket_command(*value)
+
+        self.pending_change_timestamp = None
+        if song_change and self.memory_profiler is not None:
+            self.memory_profiler.end(f"{event_type} {value} -> '{self.current_song}'")
+        if song_change and self.allocation_check is not None:
+            self.allocation_check.end(f"{event_type} {value} -> '{self.current_song}'")
+        if self.control_api is not None:
+            self.control_api.notify_state(self.get_state())
+
+def list_midi_ports(out=None):
     """Liste tous les ports MIDI disponibles en entrée et en sortie."""
     midi_in = rtmidi.MidiIn()
     midi_out = rtmidi.MidiOut()
     
-    print("\n--- Ports MIDI d'ENTRÉE disponibles ---")
+    print("\n--- Ports MIDI d'ENTRÉE disponibles ---", file=out)
     in_ports = midi_in.get_ports()
     if in_ports:
         for i, port_name in enumerate(in_ports):
-            print(f"  [{i}]: {port_name}")
+            print(f"  [{i}]: {port_name}", file=out)
     else:
-        print("  Aucun port d'entrée MIDI trouvé.")
+        print("  Aucun port d'entrée MIDI trouvé.", file=out)
 
-    print("\n--- Ports MIDI de SORTIE disponibles ---")
+    print("\n--- Ports MIDI de SORTIE disponibles ---", file=out)
     out_ports = midi_out.get_ports()
     if out_ports:
         for i, port_name in enumerate(out_ports):
-            print(f"  [{i}]: {port_name}")
+            print(f"  [{i}]: {port_name}", file=out)
     else:
-        print("  Aucun port de sortie MIDI trouvé.")
-    print("\nUtilisez une partie de ces noms dans 'config.json' pour spécifier vos interfaces.")
+        print("  Aucun port de sortie MIDI trouvé.", file=out)
+    print("\nUtilisez une partie de ces noms dans 'config.json' pour spécifier vos interfaces.", file=out)
 
 
 def main():
@@ -703,6 +1577,22 @@ def main():
     parser.add_argument('--veryverbose', '-w', action='store_true', help="Mode très verbeux.")
     parser.add_argument('--test', '-t', action='store_true', help="N'envoie pas les commandes MIDI, ne fait que les afficher.")
     parser.add_argument('--autotest', '-a', action='store_true', help="Effectue un autotest interne du logiciel.")
+    parser.add_argument('--console', '-c', action='store_true', help="Ouvre une console interactive (commandes au format des fichiers chansons).")
+    parser.add_argument('--test-workers', type=int, default=os.cpu_count() or 1, metavar='N',
+                        help="Nombre de processus pour l'autotest (1 : exécution séquentielle).")
+    parser.add_argument('--test-results', type=str, default='', metavar='FICHIER',
+                        help="Ecrit les résultats de l'autotest (durées comprises) en JSON dans FICHIER.")
+    parser.add_argument('--benchmark', '-b', action='store_true', help="Mesure les performances des traitements internes et quitte.")
+    parser.add_argument('--render', type=str, default='', metavar='FICHIER.mid',
+                        help="Ecrit toute la setlist dans un fichier MIDI standard (une piste par port de sortie) et quitte.")
+    parser.add_argument('--report', action='store_true',
+                        help="Estime le coût de chaque changement de chanson de la setlist (messages, octets, temps sur le câble, tap tempo) et quitte.")
+    parser.add_argument('--show', '-s', action='store_true',
+                        help="Mode show : précharge la setlist, gèle le ramasse-miettes et contrôle les allocations à chaque chanson.")
+    parser.add_argument('--memprofile', action='store_true', help="Affiche la mémoire retenue par chaque changement de chanson (tracemalloc).")
+    parser.add_argument('--profile', action='store_true', help="Affiche les fonctions les plus coûteuses de chaque changement de chanson (cProfile).")
+    parser.add_argument('--sample-stacks', type=str, default='', metavar='FICHIER',
+                        help="Echantillonne les piles pendant toute la session et les écrit (format flamegraph) dans FICHIER à l'arrêt.")
 
     # --- Groupe pour les mises à jour massives (Exclusif) ---
     # Ceci garantit qu'on ne peut spécifier qu'UNE SEULE opération (--add, --update, ou --delete)
@@ -716,14 +1606,31 @@ def main():
                             
     mass_group.add_argument('--delete', type=str, 
                             help='Supprime une commande. Format: "SECTION/CLE"')    
+
+    parser.add_argument('--query', '-q', type=str, action='append', default=[], metavar='"SECTION/CLE[ = VALEUR]"',
+                        help="Liste les chansons dont les commandes (modèles compris) vérifient le critère (répétable : "
+                             "tous les critères). Avec --add/--update/--delete, seules ces chansons sont modifiées.")
     
     args = parser.parse_args()
     print([args])
 
     # Autotest
     if args.autotest:
-        utilities.run_unitary_tests()
-        cq18t.run_unitary_tests()
+        # les chapitres des modules sont indépendants : ils sont répartis sur plusieurs processus
+        test_modules = [utilities, cq18t, midi_input, midi_output, mix_planner, song_library, song_search,
+                        live_console, control_api, osc_input, metrics, mem_profiler, cpu_profiler, smf_writer,
+                        io_worker, show_mode, realtime, song_query, setlist_report, control_socket]
+        test_utility.run_test_plans({module.__name__: module.TEST_PLAN for module in test_modules},
+                                    args.test_workers, args.test_results)
+        return
+
+    # Benchmarks
+    if args.benchmark:
+        utilities.benchmark_midi_framing()
+        song_search.benchmark_song_search()
+        song_query.benchmark_song_query()
+        io_worker.benchmark_io_worker()
+        realtime.benchmark_realtime_jitter(realtime.get_realtime_config(load_config(args.config_file)))
         return
         
     # Logique pour le listage des ports
@@ -755,11 +1662,32 @@ def main():
         update_mode = ""
         update_args = []
 
+    # le profilage démarre avant le contrôleur pour que ses caches soient attribués à leurs sites d'allocation
+    memory_profiler = None
+    if args.memprofile:
+        memory_profiler = mem_profiler.SongChangeMemoryProfiler()
+        memory_profiler.start()
+
     try:
         controller = MidiShowController(args.config_file, args.mapping_file, args.test, args.verbose, args.veryverbose, update_mode, update_args)
     except SystemExit:
         # Une erreur fatale (config/mapping non trouvé) s'est produite lors de l'init.
         return
+    controller.memory_profiler = memory_profiler
+    controller.query_strings = args.query
+    if len(args.query) > 0 and len(update_mode) == 0:
+        controller.query_songs(args.query)
+        return
+    controller.show = args.show
+    if len(args.render) > 0:
+        controller.render_setlist(args.render)
+        return
+    if args.report:
+        controller.report_setlist()
+        return
+    if args.profile:
+        controller.cpu_profiler = cpu_profiler.SongChangeProfiler()
+        controller.cpu_profiler.start()
 
 
     if len(update_mode) > 0:
@@ -769,14 +1697,21 @@ def main():
             print(f"Démarrage du contrôleur en mode Test. Aucune commande MIDI ne sera envoyée.")
         else:
             print(f"Démarrage du contrôleur (Mode Verbeux: {args.verbose}).")
-        print(f"Écoute des commandes MIDI PC sur l'interface '{controller.input_name}', canal {controller.input_channel}...")
+        for midi_in_config in controller.inputs:
+            print(f"Écoute des commandes MIDI PC sur l'interface '{midi_in_config['name_part']}', canal {midi_in_config['channel']}...")
         print("Appuyez sur Ctrl+C pour arrêter.")
     
     try:
         with controller:
-            # Boucle infinie pour écouter les messages MIDI
+            if args.console:
+                controller.start_console()
+            if len(args.sample_stacks) > 0:
+                controller.stack_sampler = cpu_profiler.StackSampler(args.sample_stacks)
+                controller.stack_sampler.start()
+            controller.start_realtime()
+            # Boucle infinie de traitement des messages MIDI reçus
             while True:
-                time.sleep(1)
+                controller.process_events()
     except KeyboardInterrupt:
         print("\nArrêt demandé par l'utilisateur.")
     except Exception as e:
@@ -0,0 +1,397 @@
+# module: midi_input
+# Décodage rapide des messages MIDI reçus : table de dispatch indexée par le status byte
+import itertools
+import queue
+import threading
+import test_utility
+
+# Types de messages (nibble haut du status byte)
+MIDI_NOTE_OFF = 0x80
+MIDI_NOTE_ON = 0x90
+MIDI_CONTROL_CHANGE = 0xB0
+MIDI_PROGRAM_CHANGE = 0xC0
+MIDI_CLOCK = 0xF8
+
+# Bank Select (CC0 = MSB, CC32 = LSB) : 128 programmes par banque, 16384 banques
+MIDI_CC_BANK_SELECT_MSB = 0x00
+MIDI_CC_BANK_SELECT_LSB = 0x20
+PROGRAMS_PER_BANK = 128
+
+# Actions pouvant être déclenchées par un CC ou une Note (cf. "midi_triggers" dans config.json)
+TRIGGER_ACTIONS = ('next_song', 'previous_song', 'revert')
+
+def parse_midi_triggers(triggers_config):
+    """
+    Convertit la section "midi_triggers" de config.json en deux tables de 128 entrées
+    (une pour les CC, une pour les Notes) donnant l'action associée à chaque numéro.
+    Exemple de configuration : {"CC 80": "next_song", "NOTE 36": "revert"}
+    Les entrées invalides sont ignorées avec un message.
+    """
+    cc_actions = [None] * 128
+    note_actions = [None] * 128
+
+    for trigger, action in triggers_config.items():
+        parts = trigger.split()
+        action = action.lower().strip()
+        try:
+            if len(parts) != 2:
+                raise ValueError("format attendu 'CC <num>' ou 'NOTE <num>'")
+            number = int(parts[1])
+            if not 0 <= number <= 127:
+                raise ValueError(f"numéro {number} hors plage 0-127")
+            if action not in TRIGGER_ACTIONS:
+                raise ValueError(f"action '{action}' inconnue, attendu {TRIGGER_ACTIONS}")
+
+            if parts[0].upper() == 'CC':
+                cc_actions[number] = action
+            elif parts[0].upper() == 'NOTE':
+                note_actions[number] = action
+            else:
+                raise ValueError(f"type '{parts[0]}' inconnu, attendu CC ou NOTE")
+        except ValueError as e:
+            print(f"/!/ Trigger MIDI '{trigger}' ignoré : {e}")
+
+    return cc_actions, note_actions
+
+def build_dispatch_table(midi_channel, on_program_change=None, on_control_change=None, on_note_on=None, on_clock=None):
+    """
+    Construit une table de 256 entrées indexée par le status byte.
+    Chaque entrée contient le handler à appeler, ou None si le message doit être ignoré.
+    midi_channel est numéroté de 1 à 16. L'horloge MIDI (0xF8) n'a pas de canal.
+    """
+    table = [None] * 256
+    channel = midi_channel - 1
+
+    if on_program_change is not None:
+        table[MIDI_PROGRAM_CHANGE | channel] = on_program_change
+    if on_control_change is not None:
+        table[MIDI_CONTROL_CHANGE | channel] = on_control_change
+    if on_note_on is not None:
+        table[MIDI_NOTE_ON | channel] = on_note_on
+    if on_clock is not None:
+        table[MIDI_CLOCK] = on_clock
+
+    return table
+
+def parse_program_key(key):
+    """
+    Convertit une clé de pc_mapping.json en numéro de chanson :
+    "5" (banque 0, programme 5) ou "2:5" (banque 2, programme 5), programmes numérotés de 1 à 128.
+    Le numéro retourné vaut banque * 128 + programme, soit le numéro historique pour la banque 0.
+    Lève ValueError si la clé est invalide.
+    """
+    bank, separator, program = str(key).strip().rpartition(':')
+    bank = int(bank) if separator else 0
+    program = int(program)
+    if not 0 <= bank < PROGRAMS_PER_BANK * PROGRAMS_PER_BANK:
+        raise ValueError(f"banque {bank} hors plage 0-16383")
+    if not 1 <= program <= PROGRAMS_PER_BANK:
+        raise ValueError(f"programme {program} hors plage 1-128")
+    return bank * PROGRAMS_PER_BANK + program
+
+def build_program_index(pc_map):
+    """
+    Construit un tableau plat indexé par le numéro de chanson (cf. parse_program_key) :
+    l'entrée contient le fichier de la chanson, ou None. La recherche d'une chanson à la
+    réception d'un Program Change est ainsi un simple accès indexé, quel que soit leur nombre.
+    """
+    index = [None] * (max(pc_map, default=0) + 1)
+    for song_number, song_filename in pc_map.items():
+        index[song_number] = song_filename
+    return index
+
+def get_adjacent_pc(pc_numbers, current_pc, step):
+    """
+    Retourne le numéro de chanson (cf. parse_program_key) voisin de current_pc
+    dans la liste triée pc_numbers, en avançant de step (+1 suivant, -1 précédent).
+    Si aucun morceau n'est en cours, retourne le premier (ou le dernier si step < 0).
+    Retourne None si la liste est vide ou si on dépasse ses bornes.
+    """
+    if len(pc_numbers) == 0:
+        return None
+    if current_pc not in pc_numbers:
+        return pc_numbers[0] if step > 0 else pc_numbers[-1]
+
+    index = pc_numbers.index(current_pc) + step
+    if 0 <= index < len(pc_numbers):
+        return pc_numbers[index]
+    return None
+
+def get_midi_inputs_config(config):
+    """
+    Retourne la liste des entrées MIDI à ouvrir sous la forme [{'name_part': ..., 'channel': ...}].
+    Utilise la liste "midi_inputs" de config.json si elle existe, sinon l'ancienne
+    configuration à une seule entrée ("midi_in_name_part" / "midi_in_channel").
+    """
+    inputs = config.get('midi_inputs')
+    if inputs is None:
+        inputs = [{'name_part': config.get('midi_in_name_part', ''), 'channel': config.get('midi_in_channel', 1)}]
+
+    return [
+        {'name_part': midi_in['name_part'], 'channel': int(midi_in.get('channel', 1))}
+        for midi_in in inputs
+    ]
+
+# ==============================================================================
+# FILE D'EVENEMENTS COMMUNE A TOUTES LES ENTREES
+# ==============================================================================
+
+class MidiEventQueue:
+    """
+    File d'événements unique alimentée par les callbacks de toutes les entrées MIDI.
+    Les événements sont restitués dans l'ordre de leur horodatage. Un même événement
+    (par exemple ('pc', 3)) reçu plusieurs fois dans la fenêtre duplicate_window (en secondes)
+    n'est conservé qu'une fois, même s'il provient de sources différentes.
+    """
+
+    def __init__(self, duplicate_window=0.05):
+        self.queue = queue.PriorityQueue()
+        self.duplicate_window = duplicate_window
+        self.last_seen = {}     # événement -> dernier horodatage, du plus ancien au plus récent (ordre d'insertion)
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+        self.dropped_count = 0
+
+    def push(self, timestamp, source, event, deduplicate=True):
+        """
+        Ajoute un événement. Retourne False s'il a été fusionné avec un doublon récent.
+        deduplicate=False pour les commandes saisies volontairement (console, API), jamais fusionnées.
+        """
+        if deduplicate:
+            with self.lock:
+                last_timestamp = self.last_seen.get(event)
+                if last_timestamp is not None and abs(timestamp - last_timestamp) < self.duplicate_window:
+                    self.dropped_count += 1
+                    return False
+                # l'événement passe en fin de dict, puis les entrées sorties de la fenêtre sont oubliées :
+                # seuls les événements des duplicate_window dernières secondes sont conservés
+                # (l'événement courant n'est jamais oublié, même avec une fenêtre nulle)
+                self.last_seen.pop(event, None)
+                while self.last_seen:
+                    oldest_event = next(iter(self.last_seen))
+                    if timestamp - self.last_seen[oldest_event] < self.duplicate_window:
+                        break
+                    del self.last_seen[oldest_event]
+                self.last_seen[event] = timestamp
+
+        self.queue.put((timestamp, next(self.sequence), source, event))
+        return True
+
+    def pop(self, timeout=None):
+        """Retourne (timestamp, source, event) le plus ancien, ou None si la file reste vide pendant timeout."""
+        try:
+            timestamp, _, source, event = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        return timestamp, source, event
+
+    def qsize(self):
+        return self.queue.qsize()
+
+class LatestValueStore:
+    """
+    Dernière valeur reçue par clé, en attente du thread principal (NRPN émis par une CQ-18T : clé (canal, paramètre)).
+    Un balayage continu de fader ne fait grandir aucune file : chaque valeur remplace la précédente.
+    put() retourne True quand le store passe de vide à non vide : l'appelant dépose alors un seul événement
+    de réveil dans la MidiEventQueue, et le thread principal reprend tout le contenu avec take().
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def put(self, key, value):
+        with self.lock:
+            was_empty = len(self.values) == 0
+            self.values[key] = value
+        return was_empty
+
+    def take(self):
+        """Retourne et vide le contenu du store {clé: dernière valeur}."""
+        with self.lock:
+            values, self.values = self.values, {}
+        return values
+
+
+# ==============================================================================
+# UNITARY TESTS
+# ==============================================================================
+
+def _dispatch_status_list(midi_channel):
+    # indique les status bytes qui ont un handler, pour tester build_dispatch_table
+    table = build_dispatch_table(midi_channel, print, print, None, print)
+    return [status for status in range(256) if table[status] is not None]
+
+def _event_queue_scenario(pushed_events, duplicate_window):
+    # pousse les événements (timestamp, source, event) puis vide la file, pour tester MidiEventQueue
+    event_queue = MidiEventQueue(duplicate_window)
+    for timestamp, source, event in pushed_events:
+        event_queue.push(timestamp, source, event)
+
+    popped_events = []
+    while event_queue.qsize() > 0:
+        popped_events.append(event_queue.pop())
+    return popped_events
+
+def _last_seen_scenario(pushed_events, duplicate_window):
+    event_queue = MidiEventQueue(duplicate_window)
+    for timestamp, source, event in pushed_events:
+        event_queue.push(timestamp, source, event)
+    return event_queue.last_seen
+
+def _sync_sweep_scenario(sweep_length):
+    # balayage d'un fader de la CQ-18T (CC 99, 98, 6, 38 par valeur) décodé comme par cq_sync_callback,
+    # sans que le thread principal ne vide le store : la file ne reçoit qu'un réveil
+    import cq18t
+    event_queue = MidiEventQueue()
+    decoder = cq18t.NrpnStreamDecoder()
+    store = LatestValueStore()
+    for i in range(sweep_length):
+        for midi_data in ([0xB0, 0x63, 0x40], [0xB0, 0x62, 0x00], [0xB0, 0x06, (i >> 7) & 0x7F], [0xB0, 0x26, i & 0x7F]):
+            nrpn = decoder.feed(midi_data)
+            if nrpn is not None and store.put(nrpn[:2], nrpn[2]):
+                event_queue.push(float(i), 'sync', ('nrpn', 0), deduplicate=False)
+    return event_queue.qsize(), store.take(), store.put((1, 0x4000), 0)
+
+TEST_PLAN: test_utility.TestPlan = [
+    {
+        "chapter_title": "1: Table de dispatch des messages MIDI reçus",
+        "tests": [
+            {
+                "test_title": "Status bytes gérés sur le canal 13 (PC, CC, Clock)",
+                "function_under_test": _dispatch_status_list,
+                "expected_return": [0xBC, 0xCC, 0xF8],
+                "function_arguments": [13]
+            },
+            {
+                "test_title": "Table de 256 entrées vide sans handler",
+                "function_under_test": build_dispatch_table,
+                "expected_return": [None] * 256,
+                "function_arguments": [1]
+            },
+        ]
+    },
+    {
+        "chapter_title": "2: Triggers MIDI configurables",
+        "tests": [
+            {
+                "test_title": "CC 80 = chanson suivante, Note 36 = revert",
+                "function_under_test": parse_midi_triggers,
+                "expected_return": (
+                    [None] * 80 + ['next_song'] + [None] * 47,
+                    [None] * 36 + ['revert'] + [None] * 91
+                ),
+                "function_arguments": [{"CC 80": "next_song", "NOTE 36": "Revert"}]
+            },
+            {
+                "test_title": "Triggers invalides ignorés",
+                "function_under_test": parse_midi_triggers,
+                "expected_return": ([None] * 128, [None] * 128),
+                "function_arguments": [{"CC 200": "next_song", "PC 3": "revert", "NOTE 10": "explode"}]
+            },
+        ]
+    },
+    {
+        "chapter_title": "3: Navigation dans la setlist",
+        "tests": [
+            {
+                "test_title": "Chanson suivante",
+                "function_under_test": get_adjacent_pc,
+                "expected_return": 5,
+                "function_arguments": [[1, 2, 5], 2, 1]
+            },
+            {
+                "test_title": "Chanson précédente",
+                "function_under_test": get_adjacent_pc,
+                "expected_return": 1,
+                "function_arguments": [[1, 2, 5], 2, -1]
+            },
+            {
+                "test_title": "Fin de setlist",
+                "function_under_test": get_adjacent_pc,
+                "expected_return": None,
+                "function_arguments": [[1, 2, 5], 5, 1]
+            },
+            {
+                "test_title": "Aucune chanson en cours : première de la liste",
+                "function_under_test": get_adjacent_pc,
+                "expected_return": 1,
+                "function_arguments": [[1, 2, 5], None, 1]
+            },
+        ]
+    },
+    {
+        "chapter_title": "3bis: Bank Select (setlists de plus de 128 chansons)",
+        "tests": [
+            {
+                "test_title": "Clé historique = banque 0",
+                "function_under_test": parse_program_key,
+                "expected_return": 5,
+                "function_arguments": ["5"]
+            },
+            {
+                "test_title": "Clé banque:programme",
+                "function_under_test": parse_program_key,
+                "expected_return": 2 * 128 + 5,
+                "function_arguments": ["2:5"]
+            },
+            {
+                "test_title": "Index plat des chansons",
+                "function_under_test": build_program_index,
+                "expected_return": [None, 'a.txt'] + [None] * 128 + ['b.txt'],
+                "function_arguments": [{1: 'a.txt', 130: 'b.txt'}]
+            },
+        ]
+    },
+    {
+        "chapter_title": "4: Entrées MIDI multiples",
+        "tests": [
+            {
+                "test_title": "Configuration historique à une seule entrée",
+                "function_under_test": get_midi_inputs_config,
+                "expected_return": [{'name_part': 'MIDIIN2', 'channel': 13}],
+                "function_arguments": [{'midi_in_name_part': 'MIDIIN2', 'midi_in_channel': 13}]
+            },
+            {
+                "test_title": "Liste d'entrées prioritaire sur la configuration historique",
+                "function_under_test": get_midi_inputs_config,
+                "expected_return": [{'name_part': 'MIDIIN2', 'channel': 13}, {'name_part': 'FCB', 'channel': 1}],
+                "function_arguments": [{'midi_in_name_part': 'OLD', 'midi_inputs': [{'name_part': 'MIDIIN2', 'channel': 13}, {'name_part': 'FCB'}]}]
+            },
+            {
+                "test_title": "Evénements restitués dans l'ordre des horodatages",
+                "function_under_test": _event_queue_scenario,
+                "expected_return": [(1.0, 1, ('pc', 4)), (2.0, 0, ('pc', 3))],
+                "function_arguments": [[(2.0, 0, ('pc', 3)), (1.0, 1, ('pc', 4))], 0.05]
+            },
+            {
+                "test_title": "Seuls les événements de la fenêtre sont mémorisés pour la fusion",
+                "function_under_test": _last_seen_scenario,
+                "expected_return": {('goto', 'c'): 2.0},
+                "function_arguments": [[(1.0, 0, ('goto', 'a')), (1.01, 0, ('goto', 'b')), (2.0, 0, ('goto', 'c'))], 0.05]
+            },
+            {
+                "test_title": "Fenêtre nulle (fusion désactivée) : seul le dernier événement est mémorisé",
+                "function_under_test": _last_seen_scenario,
+                "expected_return": {('pc', 4): 1.0},
+                "function_arguments": [[(1.0, 0, ('pc', 3)), (1.0, 1, ('pc', 3)), (1.0, 0, ('pc', 4))], 0.0]
+            },
+            {
+                "test_title": "Doublon d'une autre source fusionné dans la fenêtre",
+                "function_under_test": _event_queue_scenario,
+                "expected_return": [(1.0, 0, ('pc', 3)), (1.5, 0, ('pc', 3))],
+                "function_arguments": [[(1.0, 0, ('pc', 3)), (1.01, 1, ('pc', 3)), (1.5, 0, ('pc', 3))], 0.05]
+            },
+            {
+                "test_title": "Balayage de fader de la CQ-18T : un seul réveil en file, dernière valeur conservée",
+                "function_under_test": _sync_sweep_scenario,
+                # valeur 14 bits au format de la CQ-18T : (CC 6 << 8) | CC 38, 4999 = 39 * 128 + 7
+                "expected_return": (1, {(1, 0x4000): (39 << 8) | 7}, True),
+                "function_arguments": [5000]
+            },
+        ]
+    },
+]
+
+def run_unitary_tests():
+    return (test_utility.run_test_plan(TEST_PLAN))
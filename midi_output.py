@@ -0,0 +1,208 @@
+# module: midi_output
+# Description des périphériques MIDI de sortie (table de mixage, pédales, métronome)
+# et chemin d'envoi par buffer d'octets
+import utilities
+import test_utility
+
+# Drivers de sortie supportés :
+# - cq18t     : table de mixage Allen & Heath CQ-18T (section [MIX] et tap tempo)
+# - pedals    : pédales d'effets génériques PC/CC (section [PEDALS], canaux définis dans "pedals")
+# - midronome : métronome Midronome (BPM de la section [SONG_INFO])
+OUTPUT_DRIVERS = ('cq18t', 'pedals', 'midronome')
+
+def get_midi_outputs_config(config):
+    """
+    Retourne la liste des périphériques de sortie sous la forme
+    [{'name': ..., 'driver': ..., 'port': ..., 'channel': ..., 'sync_port': ...}].
+    Utilise la liste "midi_outputs" de config.json si elle existe, sinon l'ancienne configuration
+    ("cq_out_name_part" / "cq_midi_channel" et "midi_out_name_part" / "midronome_channel").
+    Les périphériques dont le driver est inconnu sont ignorés avec un message.
+    """
+    outputs = config.get('midi_outputs')
+    if outputs is None:
+        outputs = []
+        if len(config.get('cq_out_name_part', '')) > 0:
+            outputs.append({'name': 'CQ18T', 'driver': 'cq18t', 'port': config['cq_out_name_part'],
+                            'channel': config.get('cq_midi_channel', 1)})
+        if len(config.get('midi_out_name_part', '')) > 0:
+            outputs.append({'name': 'Pédales', 'driver': 'pedals', 'port': config['midi_out_name_part']})
+            outputs.append({'name': 'Midronome', 'driver': 'midronome', 'port': config['midi_out_name_part'],
+                            'channel': config.get('midronome_channel', 16)})
+
+    devices = []
+    for output in outputs:
+        driver = output.get('driver', '').lower()
+        if driver not in OUTPUT_DRIVERS:
+            print(f"/!/ Sortie MIDI '{output.get('name', '')}' ignorée : driver '{driver}' inconnu, attendu {OUTPUT_DRIVERS}")
+            continue
+        devices.append({
+            'name': output.get('name', output['port']),
+            'driver': driver,
+            'port': output['port'],
+            # les pédales ont chacune leur canal (cf. "pedals"), le canal du périphérique n'est pas utilisé
+            'channel': None if driver == 'pedals' else int(output.get('channel', 1)),
+            # port d'entrée recevant la sortie MIDI de la table (synchronisation des mouvements manuels)
+            'sync_port': output.get('sync_port', '') if driver == 'cq18t' else '',
+        })
+    return devices
+
+def group_outputs_by_encoding(outputs):
+    """
+    Regroupe les index des sorties qui reçoivent exactement les mêmes octets :
+    même driver et même canal. Chaque groupe n'est compilé qu'une seule fois par chanson.
+    Retourne un dict {(driver, channel): [index des sorties]} dans l'ordre de la configuration.
+    """
+    groups = {}
+    for index, output in enumerate(outputs):
+        groups.setdefault((output['driver'], output['channel']), []).append(index)
+    return groups
+
+
+# ==============================================================================
+# CHEMIN D'ENVOI : UN BUFFER D'OCTETS PAR PORT
+# ==============================================================================
+
+def describe_midi_message(midi_msg):
+    """Retourne une description lisible d'un message MIDI, pour l'affichage en mode verbeux."""
+    msg_type = (midi_msg[0] & 0xF0)
+    
+    if msg_type == 0xC0:
+        msg_desc = f"PC {utilities.dec_to_aligned_hex(midi_msg[1])}"
+    elif msg_type == 0x80:
+        msg_desc = f"Note Off {utilities.dec_to_aligned_hex(midi_msg[1])} {utilities.dec_to_aligned_hex(midi_msg[2])} "
+    elif msg_type == 0x90:
+        msg_desc = f"Note On {utilities.dec_to_aligned_hex(midi_msg[1])} {utilities.dec_to_aligned_hex(midi_msg[2])} "
+    elif msg_type == 0xB0 and midi_msg[1] in [0x60, 0x61, 0x62, 0x63, 0x06, 0x26]:
+        msg_desc = f"NRPN: {hex(msg_type)} {utilities.dec_to_aligned_hex(midi_msg[1])} {utilities.dec_to_aligned_hex(midi_msg[2])}"
+    elif msg_type == 0xB0:
+        msg_desc = f"CC{midi_msg[1]}={utilities.dec_to_aligned_hex(midi_msg[2])}"
+    else:
+        msg_desc = f"Raw: {list(midi_msg)}"
+    return msg_desc
+
+class MidiOutputBuffer:
+    """
+    Buffer d'envoi préalloué d'un port de sortie. Les messages d'une transition y sont
+    accumulés bout à bout (sans liste intermédiaire), puis envoyés en une fois par flush() :
+    un appel natif send_message par message MIDI, sur des tranches du buffer découpées
+    par utilities.iter_midi_messages.
+    """
+
+    def __init__(self, midi_out, capacity=4096):
+        self.midi_out = midi_out
+        self.buffer = bytearray(capacity)
+        self.length = 0
+        self.sent_messages = 0
+        self.sent_bytes = 0
+        self.send_errors = 0
+
+    def write(self, data, send=True):
+        data_length = len(data)
+        if self.length + data_length > len(self.buffer):
+            self.flush(send)
+            if data_length > len(self.buffer):
+                self.buffer = bytearray(data_length)
+        # affectation d'une tranche de même taille : le buffer n'est jamais redimensionné
+        self.buffer[self.length:self.length + data_length] = data
+        self.length += data_length
+
+    def flush(self, send=True):
+        """Envoie le contenu du buffer (ou le vide seulement si send est False, en mode test)."""
+        if self.length == 0:
+            return
+        if send:
+            for status, midi_msg in utilities.iter_midi_messages(memoryview(self.buffer)[:self.length]):
+                if midi_msg[0] != status:
+                    # running status : rtmidi attend des messages complets
+                    midi_msg = bytes((status,)) + midi_msg
+                try:
+                    self.midi_out.send_message(midi_msg)
+                    self.sent_messages += 1
+                    self.sent_bytes += len(midi_msg)
+                except Exception as e:
+                    self.send_errors += 1
+                    print(f"/!/ Erreur d'envoi du message MIDI ({bytes(midi_msg).hex(' ')}): {e}")
+        self.length = 0
+
+
+# ==============================================================================
+# UNITARY TESTS
+# ==============================================================================
+
+class _RecordingPort:
+    # faux port rtmidi qui mémorise les messages envoyés
+    def __init__(self):
+        self.messages = []
+    def send_message(self, midi_msg):
+        self.messages.append(bytes(midi_msg))
+
+def _buffer_scenario(writes, capacity):
+    # écrit les messages dans un MidiOutputBuffer puis le vide, retourne les messages reçus par le port
+    port = _RecordingPort()
+    output_buffer = MidiOutputBuffer(port, capacity)
+    for data in writes:
+        output_buffer.write(data)
+    output_buffer.flush()
+    return port.messages
+
+TEST_PLAN: test_utility.TestPlan = [
+    {
+        "chapter_title": "1: Configuration des sorties MIDI",
+        "tests": [
+            {
+                "test_title": "Configuration historique CQ + pédales + midronome",
+                "function_under_test": get_midi_outputs_config,
+                "expected_return": [
+                    {'name': 'CQ18T', 'driver': 'cq18t', 'port': 'CQ18', 'channel': 1, 'sync_port': ''},
+                    {'name': 'Pédales', 'driver': 'pedals', 'port': 'MIDIOUT2', 'channel': None, 'sync_port': ''},
+                    {'name': 'Midronome', 'driver': 'midronome', 'port': 'MIDIOUT2', 'channel': 12, 'sync_port': ''},
+                ],
+                "function_arguments": [{'cq_out_name_part': 'CQ18', 'cq_midi_channel': 1,
+                                        'midi_out_name_part': 'MIDIOUT2', 'midronome_channel': 12}]
+            },
+            {
+                "test_title": "Driver inconnu ignoré",
+                "function_under_test": get_midi_outputs_config,
+                "expected_return": [{'name': 'Retours', 'driver': 'cq18t', 'port': 'CQ18B', 'channel': 2, 'sync_port': 'CQ18B'}],
+                "function_arguments": [{'midi_outputs': [
+                    {'name': 'Retours', 'driver': 'CQ18T', 'port': 'CQ18B', 'channel': 2, 'sync_port': 'CQ18B'},
+                    {'name': 'Lumières', 'driver': 'dmx', 'port': 'USB'},
+                ]}]
+            },
+        ]
+    },
+    {
+        "chapter_title": "2: Partage de l'encodage entre sorties identiques",
+        "tests": [
+            {
+                "test_title": "Deux CQ18T sur le même canal partagent leur encodage",
+                "function_under_test": group_outputs_by_encoding,
+                "expected_return": {('cq18t', 1): [0, 2], ('pedals', None): [1], ('cq18t', 2): [3]},
+                "function_arguments": [[
+                    {'driver': 'cq18t', 'channel': 1}, {'driver': 'pedals', 'channel': None},
+                    {'driver': 'cq18t', 'channel': 1}, {'driver': 'cq18t', 'channel': 2},
+                ]]
+            },
+        ]
+    },
+    {
+        "chapter_title": "3: Envoi par buffer d'octets",
+        "tests": [
+            {
+                "test_title": "NRPN, Program Change puis running status envoyés en messages complets",
+                "function_under_test": _buffer_scenario,
+                "expected_return": [b'\xb0\x63\x40', b'\xb0\x62\x02', b'\xc5\x3a', b'\xb0\x06\x4b', b'\xb0\x26\x00'],
+                "function_arguments": [[b'\xb0\x63\x40\xb0\x62\x02\xc5\x3a', b'\xb0\x06\x4b\x26\x00'], 64]
+            },
+            {
+                "test_title": "Buffer plein vidé avant d'accepter de nouveaux messages",
+                "function_under_test": _buffer_scenario,
+                "expected_return": [b'\xc0\x01', b'\xc1\x02', b'\xb2\x07\x7f'],
+                "function_arguments": [[b'\xc0\x01\xc1\x02', b'\xb2\x07\x7f'], 5]
+            },
+        ]
+    },
+]
+
+def run_unitary_tests():
+    return (test_utility.run_test_plan(TEST_PLAN))
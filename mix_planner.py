@@ -0,0 +1,198 @@
+# module: mix_planner
+# Choix de la manière la moins coûteuse (en octets MIDI) d'amener la CQ-18T au mix d'une chanson
+import cq18t
+import test_utility
+
+PLAN_FULL = 'full'
+PLAN_DELTA = 'delta'
+PLAN_SCENE = 'scene+delta'
+
+class MixState:
+    """
+    Modèle de l'état connu d'une table de mixage :
+    - base_scene : dernière scène rappelée (None si aucune)
+    - params     : valeurs connues des paramètres NRPN {paramètre 14 bits: valeur 14 bits}
+    - modified   : paramètres envoyés depuis le dernier rappel de scène
+    """
+
+    def __init__(self):
+        self.base_scene = None
+        self.params = {}
+        self.modified = set()
+
+    def recall_scene(self, scene_id, scene_params):
+        """scene_params contient les valeurs connues de la scène (vide si son contenu n'est pas décrit)."""
+        self.base_scene = scene_id
+        self.params = dict(scene_params)
+        self.modified = set()
+
+    def set_param(self, param, value):
+        self.params[param] = value
+        self.modified.add(param)
+
+    def forget_param(self, param):
+        """Le paramètre a changé sans que sa valeur soit connue : il sera renvoyé au prochain plan."""
+        self.params.pop(param, None)
+        self.modified.add(param)
+
+def build_mix_target(program):
+    """
+    Convertit un programme compilé [(message NRPN, description), ...] en cible
+    {paramètre: (valeur, message, description)}. Une ligne postérieure sur le même
+    paramètre remplace la précédente. Les commandes ignorées (message vide) sont écartées.
+    """
+    target = {}
+    for midi_msg, desc in program:
+        nrpn = cq18t.cq_get_nrpn_from_midi_msg(midi_msg)
+        if nrpn is not None:
+            param, value = nrpn
+            target[param] = (value, midi_msg, desc)
+    return target
+
+def get_program_bytes(commands):
+    return sum(len(midi_msg) for param, (value, midi_msg, desc) in commands)
+
+def plan_mix_transition(state, target, scene_id, scenes, auto_scene=False):
+    """
+    Compare les plans possibles pour atteindre la cible et retourne le moins coûteux en octets :
+    - full        : envoi de tous les NRPN de la chanson
+    - delta       : envoi des seuls NRPN dont la valeur diffère de l'état connu
+    - scene+delta : rappel d'une scène puis des NRPN qui diffèrent de son contenu connu
+
+    scene_id est la scène de base déclarée par la chanson ([SONG_INFO] scene), ou None.
+    Le mix de la chanson est alors cette scène plus les lignes [MIX]. Sans scène déclarée, une scène n'est
+    rappelée que si auto_scene est vrai ("cq_auto_scene" dans config.json) : toutes les scènes dont le contenu
+    est décrit (scenes) sont alors essayées comme base. Un rappel remet aussi à zéro des réglages de la table
+    que le modèle [MIX] ne décrit pas : par défaut, il n'est fait que si la chanson le demande.
+    scenes : {scene_id: cible au format de build_mix_target}
+
+    Retourne un dict {'plan', 'scene', 'commands', 'bytes', 'costs'} où commands est la liste
+    [(paramètre, (valeur, message, description))] à envoyer après l'éventuel rappel de scène.
+    """
+    candidates = []
+
+    # cible entièrement connue : pas de scène, ou scène dont le contenu est décrit
+    if scene_id is None:
+        known_target = target
+    elif scene_id in scenes:
+        known_target = dict(scenes[scene_id])
+        known_target.update(target)
+    else:
+        known_target = None
+
+    if known_target is not None:
+        delta = [(param, entry) for param, entry in known_target.items() if state.params.get(param) != entry[0]]
+        candidates.append((PLAN_DELTA, None, delta))
+        candidates.append((PLAN_FULL, None, list(known_target.items())))
+    elif state.base_scene == scene_id and state.modified <= target.keys():
+        # scène inconnue mais déjà rappelée : tout ce qui a bougé depuis est redéfini par la chanson
+        delta = [(param, entry) for param, entry in target.items() if state.params.get(param) != entry[0]]
+        candidates.append((PLAN_DELTA, None, delta))
+
+    base_scenes = [scene_id] if scene_id is not None else (sorted(scenes) if auto_scene else [])
+    for base_scene in base_scenes:
+        scene_target = scenes.get(base_scene, {})
+        corrections = [
+            (param, entry) for param, entry in target.items()
+            if param not in scene_target or scene_target[param][0] != entry[0]
+        ]
+        candidates.append((PLAN_SCENE, base_scene, corrections))
+
+    costs = {}
+    best = None
+    for plan_name, base_scene, commands in candidates:
+        cost = get_program_bytes(commands)
+        if base_scene is not None:
+            cost += len(cq18t.cq_get_midi_msg_set_scene(1, base_scene))
+        if plan_name not in costs or cost < costs[plan_name]:
+            costs[plan_name] = cost
+        if best is None or cost < best['bytes']:
+            best = {'plan': plan_name, 'scene': base_scene, 'commands': commands, 'bytes': cost}
+
+    best['costs'] = costs
+    return best
+
+def apply_plan(state, plan, scenes):
+    """Met à jour le modèle d'état après l'envoi d'un plan."""
+    if plan['scene'] is not None:
+        scene_target = scenes.get(plan['scene'], {})
+        state.recall_scene(plan['scene'], {param: entry[0] for param, entry in scene_target.items()})
+    for param, (value, midi_msg, desc) in plan['commands']:
+        state.set_param(param, value)
+
+
+# ==============================================================================
+# UNITARY TESTS
+# ==============================================================================
+
+def _nrpn(param, value):
+    # message NRPN de test au format cq18t, canal 1
+    return [0xB0, 0x63, param >> 8, 0xB0, 0x62, param & 0x7F, 0xB0, 0x06, value >> 8, 0xB0, 0x26, value & 0x7F]
+
+def _target(values):
+    return build_mix_target([(_nrpn(param, value), '') for param, value in values.items()])
+
+def _plan_scenario(known_params, base_scene, target_values, scene_id, scenes_values, auto_scene=False):
+    # retourne (plan, scène, octets) pour un état et une cible donnés
+    state = MixState()
+    state.base_scene = base_scene
+    for param, value in known_params.items():
+        state.set_param(param, value)
+    scenes = {scene: _target(values) for scene, values in scenes_values.items()}
+    plan = plan_mix_transition(state, _target(target_values), scene_id, scenes, auto_scene)
+    return plan['plan'], plan['scene'], plan['bytes']
+
+_SCENE_3 = {0x4000 + i: 0x6200 for i in range(10)}
+
+TEST_PLAN: test_utility.TestPlan = [
+    {
+        "chapter_title": "1: Planification des changements de mix",
+        "tests": [
+            {
+                "test_title": "Etat inconnu, pas de scène : tous les NRPN sont envoyés",
+                "function_under_test": _plan_scenario,
+                "expected_return": ('delta', None, 24),
+                "function_arguments": [{}, None, {0x4000: 1, 0x4001: 2}, None, {}]
+            },
+            {
+                "test_title": "Etat connu : seul le paramètre modifié est envoyé",
+                "function_under_test": _plan_scenario,
+                "expected_return": ('delta', None, 12),
+                "function_arguments": [{0x4000: 1, 0x4001: 2}, None, {0x4000: 1, 0x4001: 3}, None, {}]
+            },
+            {
+                "test_title": "Mix proche d'une scène décrite, choix automatique : rappel de scène + 1 correction",
+                "function_under_test": _plan_scenario,
+                "expected_return": ('scene+delta', 3, 17),
+                "function_arguments": [{}, None, {**_SCENE_3, 0x4000: 0x4B00}, None, {3: _SCENE_3}, True]
+            },
+            {
+                "test_title": "Mix proche d'une scène décrite, chanson sans scène : aucun rappel",
+                "function_under_test": _plan_scenario,
+                "expected_return": ('delta', None, 120),
+                "function_arguments": [{}, None, {**_SCENE_3, 0x4000: 0x4B00}, None, {3: _SCENE_3}]
+            },
+            {
+                "test_title": "Scène déclarée au contenu inconnu : rappel + toutes les lignes [MIX]",
+                "function_under_test": _plan_scenario,
+                "expected_return": ('scene+delta', 5, 29),
+                "function_arguments": [{}, None, {0x4000: 1, 0x4001: 2}, 5, {}]
+            },
+            {
+                "test_title": "Scène déclarée déjà rappelée : delta depuis l'état courant",
+                "function_under_test": _plan_scenario,
+                "expected_return": ('delta', None, 12),
+                "function_arguments": [{0x4000: 1}, 5, {0x4000: 1, 0x4001: 2}, 5, {}]
+            },
+            {
+                "test_title": "Scène déclarée rappelée mais état modifié hors chanson : nouveau rappel",
+                "function_under_test": _plan_scenario,
+                "expected_return": ('scene+delta', 5, 29),
+                "function_arguments": [{0x4000: 1, 0x4005: 7}, 5, {0x4000: 1, 0x4001: 2}, 5, {}]
+            },
+        ]
+    },
+]
+
+def run_unitary_tests():
+    return (test_utility.run_test_plan(TEST_PLAN))
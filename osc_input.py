@@ -0,0 +1,330 @@
+# module: osc_input
+# Entrée OSC sur UDP (rig de backing tracks) : mêmes événements que les entrées MIDI
+import asyncio
+import struct
+import threading
+import live_console
+import midi_input
+import test_utility
+
+# Adresses OSC exactes -> fabrique de l'événement à partir des arguments
+# (les adresses /mix/... et /pedal/... sont compilées à la première réception, cf. OscDispatcher)
+OSC_SONG_ACTIONS = {
+    '/song/next': 'next_song',
+    '/song/previous': 'previous_song',
+    '/song/revert': 'revert',
+}
+
+def get_osc_input_config(config):
+    """
+    Retourne la configuration de l'entrée OSC ("osc_input" dans config.json) :
+    {'host': ..., 'port': ...}. Un port à 0 (ou absent) désactive l'entrée.
+    """
+    osc_config = config.get('osc_input', {})
+    return {'host': osc_config.get('host', '127.0.0.1'), 'port': int(osc_config.get('port', 0))}
+
+def read_osc_string(data, offset):
+    end = data.find(b'\x00', offset)
+    if end < 0:
+        raise ValueError("chaîne OSC non terminée")
+    # chaîne terminée par un zéro, complétée à un multiple de 4 octets
+    return data[offset:end].decode('utf-8'), (end + 4) & ~3
+
+def parse_osc_packet(data):
+    """
+    Décode un paquet OSC 1.0 (message ou bundle). Retourne la liste des messages [(adresse, [arguments])].
+    Types supportés : i (int32), f (float32), s (chaîne), T/F (booléens). Lève ValueError si le paquet est invalide.
+    """
+    if data.startswith(b'#bundle\x00'):
+        messages = []
+        offset = 16     # '#bundle' + horodatage (ignoré : exécution immédiate)
+        while offset < len(data):
+            size = struct.unpack_from('>i', data, offset)[0]
+            messages += parse_osc_packet(data[offset + 4:offset + 4 + size])
+            offset += 4 + size
+        return messages
+
+    try:
+        address, offset = read_osc_string(data, 0)
+        if offset >= len(data):
+            return [(address, [])]
+        type_tags, offset = read_osc_string(data, offset)
+        arguments = []
+        for tag in type_tags[1:]:
+            if tag == 'i':
+                arguments.append(struct.unpack_from('>i', data, offset)[0])
+                offset += 4
+            elif tag == 'f':
+                arguments.append(struct.unpack_from('>f', data, offset)[0])
+                offset += 4
+            elif tag == 's':
+                value, offset = read_osc_string(data, offset)
+                arguments.append(value)
+            elif tag in 'TF':
+                arguments.append(tag == 'T')
+            else:
+                raise ValueError(f"type OSC '{tag}' non supporté")
+    except (struct.error, UnicodeDecodeError) as e:
+        raise ValueError(f"paquet OSC invalide : {e}")
+    return [(address, arguments)]
+
+def encode_osc_message(address, arguments=()):
+    """Encode un message OSC (pour les tests et l'envoi depuis un script local)."""
+    def osc_string(text):
+        raw = text.encode('utf-8') + b'\x00'
+        return raw + b'\x00' * (-len(raw) % 4)
+
+    type_tags = ','
+    payload = b''
+    for argument in arguments:
+        if isinstance(argument, int):
+            type_tags += 'i'
+            payload += struct.pack('>i', argument)
+        elif isinstance(argument, float):
+            type_tags += 'f'
+            payload += struct.pack('>f', argument)
+        else:
+            type_tags += 's'
+            payload += osc_string(str(argument))
+    return osc_string(address) + osc_string(type_tags) + payload
+
+def format_osc_value(arguments):
+    """Arguments OSC -> valeur d'une ligne de fichier chanson ('-5', 'left 30', 'PC 90'...)."""
+    values = []
+    for argument in arguments:
+        if isinstance(argument, float) and argument.is_integer():
+            argument = int(argument)
+        values.append(str(argument))
+    return ' '.join(values)
+
+def is_well_formed_param(section, key):
+    """Validation par défaut des clés /mix/ et /pedal/ : toute clé qui n'est pas une commande de la console."""
+    return live_console.parse_param(key, '', {})[0] != 'error'
+
+class OscDispatcher:
+    """
+    Table de dispatch des adresses OSC : {adresse: fonction(arguments) -> événement ou None}.
+    Les adresses fixes sont compilées à la construction. Une adresse /mix/<ligne [MIX]> ou
+    /pedal/<pédale> est compilée à sa première réception puis ajoutée à la table : ensuite,
+    traiter un message OSC coûte un accès au dict, comme un Program Change MIDI (cf. midi_input).
+    Seules les clés acceptées par is_valid_param(section, clé) sont compilées : des adresses inventées
+    ne peuvent pas faire grandir la table.
+    Les événements produits sont ceux de la file du contrôleur : ('pc', n), ('action', nom),
+    ('goto', requête) et ('param', (clé, valeur)) pour les lignes [MIX], [PEDALS] et bpm.
+    """
+
+    def __init__(self, is_valid_param=None):
+        self.is_valid_param = is_valid_param or is_well_formed_param
+        self.table = {
+            # même numérotation que pc_mapping.json, l'API et le socket : '/song/pc 3' = programme 3, '/song/pc "2:5"'
+            '/song/pc': lambda arguments: ('pc', midi_input.parse_program_key(format_osc_value(arguments[:1])) - 1),
+            '/song/goto': lambda arguments: ('goto', format_osc_value(arguments)),
+            '/bpm': lambda arguments: ('param', ('bpm', format_osc_value(arguments))),
+        }
+        for address, action in OSC_SONG_ACTIONS.items():
+            self.table[address] = lambda arguments, action=action: ('action', action)
+        self.unknown_count = 0
+
+    def compile_address(self, address):
+        """Compile une adresse /mix/... ou /pedal/... en handler, ou retourne None si elle est inconnue ou invalide."""
+        for prefix, section in (('/mix/', 'MIX'), ('/pedal/', 'PEDALS')):
+            if address.startswith(prefix) and len(address) > len(prefix):
+                key = address[len(prefix):].lower()
+                if not self.is_valid_param(section, key):
+                    return None
+                return lambda arguments: ('param', (key, format_osc_value(arguments)))
+        return None
+
+    def dispatch(self, address, arguments):
+        """Retourne l'événement correspondant au message OSC, ou None si l'adresse est inconnue."""
+        handler = self.table.get(address)
+        if handler is None:
+            handler = self.compile_address(address)
+            if handler is None:
+                self.unknown_count += 1
+                return None
+            self.table[address] = handler
+        return handler(arguments)
+
+class OscProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, dispatcher, push_event):
+        self.dispatcher = dispatcher
+        self.push_event = push_event
+
+    def datagram_received(self, data, addr):
+        try:
+            messages = parse_osc_packet(data)
+        except ValueError as e:
+            print(f"/!/ Paquet OSC de {addr[0]} ignoré : {e}")
+            return
+        for address, arguments in messages:
+            try:
+                event = self.dispatcher.dispatch(address, arguments)
+            except (IndexError, ValueError) as e:
+                print(f"/!/ Message OSC '{address}' {arguments} ignoré : {e}")
+                continue
+            if event is not None:
+                self.push_event(event)
+
+class OscInputServer:
+    """Ecoute OSC sur UDP dans sa propre boucle asyncio (thread dédié), événements transmis par push_event."""
+
+    def __init__(self, push_event, host='127.0.0.1', port=0, is_valid_param=None):
+        self.dispatcher = OscDispatcher(is_valid_param)
+        self.push_event = push_event
+        self.host = host
+        self.port = port
+        self.loop = None
+        self.transport = None
+        self.stopped = None
+        self.ready = threading.Event()
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.transport, protocol = await self.loop.create_datagram_endpoint(
+            lambda: OscProtocol(self.dispatcher, self.push_event), local_addr=(self.host, self.port))
+        self.port = self.transport.get_extra_info('sockname')[1]
+        self.stopped = self.loop.create_future()
+        self.ready.set()
+        try:
+            await self.stopped
+        finally:
+            self.transport.close()
+
+    def start_in_thread(self):
+        """Lance l'écoute dans un thread dédié et attend qu'elle soit prête. Retourne le port utilisé."""
+        def run():
+            try:
+                asyncio.run(self.serve())
+            except Exception as e:
+                print(f"/!/ Entrée OSC arrêtée : {e}")
+                self.ready.set()
+        threading.Thread(target=run, daemon=True).start()
+        self.ready.wait(5.0)
+        return self.port
+
+    def stop(self):
+        if self.loop is not None and self.stopped is not None:
+            self.loop.call_soon_threadsafe(lambda: self.stopped.done() or self.stopped.set_result(None))
+
+
+# ==============================================================================
+# UNITARY TESTS
+# ==============================================================================
+
+def _dispatch_osc(address, arguments):
+    return OscDispatcher().dispatch(address, arguments)
+
+def _table_scenario(addresses):
+    # seule chant_emilie/mute existe : les autres adresses ne sont ni transmises ni mémorisées
+    dispatcher = OscDispatcher(lambda section, key: key == 'chant_emilie/mute')
+    events = [dispatcher.dispatch(address, ['ON']) for address in addresses]
+    return events, [address for address in dispatcher.table if address.startswith('/mix/')], dispatcher.unknown_count
+
+def _localhost_scenario(packets):
+    # envoie des paquets OSC à un serveur local et retourne les événements reçus
+    events = []
+    server = OscInputServer(events.append, '127.0.0.1', 0)
+
+    async def scenario():
+        serve_task = asyncio.ensure_future(server.serve())
+        while not server.ready.is_set():
+            await asyncio.sleep(0.001)
+        transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            asyncio.DatagramProtocol, remote_addr=('127.0.0.1', server.port))
+        for packet in packets:
+            transport.sendto(packet)
+        await asyncio.sleep(0.02)
+        transport.close()
+        server.stopped.set_result(None)
+        await serve_task
+
+    asyncio.run(scenario())
+    return events
+
+_BUNDLE = (b'#bundle\x00' + b'\x00' * 8
+           + struct.pack('>i', len(encode_osc_message('/song/next'))) + encode_osc_message('/song/next'))
+
+TEST_PLAN: test_utility.TestPlan = [
+    {
+        "chapter_title": "1: Décodage OSC",
+        "tests": [
+            {
+                "test_title": "Message avec entier, flottant et chaîne",
+                "function_under_test": parse_osc_packet,
+                "expected_return": [('/mix/chant_alain/pan/facade', [3, -5.0, 'left 30'])],
+                "function_arguments": [encode_osc_message('/mix/chant_alain/pan/facade', [3, -5.0, 'left 30'])]
+            },
+            {
+                "test_title": "Bundle",
+                "function_under_test": parse_osc_packet,
+                "expected_return": [('/song/next', [])],
+                "function_arguments": [_BUNDLE]
+            },
+        ]
+    },
+    {
+        "chapter_title": "2: Table de dispatch des adresses OSC",
+        "tests": [
+            {
+                "test_title": "/song/pc 3 = programme 3 (Program Change 2 sur le câble)",
+                "function_under_test": _dispatch_osc,
+                "expected_return": ('pc', 2),
+                "function_arguments": ['/song/pc', [3]]
+            },
+            {
+                "test_title": "/song/pc 2:5 = banque 2, programme 5",
+                "function_under_test": _dispatch_osc,
+                "expected_return": ('pc', 2 * 128 + 4),
+                "function_arguments": ['/song/pc', ['2:5']]
+            },
+            {
+                "test_title": "/mix/... = ligne [MIX]",
+                "function_under_test": _dispatch_osc,
+                "expected_return": ('param', ('chant_emilie/send/facade', '-5')),
+                "function_arguments": ['/mix/Chant_Emilie/send/facade', [-5.0]]
+            },
+            {
+                "test_title": "/bpm 120",
+                "function_under_test": _dispatch_osc,
+                "expected_return": ('param', ('bpm', '120')),
+                "function_arguments": ['/bpm', [120]]
+            },
+            {
+                "test_title": "Adresse inconnue",
+                "function_under_test": _dispatch_osc,
+                "expected_return": None,
+                "function_arguments": ['/lights/on', []]
+            },
+            {
+                "test_title": "/mix/quit n'est pas une commande de la console",
+                "function_under_test": _dispatch_osc,
+                "expected_return": None,
+                "function_arguments": ['/mix/quit', []]
+            },
+            {
+                "test_title": "Seules les clés valides sont mémorisées",
+                "function_under_test": _table_scenario,
+                "expected_return": ([('param', ('chant_emilie/mute', 'ON')), None, None, ('param', ('chant_emilie/mute', 'ON'))],
+                                    ['/mix/chant_emilie/mute'], 2),
+                "function_arguments": [['/mix/chant_emilie/mute', '/mix/x1', '/mix/x2', '/mix/chant_emilie/mute']]
+            },
+        ]
+    },
+    {
+        "chapter_title": "3: Réception UDP sur localhost",
+        "tests": [
+            {
+                "test_title": "PC, PC hors plage, ligne [PEDALS] et paquet invalide",
+                "function_under_test": _localhost_scenario,
+                "expected_return": [('pc', 2), ('param', ('alain_mfx', 'PC 90'))],
+                "function_arguments": [[encode_osc_message('/song/pc', [3]), encode_osc_message('/song/pc', [129]), b'garbage',
+                                        encode_osc_message('/pedal/alain_mfx', ['PC', 90])]]
+            },
+        ]
+    },
+]
+
+def run_unitary_tests():
+    return (test_utility.run_test_plan(TEST_PLAN))
@@ -0,0 +1,187 @@
+# module: realtime
+# Ordonnancement temps réel (SCHED_FIFO / SCHED_RR) et affinité CPU du chemin de sortie MIDI (Linux)
+import multiprocessing
+import os
+import statistics
+import time
+import test_utility
+
+REALTIME_POLICIES = {'fifo': 'SCHED_FIFO', 'rr': 'SCHED_RR'}
+REALTIME_DEFAULT_PRIORITY = 50
+JITTER_TAP_COUNT = 200          # frappes mesurées par passe du benchmark
+JITTER_INTERVAL_S = 0.005       # intervalle entre deux frappes du benchmark
+
+def get_realtime_config(config):
+    """
+    Retourne la configuration temps réel ("realtime" dans config.json) :
+    {'policy': ..., 'priority': ..., 'cpus': [...]}.
+    Une politique vide garde l'ordonnancement normal, une liste de CPU vide garde l'affinité héritée.
+    """
+    realtime_config = config.get('realtime', {})
+    policy = str(realtime_config.get('policy', '')).lower()
+    if len(policy) > 0 and policy not in REALTIME_POLICIES:
+        print(f"/!/ Politique d'ordonnancement '{policy}' inconnue (attendu : {', '.join(REALTIME_POLICIES)}) : ignorée.")
+        policy = ''
+    return {
+        'policy': policy,
+        'priority': int(realtime_config.get('priority', REALTIME_DEFAULT_PRIORITY)),
+        'cpus': [int(cpu) for cpu in realtime_config.get('cpus', [])],
+    }
+
+def is_realtime_enabled(realtime_config):
+    return len(realtime_config['policy']) > 0 or len(realtime_config['cpus']) > 0
+
+def get_scheduling():
+    """Retourne (politique, priorité, CPU autorisés) du thread appelant, ou None hors Linux."""
+    if not hasattr(os, 'sched_setscheduler'):
+        return None
+    return (os.sched_getscheduler(0), os.sched_getparam(0).sched_priority, os.sched_getaffinity(0))
+
+def set_scheduling(scheduling):
+    """Rétablit un état relevé par get_scheduling() (repasser de temps réel à normal ne demande aucun privilège)."""
+    if scheduling is None:
+        return
+    policy, priority, cpus = scheduling
+    os.sched_setscheduler(0, policy, os.sched_param(priority))
+    os.sched_setaffinity(0, cpus)
+
+def apply_realtime(realtime_config):
+    """
+    Applique l'affinité CPU puis la politique temps réel au thread appelant (sous Linux, pid 0 désigne
+    le thread, pas tout le processus). Les threads créés ensuite héritent de ces réglages : à appeler une
+    fois les autres threads lancés. Sans privilège (CAP_SYS_NICE, ou rtprio dans limits.conf) chaque
+    réglage refusé est abandonné et le thread garde l'ordonnancement normal.
+    Retourne le compte-rendu de ce qui a été appliqué.
+    """
+    if not hasattr(os, 'sched_setscheduler'):
+        return "ordonnancement temps réel indisponible sur ce système (Linux uniquement)"
+    report = []
+    if len(realtime_config['cpus']) > 0:
+        try:
+            os.sched_setaffinity(0, realtime_config['cpus'])
+            report.append(f"CPU {','.join(str(cpu) for cpu in sorted(os.sched_getaffinity(0)))}")
+        except PermissionError:
+            report.append("/!/ affinité CPU refusée (privilèges insuffisants)")
+        except OSError as e:
+            report.append(f"/!/ affinité CPU {realtime_config['cpus']} impossible ({e.strerror})")
+    if len(realtime_config['policy']) > 0:
+        policy_name = REALTIME_POLICIES[realtime_config['policy']]
+        policy = getattr(os, policy_name)
+        priority = min(max(realtime_config['priority'], os.sched_get_priority_min(policy)), os.sched_get_priority_max(policy))
+        try:
+            os.sched_setscheduler(0, policy, os.sched_param(priority))
+            report.append(f"{policy_name} priorité {priority}")
+        except PermissionError:
+            report.append(f"/!/ {policy_name} refusé (privilèges insuffisants : CAP_SYS_NICE ou rtprio dans limits.conf), "
+                          f"ordonnancement normal conservé")
+        except OSError as e:
+            report.append(f"/!/ {policy_name} impossible ({e.strerror}), ordonnancement normal conservé")
+    return ', '.join(report)
+
+
+# ==============================================================================
+# BENCHMARK
+# ==============================================================================
+
+def _burn_cpu(stop_event):
+    # charge concurrente (bureau, autres applications) pendant le benchmark
+    while not stop_event.is_set():
+        sum(i * i for i in range(1000))
+
+def measure_tap_jitter(tap_count=JITTER_TAP_COUNT, interval_s=JITTER_INTERVAL_S):
+    """
+    Reproduit la boucle du tap tempo (frappes calées sur l'heure de la première, cf. send_tap_tempo)
+    et retourne les retards de chaque frappe sur son heure prévue, en secondes.
+    """
+    lateness = []
+    first_tap = time.perf_counter()
+    for i in range(1, tap_count + 1):
+        time.sleep(max(0.0, first_tap + i * interval_s - time.perf_counter()))
+        lateness.append(time.perf_counter() - (first_tap + i * interval_s))
+    return lateness
+
+def describe_jitter(lateness):
+    ordered = sorted(lateness)
+    return (f"retard moyen {statistics.mean(ordered) * 1e6:.0f} µs, "
+            f"p99 {ordered[int(len(ordered) * 0.99) - 1] * 1e6:.0f} µs, maximum {ordered[-1] * 1e6:.0f} µs")
+
+def benchmark_realtime_jitter(realtime_config, tap_count=JITTER_TAP_COUNT, interval_s=JITTER_INTERVAL_S):
+    """
+    Compare la précision du tap tempo avec l'ordonnancement normal puis avec les réglages temps réel,
+    pendant qu'un processus par CPU consomme du temps de calcul. Sans politique configurée, SCHED_FIFO est essayé.
+    """
+    if not is_realtime_enabled(realtime_config):
+        realtime_config = dict(realtime_config, policy='fifo')
+    stop_event = multiprocessing.Event()
+    burners = [multiprocessing.Process(target=_burn_cpu, args=(stop_event,), daemon=True) for _ in range(os.cpu_count() or 1)]
+    for burner in burners:
+        burner.start()
+    try:
+        print(f"Tap tempo, {tap_count} frappes à {interval_s * 1000:g} ms, {len(burners)} processus de charge :")
+        print(f"  ordonnancement normal : {describe_jitter(measure_tap_jitter(tap_count, interval_s))}")
+        previous = get_scheduling()
+        report = apply_realtime(realtime_config)
+        print(f"  temps réel ({report}) : {describe_jitter(measure_tap_jitter(tap_count, interval_s))}")
+        set_scheduling(previous)
+    finally:
+        stop_event.set()
+        for burner in burners:
+            burner.join(2.0)
+
+
+# ==============================================================================
+# UNITARY TESTS
+# ==============================================================================
+
+def _apply_scenario(realtime_config):
+    # les réglages sont appliqués (ou proprement refusés) puis l'état d'origine est rétabli
+    previous = get_scheduling()
+    report = apply_realtime(realtime_config)
+    set_scheduling(previous)
+    return isinstance(report, str) and get_scheduling() == previous
+
+TEST_PLAN: test_utility.TestPlan = [
+    {
+        "chapter_title": "1: Configuration",
+        "tests": [
+            {
+                "test_title": "Valeurs par défaut : désactivé",
+                "function_under_test": get_realtime_config,
+                "expected_return": {'policy': '', 'priority': 50, 'cpus': []},
+                "function_arguments": [{}]
+            },
+            {
+                "test_title": "SCHED_RR sur les CPU 2 et 3",
+                "function_under_test": get_realtime_config,
+                "expected_return": {'policy': 'rr', 'priority': 20, 'cpus': [2, 3]},
+                "function_arguments": [{'realtime': {'policy': 'RR', 'priority': 20, 'cpus': [2, 3]}}]
+            },
+            {
+                "test_title": "Politique inconnue ignorée",
+                "function_under_test": get_realtime_config,
+                "expected_return": {'policy': '', 'priority': 50, 'cpus': []},
+                "function_arguments": [{'realtime': {'policy': 'idle'}}]
+            },
+        ]
+    },
+    {
+        "chapter_title": "2: Application et retour à l'état initial",
+        "tests": [
+            {
+                "test_title": "SCHED_FIFO et CPU 0 (accepté ou refusé selon les privilèges)",
+                "function_under_test": _apply_scenario,
+                "expected_return": True,
+                "function_arguments": [{'policy': 'fifo', 'priority': 10, 'cpus': [0]}]
+            },
+            {
+                "test_title": "CPU inexistant : refus sans exception",
+                "function_under_test": _apply_scenario,
+                "expected_return": True,
+                "function_arguments": [{'policy': '', 'priority': 50, 'cpus': [4096]}]
+            },
+        ]
+    },
+]
+
+def run_unitary_tests():
+    return (test_utility.run_test_plan(TEST_PLAN))
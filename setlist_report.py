@@ -0,0 +1,117 @@
+# module: setlist_report
+# Mode --report : coût de chaque changement de chanson de la setlist (messages, octets, temps sur le câble, tap tempo)
+import numpy as np
+import smf_writer
+import test_utility
+
+REPORT_LATENCY_BUDGET_MS = 100.0    # temps sur le câble au-delà duquel une transition est signalée
+
+def get_report_config(config):
+    """Retourne la configuration du rapport ("report" dans config.json) : {'latency_budget_ms': ...}."""
+    report_config = config.get('report', {})
+    return {'latency_budget_ms': float(report_config.get('latency_budget_ms', REPORT_LATENCY_BUDGET_MS))}
+
+class NullPort:
+    """Port de sortie sans matériel : les compteurs du MidiOutputBuffer qui l'alimente suffisent au rapport."""
+
+    def send_message(self, midi_msg):
+        pass
+
+    def close(self):
+        pass
+
+def analyze_transitions(cumulative_messages, cumulative_bytes, tap_durations, budget_s):
+    """
+    Calcule le coût de toutes les transitions d'un coup, à partir des compteurs cumulés de chaque port
+    relevés après chaque transition (tableaux transitions x ports) et de la durée du tap tempo de chaque transition.
+    Temps sur le câble : octets envoyés x durée d'un octet à 31250 bauds, par port (les ports émettent en parallèle).
+    """
+    cumulative_messages = np.asarray(cumulative_messages, dtype=np.int64).reshape(len(tap_durations), -1)
+    cumulative_bytes = np.asarray(cumulative_bytes, dtype=np.int64).reshape(len(tap_durations), -1)
+    messages = np.diff(cumulative_messages, axis=0, prepend=0)
+    sent_bytes = np.diff(cumulative_bytes, axis=0, prepend=0)
+    wire_s = sent_bytes * smf_writer.MIDI_BYTE_DURATION_S
+    worst_wire_s = wire_s.max(axis=1, initial=0.0)
+    return {
+        'messages': messages,
+        'bytes': sent_bytes,
+        'wire_s': wire_s,
+        'worst_wire_s': worst_wire_s,
+        'tap_s': np.asarray(tap_durations, dtype=np.float64),
+        'over_budget': worst_wire_s > budget_s,
+    }
+
+def extract_errors(output):
+    """Lignes d'erreur ('/!/ ...') de la sortie capturée d'une transition."""
+    return [line.strip() for line in output.splitlines() if line.strip().startswith('/!/')]
+
+def format_report(transition_names, port_names, analysis, budget_s, errors=None):
+    """
+    Retourne les lignes du rapport : une par transition, suivie de ses erreurs (errors : une liste de lignes
+    '/!/ ...' par transition, cf. extract_errors), puis le bilan.
+    """
+    errors = errors if errors is not None else [[] for _ in transition_names]
+    lines = []
+    for i, name in enumerate(transition_names):
+        ports = '  '.join(f"{port_name}: {analysis['messages'][i, p]} msg/{analysis['bytes'][i, p]} o/"
+                          f"{analysis['wire_s'][i, p] * 1000:.1f} ms" for p, port_name in enumerate(port_names))
+        tap = f"  tap tempo {analysis['tap_s'][i]:.2f} s" if analysis['tap_s'][i] > 0 else ''
+        flag = f"  /!/ au-delà du budget de {budget_s * 1000:g} ms" if analysis['over_budget'][i] else ''
+        error_flag = f"  /!/ {len(errors[i])} erreur(s)" if len(errors[i]) > 0 else ''
+        lines.append(f"{name}  |  {ports}{tap}{flag}{error_flag}")
+        lines += [f"    {error}" for error in errors[i]]
+    if len(transition_names) > 0:
+        worst = int(np.argmax(analysis['worst_wire_s']))
+        lines.append(f"Bilan : {len(transition_names)} transitions, {int(analysis['messages'].sum())} messages, "
+                     f"{int(analysis['bytes'].sum())} octets ; transition la plus longue sur le câble : "
+                     f"{transition_names[worst]} ({analysis['worst_wire_s'][worst] * 1000:.1f} ms) ; "
+                     f"{int(analysis['over_budget'].sum())} au-delà du budget ; "
+                     f"{sum(1 for transition_errors in errors if len(transition_errors) > 0)} en erreur ; "
+                     f"tap tempo cumulé {analysis['tap_s'].sum():.1f} s")
+    return lines
+
+
+# ==============================================================================
+# UNITARY TESTS
+# ==============================================================================
+
+def _analyze_scenario(cumulative_bytes, tap_durations, budget_ms):
+    # messages de 2 octets pour simplifier
+    analysis = analyze_transitions([b // 2 for b in cumulative_bytes], cumulative_bytes, tap_durations, budget_ms / 1000)
+    return (analysis['bytes'].tolist(), [round(float(w) * 1000, 2) for w in analysis['worst_wire_s']],
+            analysis['over_budget'].tolist())
+
+def _format_scenario():
+    analysis = analyze_transitions([[3, 0], [4, 2]], [[9, 0], [12, 6]], [5.14, 0.0], 0.001)
+    errors = [[], extract_errors("\n- Mappage trouvé\n/!/ Commande Pédale non exécutée: 'x'\nPC envoyé")]
+    return format_report(['1: a.txt', '2: b.txt'], ['CQ18', 'PED'], analysis, 0.001, errors)
+
+TEST_PLAN: test_utility.TestPlan = [
+    {
+        "chapter_title": "1: Coût des transitions",
+        "tests": [
+            {
+                "test_title": "Octets par transition et par port, temps sur le câble, budget",
+                "function_under_test": _analyze_scenario,
+                # 3125 octets = 1 s à 31250 bauds (10 bits par octet)
+                "expected_return": ([[300, 20], [3125, 20], [0, 0]], [96.0, 1000.0, 0.0], [False, True, False]),
+                "function_arguments": [[300, 20, 3425, 40, 3425, 40], [5.14, 0.0, 0.0], 100]
+            },
+            {
+                "test_title": "Rapport",
+                "function_under_test": _format_scenario,
+                "expected_return": [
+                    "1: a.txt  |  CQ18: 3 msg/9 o/2.9 ms  PED: 0 msg/0 o/0.0 ms  tap tempo 5.14 s  /!/ au-delà du budget de 1 ms",
+                    "2: b.txt  |  CQ18: 1 msg/3 o/1.0 ms  PED: 2 msg/6 o/1.9 ms  /!/ au-delà du budget de 1 ms  /!/ 1 erreur(s)",
+                    "    /!/ Commande Pédale non exécutée: 'x'",
+                    "Bilan : 2 transitions, 6 messages, 18 octets ; transition la plus longue sur le câble : "
+                    "1: a.txt (2.9 ms) ; 2 au-delà du budget ; 1 en erreur ; tap tempo cumulé 5.1 s",
+                ],
+                "function_arguments": []
+            },
+        ]
+    },
+]
+
+def run_unitary_tests():
+    return (test_utility.run_test_plan(TEST_PLAN))
@@ -0,0 +1,145 @@
+# module: show_mode
+# Mode --show : setlist préchargée, ramasse-miettes gelé, contrôle des allocations à chaque changement de chanson
+import gc
+import sys
+import time
+import metrics
+import test_utility
+
+# Seuils du ramasse-miettes pendant le show : les objets préchargés sont gelés (gc.freeze), les
+# collections de génération 0 deviennent rares et ne parcourent que les objets temporaires
+SHOW_GC_THRESHOLDS = (50000, 50, 100)
+# bornes (en secondes) de l'histogramme des pauses du ramasse-miettes
+GC_PAUSE_BUCKETS = (0.0001, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.05)
+
+def freeze_heap(thresholds=SHOW_GC_THRESHOLDS):
+    """
+    Collecte une dernière fois, gèle tous les objets existants (ils ne seront plus parcourus
+    par le ramasse-miettes) et relève ses seuils. Retourne le nombre d'objets gelés.
+    """
+    gc.collect()
+    gc.freeze()
+    gc.set_threshold(*thresholds)
+    return gc.get_freeze_count()
+
+class GcPauseMonitor:
+    """
+    Mesure chaque passage du ramasse-miettes (gc.callbacks) : nombre de collections
+    par génération et histogramme des durées de pause.
+    """
+
+    def __init__(self):
+        self.pauses = metrics.Histogram(GC_PAUSE_BUCKETS)
+        self.collections = [0, 0, 0]
+        self.max_pause = 0.0
+        self.start_time = None
+
+    def callback(self, phase, info):
+        if phase == 'start':
+            self.start_time = time.perf_counter()
+        elif self.start_time is not None:
+            pause = time.perf_counter() - self.start_time
+            self.start_time = None
+            self.pauses.observe(pause)
+            self.collections[info['generation']] += 1
+            self.max_pause = max(self.max_pause, pause)
+
+    def start(self):
+        gc.callbacks.append(self.callback)
+
+    def stop(self):
+        if self.callback in gc.callbacks:
+            gc.callbacks.remove(self.callback)
+
+    def describe(self):
+        return (f"{self.pauses.count} collections (générations 0/1/2 : {'/'.join(str(c) for c in self.collections)}), "
+                f"pause max {self.max_pause * 1000:.2f} ms, cumul {self.pauses.sum * 1000:.2f} ms")
+
+class TransitionAllocationCheck:
+    """
+    Compte les blocs mémoire alloués et non libérés (sys.getallocatedblocks) par chaque changement
+    de chanson. Une fois la setlist préchargée, l'objectif est zéro : un changement de chanson ne
+    fait que réutiliser des programmes compilés et des buffers préalloués.
+    """
+
+    def __init__(self, gc_monitor):
+        self.gc_monitor = gc_monitor
+        self.blocks_before = 0
+        self.collections_before = 0
+        self.transitions = 0
+        self.allocating_transitions = 0
+        self.total_blocks = 0
+
+    def begin(self):
+        self.collections_before = self.gc_monitor.pauses.count
+        self.blocks_before = sys.getallocatedblocks()
+
+    def end(self, description):
+        blocks = sys.getallocatedblocks() - self.blocks_before
+        collections = self.gc_monitor.pauses.count - self.collections_before
+        self.transitions += 1
+        self.total_blocks += blocks
+        if blocks > 0:
+            self.allocating_transitions += 1
+        gc_desc = f", {collections} passage(s) du ramasse-miettes" if collections > 0 else ''
+        print(f"[show] {description} : {blocks:+d} blocs alloués{gc_desc}")
+        return blocks
+
+    def describe(self):
+        return (f"{self.transitions} changement(s) de chanson, {self.allocating_transitions} avec des allocations "
+                f"restantes ({self.total_blocks:+d} blocs au total)")
+
+
+# ==============================================================================
+# UNITARY TESTS
+# ==============================================================================
+
+_retained = []
+
+def _allocation_scenario(retained_count):
+    # une transition qui conserve retained_count objets est détectée, une transition sans effet ne l'est pas
+    check = TransitionAllocationCheck(GcPauseMonitor())
+    check.begin()
+    idle_blocks = check.end("test")
+    check.begin()
+    _retained.extend([object() for _ in range(retained_count)])
+    retained_blocks = check.end("test")
+    _retained.clear()
+    return idle_blocks < retained_count // 10, retained_blocks >= retained_count, check.allocating_transitions >= 1
+
+def _gc_monitor_scenario():
+    monitor = GcPauseMonitor()
+    monitor.start()
+    gc.collect(0)
+    gc.collect(2)
+    monitor.stop()
+    gc.collect()
+    return monitor.pauses.count, monitor.collections[0] >= 1, monitor.collections[2] >= 1
+
+TEST_PLAN: test_utility.TestPlan = [
+    {
+        "chapter_title": "1: Ramasse-miettes",
+        "tests": [
+            {
+                "test_title": "Deux collections mesurées, aucune après l'arrêt",
+                "function_under_test": _gc_monitor_scenario,
+                "expected_return": (2, True, True),
+                "function_arguments": []
+            },
+        ]
+    },
+    {
+        "chapter_title": "2: Allocations par changement de chanson",
+        "tests": [
+            {
+                "test_title": "Objets conservés par une transition",
+                "function_under_test": _allocation_scenario,
+                "expected_return": (True, True, True),
+                "function_arguments": [1000]
+            },
+        ]
+    },
+]
+
+def run_unitary_tests():
+    return (test_utility.run_test_plan(TEST_PLAN))
@@ -0,0 +1,167 @@
+# module: smf_writer
+# Mode --render : écriture d'un Standard MIDI File (format 1) à la place des ports de sortie
+import shutil
+import tempfile
+import test_utility
+
+# 1 tick = 1 ms : 1000 ticks par noire au tempo de 60 BPM (1 000 000 µs par noire)
+SMF_TICKS_PER_QUARTER = 1000
+SMF_TEMPO_US = 1000000
+# durée d'un octet sur une liaison MIDI DIN (31250 bauds, 10 bits par octet)
+MIDI_BYTE_DURATION_S = 10 / 31250
+# pause entre deux chansons de la setlist rendue (applaudissements, annonce)
+RENDER_SONG_GAP_S = 5.0
+
+def encode_variable_length(value):
+    """Entier -> quantité de longueur variable SMF (7 bits par octet, bit 7 à 1 sauf sur le dernier)."""
+    encoded = bytearray((value & 0x7F,))
+    value >>= 7
+    while value > 0:
+        encoded.insert(0, 0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(encoded)
+
+def encode_meta_event(meta_type, data):
+    return bytes((0xFF, meta_type)) + encode_variable_length(len(data)) + data
+
+class VirtualClock:
+    """Horloge du rendu : sleep() avance le temps au lieu d'attendre (tap tempo, pauses entre chansons)."""
+
+    def __init__(self):
+        self.time = 0.0
+
+    def now(self):
+        return self.time
+
+    def sleep(self, duration):
+        self.time += max(0.0, duration)
+
+class SmfWriter:
+    """
+    Standard MIDI File de format 1 écrit au fil de l'eau : chaque piste est accumulée dans un fichier
+    temporaire (événements déjà encodés avec leur delta-time), puis les pistes sont recopiées à la
+    suite de l'en-tête par close(). Le show complet n'est jamais gardé en mémoire.
+    La piste 0 contient le tempo et les marqueurs (un par chanson), puis une piste par nom de track_names.
+    """
+
+    def __init__(self, path, track_names):
+        self.path = path
+        self.tracks = []    # [fichier temporaire, dernier tick]
+        for name in ['Setlist'] + list(track_names):
+            self.tracks.append([tempfile.TemporaryFile(), 0])
+            self.write_event(len(self.tracks) - 1, 0, encode_meta_event(0x03, name.encode('utf-8')))
+        self.write_event(0, 0, encode_meta_event(0x51, SMF_TEMPO_US.to_bytes(3, 'big')))
+
+    def get_tick(self, seconds):
+        return int(round(seconds * 1000000 / SMF_TEMPO_US * SMF_TICKS_PER_QUARTER))
+
+    def write_event(self, track_index, tick, data):
+        track = self.tracks[track_index]
+        tick = max(tick, track[1])
+        track[0].write(encode_variable_length(tick - track[1]) + data)
+        track[1] = tick
+
+    def write_midi_message(self, track_index, seconds, midi_msg):
+        midi_msg = bytes(midi_msg)
+        if midi_msg[0] == 0xF0:
+            # SysEx : la longueur suit le 0xF0
+            midi_msg = b'\xF0' + encode_variable_length(len(midi_msg) - 1) + midi_msg[1:]
+        self.write_event(track_index, self.get_tick(seconds), midi_msg)
+
+    def add_marker(self, seconds, text):
+        self.write_event(0, self.get_tick(seconds), encode_meta_event(0x06, text.encode('utf-8')))
+
+    def close(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'MThd' + (6).to_bytes(4, 'big') + (1).to_bytes(2, 'big')
+                    + len(self.tracks).to_bytes(2, 'big') + SMF_TICKS_PER_QUARTER.to_bytes(2, 'big'))
+            for track_file, _ in self.tracks:
+                track_file.write(encode_variable_length(0) + encode_meta_event(0x2F, b''))
+                f.write(b'MTrk' + track_file.tell().to_bytes(4, 'big'))
+                track_file.seek(0)
+                shutil.copyfileobj(track_file, f)
+                track_file.close()
+
+class SmfTrackPort:
+    """
+    Remplace un port rtmidi de sortie (send_message) par une piste du fichier. Chaque message est daté
+    à l'heure de la VirtualClock, retardée par le temps de transmission des messages précédents
+    sur ce port : un changement de chanson s'étale dans le fichier comme sur le câble.
+    """
+
+    def __init__(self, writer, track_index, clock):
+        self.writer = writer
+        self.track_index = track_index
+        self.clock = clock
+        self.busy_until = 0.0
+
+    def send_message(self, midi_msg):
+        start = max(self.clock.now(), self.busy_until)
+        self.writer.write_midi_message(self.track_index, start, midi_msg)
+        self.busy_until = start + len(midi_msg) * MIDI_BYTE_DURATION_S
+
+
+# ==============================================================================
+# UNITARY TESTS
+# ==============================================================================
+
+def _render_scenario(messages):
+    # écrit [(secondes, message)] sur une piste 'CQ18' et retourne le fichier produit
+    with tempfile.TemporaryDirectory() as directory:
+        path = f"{directory}/test.mid"
+        clock = VirtualClock()
+        writer = SmfWriter(path, ['CQ18'])
+        port = SmfTrackPort(writer, 1, clock)
+        writer.add_marker(0.0, 'chanson1')
+        for seconds, midi_msg in messages:
+            clock.sleep(seconds - clock.now())
+            port.send_message(midi_msg)
+        writer.close()
+        with open(path, 'rb') as f:
+            return f.read()
+
+TEST_PLAN: test_utility.TestPlan = [
+    {
+        "chapter_title": "1: Quantités de longueur variable",
+        "tests": [
+            {
+                "test_title": "0",
+                "function_under_test": encode_variable_length,
+                "expected_return": b'\x00',
+                "function_arguments": [0]
+            },
+            {
+                "test_title": "128 sur deux octets",
+                "function_under_test": encode_variable_length,
+                "expected_return": b'\x81\x00',
+                "function_arguments": [128]
+            },
+            {
+                "test_title": "0x0FFFFFFF (maximum SMF)",
+                "function_under_test": encode_variable_length,
+                "expected_return": b'\xff\xff\xff\x7f',
+                "function_arguments": [0x0FFFFFFF]
+            },
+        ]
+    },
+    {
+        "chapter_title": "2: Fichier SMF format 1",
+        "tests": [
+            {
+                "test_title": "Marqueur, deux PC consécutifs (temps de transmission) puis un PC à 0,5 s",
+                "function_under_test": _render_scenario,
+                "expected_return": (
+                    b'MThd\x00\x00\x00\x06\x00\x01\x00\x02\x03\xe8'
+                    b'MTrk\x00\x00\x00\x22'
+                    b'\x00\xff\x03\x07Setlist\x00\xff\x51\x03\x0f\x42\x40\x00\xff\x06\x08chanson1\x00\xff\x2f\x00'
+                    b'MTrk\x00\x00\x00\x16'
+                    b'\x00\xff\x03\x04CQ18\x00\xc0\x01\x01\xc0\x02\x83\x73\xc0\x03\x00\xff\x2f\x00'
+                ),
+                "function_arguments": [[(0.0, b'\xc0\x01'), (0.0, b'\xc0\x02'), (0.5, b'\xc0\x03')]]
+            },
+        ]
+    },
+]
+
+def run_unitary_tests():
+    return (test_utility.run_test_plan(TEST_PLAN))
@@ -0,0 +1,247 @@
+# module: song_library
+# Chargement des fichiers chansons avec modèles (include) et cache de compilation
+import collections
+import configparser
+import os
+import tempfile
+import test_utility
+
+SONG_SECTIONS = ('SONG_INFO', 'MIX', 'PEDALS')
+
+def read_song_sections(filepath):
+    """
+    Lit un fichier chanson (.ini-like) et retourne {section: {clé: valeur}} pour les sections
+    SONG_INFO, MIX et PEDALS, dans l'ordre du fichier.
+    """
+    parser = configparser.ConfigParser()
+    with open(filepath, 'r') as f:
+        # Ajouter une section factice si le fichier n'en a pas, puis le re-parser
+        content = "[commands]\n" + f.read()
+        parser.read_string(content)
+
+    return {
+        section: {key: parser.get(section, key) for key in parser.options(section)} if parser.has_section(section) else {}
+        for section in SONG_SECTIONS
+    }
+
+class SongLibrary:
+    """
+    Bibliothèque des fichiers chansons d'un répertoire.
+
+    Un fichier peut hériter d'un ou plusieurs modèles : '[SONG_INFO] include = modele1.txt, modele2.txt'
+    (chemins relatifs au répertoire des chansons). Les modèles sont appliqués dans l'ordre,
+    puis les lignes du fichier lui-même, chaque clé redéfinie remplaçant la précédente.
+    Un modèle peut lui-même inclure d'autres modèles.
+
+    Chaque fichier n'est lu et compilé qu'une fois (tant qu'il n'est pas modifié) : une chanson
+    ne stocke que ses propres lignes et partage le résultat compilé de ses modèles.
+    Un index des dépendances (modèle -> fichiers qui l'incluent) permet, quand un modèle est
+    modifié, de n'invalider que les chansons qui en dépendent.
+    """
+
+    def __init__(self, songs_dir):
+        self.songs_dir = songs_dir
+        self.files = {}             # nom -> {'mtime', 'includes', 'sections'}
+        self.dependents = {}        # nom -> noms des fichiers qui l'incluent directement
+        self.layers_cache = {}      # nom -> liste des fichiers à appliquer, du modèle le plus général au fichier
+        self.song_data_cache = {}   # nom -> commandes fusionnées (format de execute_commands)
+        self.targets = {}           # (nom, canal) -> cible [MIX] compilée des seules lignes du fichier
+        self.frozen = False         # mode show : les fichiers déjà chargés ne sont plus relus (ni stat)
+
+    def get_dependents(self, filename):
+        """Retourne tous les fichiers qui dépendent (directement ou non) de filename."""
+        dependents = set()
+        pending = [filename]
+        while len(pending) > 0:
+            for dependent in self.dependents.get(pending.pop(), ()):
+                if dependent not in dependents:
+                    dependents.add(dependent)
+                    pending.append(dependent)
+        return dependents
+
+    def invalidate(self, filename):
+        """Oublie ce qui a été compilé pour filename et pour les fichiers qui en dépendent."""
+        invalidated = self.get_dependents(filename) | {filename}
+        for name in invalidated:
+            self.layers_cache.pop(name, None)
+            self.song_data_cache.pop(name, None)
+        # les dépendants gardent la compilation de leurs propres lignes, seul filename est recompilé
+        for key in [key for key in self.targets if key[0] == filename]:
+            del self.targets[key]
+        return invalidated
+
+    def load_file(self, filename):
+        """Lit un fichier s'il n'est pas connu ou s'il a été modifié depuis sa dernière lecture."""
+        filepath = os.path.join(self.songs_dir, filename)
+        mtime = os.stat(filepath).st_mtime_ns
+        known = self.files.get(filename)
+        if known is not None and known['mtime'] == mtime:
+            return known
+
+        sections = read_song_sections(filepath)
+        include_value = sections['SONG_INFO'].pop('include', '')
+        includes = [name.strip() for name in include_value.split(',') if len(name.strip()) > 0]
+
+        if known is not None:
+            self.invalidate(filename)
+            for include in known['includes']:
+                self.dependents.get(include, set()).discard(filename)
+        for include in includes:
+            self.dependents.setdefault(include, set()).add(filename)
+
+        self.files[filename] = {'mtime': mtime, 'includes': includes, 'sections': sections}
+        return self.files[filename]
+
+    def get_layers(self, filename, visiting=()):
+        """
+        Retourne la liste des fichiers à appliquer pour filename (modèles d'abord, filename en dernier),
+        en relisant ceux qui ont été modifiés. Un modèle inclus plusieurs fois n'est appliqué qu'une fois.
+        """
+        file_info = self.load_file(filename)
+        for include in file_info['includes']:
+            # relit les modèles modifiés (ce qui invalide le cache de filename si besoin)
+            if include not in visiting:
+                self.get_layers(include, visiting + (filename,))
+
+        if filename in self.layers_cache:
+            return self.layers_cache[filename]
+
+        layers = []
+        for include in file_info['includes']:
+            if include in visiting or include == filename:
+                print(f"/!/ Inclusion circulaire de '{include}' dans '{filename}'. Ignorée.")
+                continue
+            for layer in self.get_layers(include, visiting + (filename,)):
+                if layer not in layers:
+                    layers.append(layer)
+        layers.append(filename)
+
+        self.layers_cache[filename] = layers
+        return layers
+
+    def get_song_data(self, filename):
+        """
+        Retourne les commandes de la chanson, modèles résolus, au format attendu par execute_commands :
+        {'SONG_COMMANDS': [...], 'MIX_COMMANDS': [...], 'PEDAL_COMMANDS': [...], 'LAYERS': [...], 'SECTIONS': {...}}
+        ('SECTIONS' : {section: {clé: valeur}} fusionnées, cf. song_query).
+        """
+        if self.frozen and filename in self.song_data_cache:
+            return self.song_data_cache[filename]
+        layers = self.get_layers(filename)
+        if filename in self.song_data_cache:
+            return self.song_data_cache[filename]
+
+        merged = {section: {} for section in SONG_SECTIONS}
+        for layer in layers:
+            for section in SONG_SECTIONS:
+                merged[section].update(self.files[layer]['sections'][section])
+
+        song_data = {
+            'SONG_COMMANDS': [f"{key}/{value}" for key, value in merged['SONG_INFO'].items()],
+            'MIX_COMMANDS': [f"{key}/{value}" for key, value in merged['MIX'].items()],
+            'PEDAL_COMMANDS': [f"{key}/{value}" for key, value in merged['PEDALS'].items()],
+            'LAYERS': layers,
+            'SECTIONS': merged,
+        }
+        self.song_data_cache[filename] = song_data
+        return song_data
+
+    def get_mix_target(self, song_data, midi_channel, compile_mix):
+        """
+        Retourne la cible [MIX] compilée d'une chanson pour un canal (les lignes du fichier priment sur celles des modèles).
+        compile_mix(canal, commandes [MIX]) n'est appelé que pour les fichiers pas encore compilés.
+        La fusion est gardée avec les commandes de la chanson (song_data['MIX_TARGETS']) : elle disparaît
+        avec elles quand la chanson ou l'un de ses modèles est modifié, et n'est sinon calculée qu'une fois.
+        """
+        mix_targets = song_data.setdefault('MIX_TARGETS', {})
+        if midi_channel in mix_targets:
+            return mix_targets[midi_channel]
+
+        layer_targets = []
+        for layer in reversed(song_data['LAYERS']):
+            key = (layer, midi_channel)
+            if key not in self.targets:
+                mix_commands = [f"{k}/{v}" for k, v in self.files[layer]['sections']['MIX'].items()]
+                self.targets[key] = compile_mix(midi_channel, mix_commands)
+            layer_targets.append(self.targets[key])
+        mix_targets[midi_channel] = dict(collections.ChainMap(*layer_targets))
+        return mix_targets[midi_channel]
+
+
+# ==============================================================================
+# UNITARY TESTS
+# ==============================================================================
+
+def _write_songs(songs_dir, files):
+    for filename, content in files.items():
+        filepath = os.path.join(songs_dir, filename)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, 'w') as f:
+            f.write(content)
+
+_TEST_FILES = {
+    'templates/base.txt': "[MIX]\nfacade/mute = OFF\nchant/send/facade = 0\n\n[PEDALS]\nmfx = PC 1\n",
+    'templates/rock.txt': "[SONG_INFO]\ninclude = templates/base.txt\nbpm = 120\n\n[MIX]\nchant/send/facade = -5\n",
+    'song1.txt': "[SONG_INFO]\ninclude = templates/rock.txt\nbpm = 140\n\n[PEDALS]\nmfx = PC 7\n",
+    'song2.txt': "[SONG_INFO]\ninclude = templates/base.txt\n",
+}
+
+def _resolved_song(filename):
+    with tempfile.TemporaryDirectory() as songs_dir:
+        _write_songs(songs_dir, _TEST_FILES)
+        song_data = SongLibrary(songs_dir).get_song_data(filename)
+        return song_data['SONG_COMMANDS'], song_data['MIX_COMMANDS'], song_data['PEDAL_COMMANDS'], song_data['LAYERS']
+
+def _compile_scenario():
+    # compile song1 et song2, modifie le modèle de base, puis recompile :
+    # retourne les fichiers compilés à chaque étape et les chansons invalidées
+    with tempfile.TemporaryDirectory() as songs_dir:
+        _write_songs(songs_dir, _TEST_FILES)
+        library = SongLibrary(songs_dir)
+        compiled = []
+        def compile_mix(midi_channel, mix_commands):
+            compiled.append(tuple(mix_commands))
+            return {command.rsplit('/', 1)[0]: command for command in mix_commands}
+
+        for filename in ('song1.txt', 'song2.txt'):
+            library.get_mix_target(library.get_song_data(filename), 1, compile_mix)
+        first_pass = len(compiled)
+
+        _write_songs(songs_dir, {'templates/base.txt': "[MIX]\nfacade/mute = ON\n"})
+        os.utime(os.path.join(songs_dir, 'templates/base.txt'), ns=(0, 1))
+        invalidated = sorted(library.get_dependents('templates/base.txt'))
+        target = dict(library.get_mix_target(library.get_song_data('song1.txt'), 1, compile_mix))
+        return first_pass, compiled[first_pass:], invalidated, sorted(target.values())
+
+TEST_PLAN: test_utility.TestPlan = [
+    {
+        "chapter_title": "1: Modèles de chansons (include)",
+        "tests": [
+            {
+                "test_title": "Résolution de deux niveaux de modèles avec redéfinitions",
+                "function_under_test": _resolved_song,
+                "expected_return": (
+                    ['bpm/140'],
+                    ['facade/mute/OFF', 'chant/send/facade/-5'],
+                    ['mfx/PC 7'],
+                    ['templates/base.txt', 'templates/rock.txt', 'song1.txt'],
+                ),
+                "function_arguments": ['song1.txt']
+            },
+            {
+                "test_title": "Modèle compilé une seule fois, seules ses lignes recompilées après modification",
+                "function_under_test": _compile_scenario,
+                "expected_return": (
+                    4,
+                    [('facade/mute/ON',)],
+                    ['song1.txt', 'song2.txt', 'templates/rock.txt'],
+                    ['chant/send/facade/-5', 'facade/mute/ON'],
+                ),
+                "function_arguments": []
+            },
+        ]
+    },
+]
+
+def run_unitary_tests():
+    return (test_utility.run_test_plan(TEST_PLAN))
@@ -0,0 +1,238 @@
+# module: song_query
+# Index inversé des commandes des chansons : "quelles chansons font SECTION/CLE (= VALEUR) ?"
+import random
+import time
+import test_utility
+
+def normalize_value(value):
+    """Valeur comparée sans tenir compte de la casse ni des espaces multiples ('PC  89' == 'pc 89')."""
+    return ' '.join(value.split()).lower()
+
+def parse_query_term(term_str, out=None):
+    """
+    Parse un critère au format 'SECTION/CLE = VALEUR' (la commande a cette valeur) ou 'SECTION/CLE'
+    (la commande est présente). Retourne (section, clé) ou (section, clé, valeur), ou None si le format est invalide
+    (erreur affichée dans out, sys.stdout par défaut).
+    """
+    value = None
+    if '=' in term_str:
+        term_str, value = term_str.split('=', 1)
+    parts = term_str.strip().split('/', 1)
+    if len(parts) != 2 or len(parts[1].strip()) == 0:
+        print(f"/!/ Critère '{term_str}' invalide : format attendu 'SECTION/CLE[ = VALEUR]'.", file=out)
+        return None
+    section, key = parts[0].strip().upper(), parts[1].strip().lower()
+    if value is None:
+        return (section, key)
+    return (section, key, normalize_value(value))
+
+def iter_bits(bits):
+    """Positions des bits à 1 d'un entier, de la plus basse à la plus haute."""
+    while bits:
+        low_bit = bits & -bits
+        yield low_bit.bit_length() - 1
+        bits ^= low_bit
+
+class SongCommandIndex:
+    """
+    Index inversé des commandes effectives des chansons (modèles résolus) :
+    (section, clé) et (section, clé, valeur) -> ensemble des chansons concernées.
+    Chaque chanson reçoit un identifiant entier compact et un ensemble de chansons est un entier
+    dont le bit n° identifiant est à 1 : l'intersection de plusieurs critères est un simple ET binaire,
+    quel que soit le nombre de chansons. update_song() ne touche que les entrées qui ont changé.
+    """
+
+    def __init__(self):
+        self.song_ids = {}      # fichier -> identifiant
+        self.filenames = []     # identifiant -> fichier (None pour un identifiant libéré)
+        self.free_ids = []      # identifiants libérés, réattribués en priorité
+        self.song_commands = {} # identifiant -> {(section, clé): valeur normalisée}
+        self.postings = {}      # (section, clé) ou (section, clé, valeur) -> ensemble de bits des identifiants
+
+    def get_song_id(self, song_filename):
+        song_id = self.song_ids.get(song_filename)
+        if song_id is None:
+            if len(self.free_ids) > 0:
+                song_id = self.free_ids.pop()
+                self.filenames[song_id] = song_filename
+            else:
+                song_id = len(self.filenames)
+                self.filenames.append(song_filename)
+            self.song_ids[song_filename] = song_id
+        return song_id
+
+    def update_posting(self, term, bit, present):
+        bits = self.postings.get(term, 0)
+        bits = bits | bit if present else bits & ~bit
+        if bits == 0:
+            self.postings.pop(term, None)
+        else:
+            self.postings[term] = bits
+
+    def update_song(self, song_filename, sections):
+        """Ajoute ou met à jour une chanson à partir de ses sections fusionnées {section: {clé: valeur}}."""
+        song_id = self.get_song_id(song_filename)
+        commands = {
+            (section, key.lower()): normalize_value(value)
+            for section, section_commands in sections.items()
+            for key, value in section_commands.items()
+        }
+        previous = self.song_commands.get(song_id, {})
+        if previous == commands:
+            return
+        bit = 1 << song_id
+        for (section, key), value in previous.items():
+            if commands.get((section, key)) != value:
+                self.update_posting((section, key, value), bit, False)
+                if (section, key) not in commands:
+                    self.update_posting((section, key), bit, False)
+        for (section, key), value in commands.items():
+            if previous.get((section, key)) != value:
+                self.update_posting((section, key, value), bit, True)
+                self.update_posting((section, key), bit, True)
+        self.song_commands[song_id] = commands
+
+    def remove_song(self, song_filename):
+        song_id = self.song_ids.pop(song_filename, None)
+        if song_id is None:
+            return
+        bit = 1 << song_id
+        for (section, key), value in self.song_commands.pop(song_id, {}).items():
+            self.update_posting((section, key, value), bit, False)
+            self.update_posting((section, key), bit, False)
+        self.filenames[song_id] = None
+        self.free_ids.append(song_id)
+
+    def query(self, terms):
+        """Retourne les fichiers (triés) des chansons qui vérifient tous les critères (cf. parse_query_term)."""
+        if len(terms) == 0:
+            return []
+        bits = -1
+        for term in terms:
+            bits &= self.postings.get(term, 0)
+            if bits == 0:
+                return []
+        return sorted(self.filenames[song_id] for song_id in iter_bits(bits))
+
+    def get_value(self, song_filename, section, key):
+        """Valeur (normalisée) de SECTION/CLE pour une chanson indexée, ou None."""
+        song_id = self.song_ids.get(song_filename)
+        return None if song_id is None else self.song_commands[song_id].get((section, key))
+
+
+# ==============================================================================
+# BENCHMARK
+# ==============================================================================
+
+def benchmark_song_query(song_count=2000, iterations=1000):
+    """Mesure la construction de l'index et une requête à deux critères sur une bibliothèque synthétique."""
+    rng = random.Random(0)
+    channels = [f"chant_{i}" for i in range(20)]
+    start = time.perf_counter()
+    index = SongCommandIndex()
+    for i in range(song_count):
+        index.update_song(f"chanson{i}.txt", {
+            'MIX': {f"{channel}/mute": rng.choice(('ON', 'OFF')) for channel in channels},
+            'PEDALS': {'alain_mfx': f"PC {rng.randint(0, 127)}"},
+        })
+    build_ms = (time.perf_counter() - start) * 1000
+    terms = [('MIX', 'chant_3/mute', 'off'), ('PEDALS', 'alain_mfx', 'pc 89')]
+    start = time.perf_counter()
+    for _ in range(iterations):
+        result = index.query(terms)
+    duration_us = (time.perf_counter() - start) / iterations * 1e6
+    print(f"Index des commandes de {song_count} chansons construit en {build_ms:.0f} ms, "
+          f"requête à 2 critères : {duration_us:.1f} µs -> {len(result)} chanson(s)")
+
+
+# ==============================================================================
+# UNITARY TESTS
+# ==============================================================================
+
+def _build_index(songs):
+    index = SongCommandIndex()
+    for song_filename, sections in songs:
+        index.update_song(song_filename, sections)
+    return index
+
+_SONGS = [
+    ('a.txt', {'MIX': {'chant_olivier/mute': 'OFF'}, 'PEDALS': {'alain_mfx': 'PC 89'}}),
+    ('b.txt', {'MIX': {'chant_olivier/mute': 'ON'}, 'PEDALS': {'alain_mfx': 'PC  89'}}),
+    ('c.txt', {'MIX': {'chant_olivier/mute': 'OFF'}, 'PEDALS': {}}),
+]
+
+def _query_scenario(query_strings):
+    return _build_index(_SONGS).query([parse_query_term(query_string) for query_string in query_strings])
+
+def _update_scenario():
+    # a.txt coupe désormais chant_olivier et n'utilise plus alain_mfx, c.txt est supprimée puis son identifiant réutilisé
+    index = _build_index(_SONGS)
+    index.update_song('a.txt', {'MIX': {'chant_olivier/mute': 'ON'}, 'PEDALS': {}})
+    index.remove_song('c.txt')
+    index.update_song('d.txt', {'MIX': {'chant_olivier/mute': 'OFF'}})
+    return (index.query([('MIX', 'chant_olivier/mute', 'off')]), index.query([('PEDALS', 'alain_mfx')]),
+            index.song_ids['d.txt'], len(index.postings))
+
+TEST_PLAN: test_utility.TestPlan = [
+    {
+        "chapter_title": "1: Critères",
+        "tests": [
+            {
+                "test_title": "Valeur normalisée",
+                "function_under_test": parse_query_term,
+                "expected_return": ('PEDALS', 'alain_mfx', 'pc 89'),
+                "function_arguments": ["pedals/Alain_Mfx = PC  89"]
+            },
+            {
+                "test_title": "Présence d'une commande",
+                "function_under_test": parse_query_term,
+                "expected_return": ('MIX', 'chant_olivier/mute'),
+                "function_arguments": ["MIX/chant_olivier/mute"]
+            },
+            {
+                "test_title": "Format invalide",
+                "function_under_test": parse_query_term,
+                "expected_return": None,
+                "function_arguments": ["chant_olivier = ON"]
+            },
+        ]
+    },
+    {
+        "chapter_title": "2: Requêtes",
+        "tests": [
+            {
+                "test_title": "Chansons qui ne coupent pas chant_olivier",
+                "function_under_test": _query_scenario,
+                "expected_return": ['a.txt', 'c.txt'],
+                "function_arguments": [["MIX/chant_olivier/mute = off"]]
+            },
+            {
+                "test_title": "Deux critères",
+                "function_under_test": _query_scenario,
+                "expected_return": ['a.txt'],
+                "function_arguments": [["MIX/chant_olivier/mute = OFF", "PEDALS/alain_mfx = PC 89"]]
+            },
+            {
+                "test_title": "Présence d'une commande",
+                "function_under_test": _query_scenario,
+                "expected_return": ['a.txt', 'b.txt'],
+                "function_arguments": [["PEDALS/alain_mfx"]]
+            },
+            {
+                "test_title": "Aucune chanson",
+                "function_under_test": _query_scenario,
+                "expected_return": [],
+                "function_arguments": [["PEDALS/alain_mfx = PC 90"]]
+            },
+            {
+                "test_title": "Mise à jour incrémentale et suppression",
+                "function_under_test": _update_scenario,
+                "expected_return": (['d.txt'], ['b.txt'], 2, 5),
+                "function_arguments": []
+            },
+        ]
+    },
+]
+
+def run_unitary_tests():
+    return (test_utility.run_test_plan(TEST_PLAN))
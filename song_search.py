@@ -0,0 +1,210 @@
+# module: song_search
+# Index de recherche approximative des chansons ("aller à la chanson ...") : trie de préfixes + trigrammes
+import random
+import re
+import time
+import unicodedata
+import test_utility
+
+def normalize_text(text):
+    """
+    Minuscules, sans accents, mots séparés par un espace, chiffres séparés des lettres
+    (ex: 'Ça_Plane pour.moi' -> 'ca plane pour moi', 'chanson2' -> 'chanson 2').
+    """
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return ' '.join(re.findall(r'[a-z]+|[0-9]+', text))
+
+def get_trigrams(text):
+    """Trigrammes d'un texte normalisé, chaque mot étant encadré d'espaces ('moi' -> ' mo', 'moi', 'oi ')."""
+    trigrams = set()
+    for word in text.split():
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            trigrams.add(padded[i:i + 3])
+    return trigrams
+
+class SongSearchIndex:
+    """
+    Index en mémoire des chansons, par nom de fichier et titre ([SONG_INFO] title) :
+    - un trie des mots (chaque noeud connaît les chansons dont un mot commence par ce préfixe),
+      pour les saisies partielles ('sept' -> 'Septembre') ;
+    - des listes de trigrammes, pour tolérer les fautes de frappe ('septmbre').
+    Une recherche ne lit jamais les fichiers : les trigrammes les plus rares de la saisie
+    désignent quelques candidats, qui sont seuls évalués.
+    """
+
+    def __init__(self):
+        self.songs = {}         # fichier -> (texte normalisé, trigrammes)
+        self.trie = {}          # lettre -> noeud ; noeud['$'] = fichiers dont un mot a ce préfixe
+        self.trigrams = {}      # trigramme -> fichiers
+
+    def add_song(self, song_filename, title=''):
+        """Ajoute ou met à jour une chanson (à rappeler quand son titre change)."""
+        stem = song_filename.rsplit('.', 1)[0]
+        text = normalize_text(f"{title} {stem}")
+        if self.songs.get(song_filename, (None,))[0] == text:
+            return
+        self.remove_song(song_filename)
+
+        trigrams = frozenset(get_trigrams(text))
+        self.songs[song_filename] = (text, trigrams)
+        for word in set(text.split()):
+            node = self.trie
+            for letter in word:
+                node = node.setdefault(letter, {})
+                node.setdefault('$', set()).add(song_filename)
+        for trigram in trigrams:
+            self.trigrams.setdefault(trigram, set()).add(song_filename)
+
+    def remove_song(self, song_filename):
+        if song_filename not in self.songs:
+            return
+        text, trigrams = self.songs.pop(song_filename)
+        for word in set(text.split()):
+            node = self.trie
+            for letter in word:
+                node = node[letter]
+                node['$'].discard(song_filename)
+        for trigram in trigrams:
+            self.trigrams[trigram].discard(song_filename)
+
+    def get_prefix_matches(self, word):
+        node = self.trie
+        for letter in word:
+            node = node.get(letter)
+            if node is None:
+                return ()
+        return node['$']
+
+    def search(self, query, limit=5, max_candidates=64):
+        """
+        Retourne les meilleures chansons pour la saisie, sous la forme [(score, fichier)] triée par score décroissant.
+        Chaque mot saisi qui est le début d'un mot de la chanson compte 1 point, auquel s'ajoute
+        la similarité des trigrammes (indice de Jaccard, entre 0 et 1).
+        """
+        text = normalize_text(query)
+        if len(text) == 0:
+            return []
+        query_trigrams = get_trigrams(text)
+        prefix_matches = [self.get_prefix_matches(word) for word in text.split()]
+
+        # candidats : chansons partageant les trigrammes les plus rares, complétées par les préfixes peu fréquents.
+        # Les trigrammes trop courants (présents dans plus de max_candidates chansons) ne désignent rien.
+        hits = {}
+        for posting in sorted((self.trigrams.get(trigram, ()) for trigram in query_trigrams), key=len):
+            if len(posting) > max_candidates and len(hits) > 0:
+                break
+            for song_filename in posting:
+                hits[song_filename] = hits.get(song_filename, 0) + 1
+        for matches in prefix_matches:
+            if len(matches) <= max_candidates:
+                for song_filename in matches:
+                    hits[song_filename] = hits.get(song_filename, 0) + 1
+        if len(hits) > max_candidates:
+            hits = dict(sorted(hits.items(), key=lambda item: -item[1])[:max_candidates])
+
+        results = []
+        for song_filename in hits:
+            song_trigrams = self.songs[song_filename][1]
+            shared = len(query_trigrams & song_trigrams)
+            score = sum(1 for matches in prefix_matches if song_filename in matches)
+            score += shared / (len(query_trigrams) + len(song_trigrams) - shared)
+            results.append((score, song_filename))
+        results.sort(key=lambda item: (-item[0], item[1]))
+        return results[:limit]
+
+    def find_best(self, query):
+        """Retourne le fichier de la chanson la plus proche de la saisie, ou None."""
+        results = self.search(query, 1)
+        return results[0][1] if len(results) > 0 else None
+
+
+def benchmark_song_search(song_count=5000, iterations=1000):
+    """Mesure le temps d'une recherche dans une bibliothèque synthétique de song_count chansons."""
+    rng = random.Random(0)
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 9))) for _ in range(2000)]
+    index = SongSearchIndex()
+    titles = []
+    for i in range(song_count):
+        title = ' '.join(rng.sample(words, 3))
+        titles.append(title)
+        index.add_song(f"{title.replace(' ', '_')}.txt", title)
+
+    # préfixe, faute de frappe (deux lettres inversées), titre complet
+    typo = titles[1234][:2] + titles[1234][3] + titles[1234][2] + titles[1234][4:]
+    for query in (titles[42][:6], typo, titles[4321]):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            best = index.find_best(query)
+        duration_us = (time.perf_counter() - start) / iterations * 1e6
+        print(f"Recherche '{query}' dans {song_count} chansons : {duration_us:.0f} µs -> {best}")
+
+
+# ==============================================================================
+# UNITARY TESTS
+# ==============================================================================
+
+def _build_index(songs):
+    index = SongSearchIndex()
+    for song_filename, title in songs:
+        index.add_song(song_filename, title)
+    return index
+
+_TEST_SONGS = [('chanson1.txt', 'Septembre'), ('chanson2.txt', 'Ça plane pour moi'), ('blues.txt', 'Sweet Home Chicago')]
+
+def _find_best(songs, query):
+    return _build_index(songs).find_best(query)
+
+def _find_after_rename(query):
+    # le titre d'une chanson change (rechargement) : l'ancien titre ne doit plus la trouver
+    index = _build_index(_TEST_SONGS)
+    index.add_song('chanson1.txt', 'Hotel California')
+    return index.find_best(query)
+
+TEST_PLAN: test_utility.TestPlan = [
+    {
+        "chapter_title": "1: Recherche approximative des chansons",
+        "tests": [
+            {
+                "test_title": "Normalisation (accents, casse, ponctuation)",
+                "function_under_test": normalize_text,
+                "expected_return": 'ca plane pour moi',
+                "function_arguments": ['Ça_Plane pour.moi']
+            },
+            {
+                "test_title": "Préfixe d'un mot du titre",
+                "function_under_test": _find_best,
+                "expected_return": 'chanson1.txt',
+                "function_arguments": [_TEST_SONGS, 'sept']
+            },
+            {
+                "test_title": "Faute de frappe tolérée par les trigrammes",
+                "function_under_test": _find_best,
+                "expected_return": 'blues.txt',
+                "function_arguments": [_TEST_SONGS, 'chicgao']
+            },
+            {
+                "test_title": "Recherche par nom de fichier",
+                "function_under_test": _find_best,
+                "expected_return": 'chanson2.txt',
+                "function_arguments": [_TEST_SONGS, 'chanson2']
+            },
+            {
+                "test_title": "Aucune correspondance",
+                "function_under_test": _find_best,
+                "expected_return": None,
+                "function_arguments": [_TEST_SONGS, 'xyzzy']
+            },
+            {
+                "test_title": "Index mis à jour quand le titre change",
+                "function_under_test": _find_after_rename,
+                "expected_return": 'chanson2.txt',
+                "function_arguments": ['septembre plane']
+            },
+        ]
+    },
+]
+
+def run_unitary_tests():
+    return (test_utility.run_test_plan(TEST_PLAN))
@@ -1,14 +1,25 @@
+import concurrent.futures
+import contextlib
 import inspect
+import io
+import json
+import pickle
+import statistics
+import time
 from typing import Callable, Any, List, Tuple, Union, Dict, TypedDict
 
 # Définition d'un cas de test unique
-class TestCase(TypedDict):
-    """Structure pour un cas de test unique."""
+class _TestCaseFields(TypedDict):
     test_title: str                         # NOUVEAU: Titre spécifique du test
     function_under_test: Callable
     expected_return: Union[Any, Tuple[Any, ...]]
     function_arguments: List[Any]
 
+class TestCase(_TestCaseFields, total=False):
+    """Structure pour un cas de test unique (les champs de performance sont optionnels)."""
+    iterations: int                         # nombre d'appels mesurés (1 par défaut)
+    max_duration_us: float                  # durée médiane maximale d'un appel, en microsecondes
+
 # Définition d'un groupe de tests (Chapitre)
 class TestGroup(TypedDict):
     """Structure pour un chapitre ou groupe de tests."""
@@ -23,15 +34,28 @@ def do_test(
     test_title: str,
     function_under_test: Callable,
     expected_return: Union[Any, Tuple[Any, ...]],
-    function_arguments: List[Any]
-) -> bool:
+    function_arguments: List[Any],
+    iterations: int = 1,
+    max_duration_us: float = None
+) -> Dict[str, Any]:
     """
     Exécute la fonction avec les arguments donnés et compare le résultat
-    avec le résultat attendu. Retourne True si le test passe, False sinon.
+    avec le résultat attendu. La fonction est appelée iterations fois et chaque appel
+    est chronométré : si max_duration_us est donné, une durée médiane supérieure fait
+    échouer le test. Retourne le résultat du test : {'passed', 'min_us', 'median_us', ...}.
     """
+    result = {'test_title': test_title, 'function': function_under_test.__name__, 'passed': False,
+              'iterations': iterations, 'min_us': None, 'median_us': None, 'max_duration_us': max_duration_us}
     try:
         # Appelle la fonction avec les arguments décomposés (*function_arguments)
-        actual_return = function_under_test(*function_arguments)
+        durations = []
+        for _ in range(max(1, iterations)):
+            start = time.perf_counter_ns()
+            actual_return = function_under_test(*function_arguments)
+            durations.append((time.perf_counter_ns() - start) / 1000)
+        result['min_us'] = min(durations)
+        result['median_us'] = statistics.median(durations)
+        timing = f" [min {result['min_us']:.1f} µs, médiane {result['median_us']:.1f} µs sur {len(durations)}]"
 
         # La comparaison dépend si on attend un seul résultat ou un tuple
         if isinstance(expected_return, Tuple):
@@ -45,49 +69,117 @@ def do_test(
             test_passed = (actual_return == expected_return)
 
 
-        if test_passed:
-            print(f"✅ TEST PASSE : {function_under_test.__name__}({function_arguments}) == {expected_return}")
-        else:
+        if not test_passed:
             print(f"❌ TEST ECHOUÉ : {function_under_test.__name__}({function_arguments}). Attendu: {expected_return}, Obtenu: {actual_return}")
+        elif max_duration_us is not None and result['median_us'] > max_duration_us:
+            test_passed = False
+            print(f"⏱️ TEST TROP LENT : {function_under_test.__name__}({function_arguments}){timing}, maximum {max_duration_us} µs")
+        else:
+            print(f"✅ TEST PASSE : {function_under_test.__name__}({function_arguments}) == {expected_return}{timing}")
 
-        return test_passed
+        result['passed'] = test_passed
+        return result
 
     except Exception as e:
         print(f"💥 ERREUR lors de l'exécution du test {test_title} pour {function_under_test.__name__}: {e}")
+        result['error'] = str(e)
+        return result
+
+def run_chapter(chapter_config: TestGroup) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    Exécute les tests d'un chapitre et retourne (résultats, affichage). L'affichage est capturé
+    pour que les chapitres exécutés en parallèle ne se mélangent pas à l'écran.
+    """
+    output = io.StringIO()
+    results = []
+    with contextlib.redirect_stdout(output):
+        print(f"\n--- {chapter_config['chapter_title']} ({len(chapter_config['tests'])} tests) ---")
+        for test_config in chapter_config["tests"]:
+            result = do_test(test_config["test_title"], test_config["function_under_test"],
+                             test_config["expected_return"], test_config["function_arguments"],
+                             test_config.get("iterations", 1), test_config.get("max_duration_us"))
+            result['chapter_title'] = chapter_config["chapter_title"]
+            results.append(result)
+    return results, output.getvalue()
+
+def is_picklable(value) -> bool:
+    try:
+        pickle.dumps(value)
+        return True
+    except Exception:
         return False
 
+def is_timed_chapter(chapter_config: TestGroup) -> bool:
+    return any(test_config.get("max_duration_us") is not None for test_config in chapter_config["tests"])
+
+def run_test_plans(test_plans: Dict[str, TestPlan], workers: int = 1, result_file: str = '') -> List[Dict[str, Any]]:
+    """
+    Exécute plusieurs plans de tests ({nom du module: plan}). Les chapitres sont indépendants :
+    avec workers > 1 ils sont répartis sur des processus, l'affichage restant dans l'ordre des plans.
+    Un chapitre non transmissible à un processus (lambda, objet local) est exécuté dans ce processus.
+    Les chapitres chronométrés (max_duration_us) sont exécutés un par un, une fois les processus terminés :
+    en concurrence avec les autres chapitres, leurs durées mesurées dépendraient de la charge de la machine.
+    Les résultats (durées comprises) sont écrits en JSON dans result_file s'il est donné.
+    """
+    print("==================================================")
+    print("         DÉBUT DU PLAN D'EXÉCUTION DES TESTS")
+    print("==================================================")
+
+    chapters = [(plan_name, chapter_config) for plan_name, test_plan in test_plans.items() for chapter_config in test_plan]
+    start = time.perf_counter()
+    if workers > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = [executor.submit(run_chapter, chapter_config)
+                       if is_picklable(chapter_config) and not is_timed_chapter(chapter_config) else None
+                       for _, chapter_config in chapters]
+            chapter_outputs = [future.result() if future is not None else None for future in pending]
+        chapter_outputs = [output if output is not None else run_chapter(chapter_config)
+                           for output, (_, chapter_config) in zip(chapter_outputs, chapters)]
+    else:
+        chapter_outputs = [run_chapter(chapter_config) for _, chapter_config in chapters]
+    duration = time.perf_counter() - start
+
+    all_results = []
+    for (plan_name, _), (results, output) in zip(chapters, chapter_outputs):
+        print(output, end='')
+        for result in results:
+            result['test_plan'] = plan_name
+        all_results += results
+
+    passed_tests = sum(1 for result in all_results if result['passed'])
+    print("\n==================================================")
+    print("         FIN DU PLAN D'EXÉCUTION DES TESTS")
+    print("==================================================")
+    print(f"RÉSUMÉ FINAL: {passed_tests} tests réussis sur {len(all_results)} au total ({duration:.2f} s).")
+    for result in all_results:
+        if not result['passed']:
+            print(f"    ❌ [{result['test_plan']}] {result['chapter_title']} / {result['test_title']}")
+
+    if len(result_file) > 0:
+        with open(result_file, 'w', encoding='utf-8') as f:
+            json.dump({'passed': passed_tests, 'total': len(all_results), 'duration_s': duration,
+                       'tests': all_results}, f, ensure_ascii=False, indent=1)
+        print(f"Résultats écrits dans '{result_file}'")
+    return all_results
+
 def run_test_plan(test_plan: TestPlan):
     """Parcourt le plan de tests, chapitre par chapitre, et exécute chaque test."""
     print("==================================================")
     print("         DÉBUT DU PLAN D'EXÉCUTION DES TESTS")
     print("==================================================")
     
-    total_tests = 0
-    passed_tests = 0
-
+    all_results = []
     for chapter_config in test_plan:
-        chapter_title = chapter_config["chapter_title"]
-        test_list = chapter_config["tests"]
-        
-        print(f"\n--- {chapter_title} ({len(test_list)} tests) ---")
-
-        for test_config in test_list:
-            total_tests += 1
-            
-            # Récupère toutes les valeurs du dictionnaire de configuration du test
-            title = test_config["test_title"]
-            func = test_config["function_under_test"]
-            expected = test_config["expected_return"]
-            args = test_config["function_arguments"]
-
-            # Appelle la fonction do_test avec les nouveaux arguments
-            if do_test(title, func, expected, args):
-                passed_tests += 1
+        results, output = run_chapter(chapter_config)
+        print(output, end='')
+        all_results += results
+    passed_tests = sum(1 for result in all_results if result['passed'])
 
     print("\n==================================================")
     print("         FIN DU PLAN D'EXÉCUTION DES TESTS")
     print("==================================================")
-    print(f"RÉSUMÉ FINAL: {passed_tests} tests réussis sur {total_tests} au total.")
+    print(f"RÉSUMÉ FINAL: {passed_tests} tests réussis sur {len(all_results)} au total.")
+    return all_results
 
 
         
@@ -1,7 +1,8 @@
 # module: utilities
 
 import re
-from typing import List, Any
+import time
+from typing import List, Any, Iterator, Tuple
 import test_utility
 
 def hex_to_dec(hex_value):
@@ -79,6 +80,9 @@ def split_list_into_chunks(input_list: List[Any], chunk_size: int = 3) -> List[L
     Si la liste d'entrée a 3 éléments ou moins, elle est retournée comme
     une seule sous-liste dans la liste de résultat.
 
+    N'est plus utilisée pour l'envoi MIDI (découpage faux pour les messages de 2 octets),
+    voir iter_midi_messages. Conservée comme référence de benchmark_midi_framing.
+
     Args:
         input_list (List[Any]): La liste à scinder.
         chunk_size (int): La taille maximale des sous-listes (par défaut à 3).
@@ -101,6 +105,123 @@ def split_list_into_chunks(input_list: List[Any], chunk_size: int = 3) -> List[L
         for i in range(0, list_length, chunk_size)
     ]
 
+# ==============================================================================
+# DECOUPAGE D'UN FLUX MIDI EN MESSAGES
+# ==============================================================================
+
+def _compute_midi_status_lengths():
+    lengths = [0] * 256                     # 0 : octet de donnée (running status)
+    for status in range(0x80, 0xF0):
+        lengths[status] = 2 if 0xC0 <= status <= 0xDF else 3
+    lengths[0xF0] = -1                      # SysEx : jusqu'au 0xF7
+    lengths[0xF1] = 2                       # MTC quarter frame
+    lengths[0xF2] = 3                       # Song Position Pointer
+    lengths[0xF3] = 2                       # Song Select
+    for status in (0xF4, 0xF5, 0xF6, 0xF7):
+        lengths[status] = 1                 # non définis, Tune Request, fin de SysEx isolée
+    for status in range(0xF8, 0x100):
+        lengths[status] = 1                 # temps réel (Clock, Start, Stop...)
+    return tuple(lengths)
+
+# Longueur totale (status compris) des messages MIDI, indexée par le status byte
+MIDI_STATUS_LENGTHS = _compute_midi_status_lengths()
+
+def iter_midi_messages(data) -> Iterator[Tuple[int, memoryview]]:
+    """
+    Découpe un flux d'octets MIDI en messages, sans copie : retourne des couples
+    (status, message) où message est une tranche memoryview de data.
+
+    - la longueur de chaque message est donnée par la table MIDI_STATUS_LENGTHS ;
+    - running status : un message canal sans status byte est retourné avec le status
+      précédent, et la tranche ne contient alors que les octets de données
+      (message[0] < 0x80, c'est à l'appelant d'ajouter le status s'il en a besoin) ;
+    - SysEx : le message va du 0xF0 au 0xF7 inclus ;
+    - les messages temps réel (0xF8-0xFF) ne modifient pas le running status,
+      les messages système communs l'annulent ;
+    - les octets de donnée orphelins et un message final incomplet sont ignorés.
+    """
+    view = memoryview(data)
+    data_length = len(view)
+    lengths = MIDI_STATUS_LENGTHS
+    running_status = 0
+    offset = 0
+
+    while offset < data_length:
+        byte = view[offset]
+
+        if byte >= 0x80:
+            status = byte
+            data_count = lengths[status] - 1
+            if data_count < 0:
+                # SysEx : recherche du 0xF7 de fin
+                end = offset + 1
+                while end < data_length and view[end] != 0xF7:
+                    end += 1
+                if end == data_length:
+                    return
+                running_status = 0
+                yield status, view[offset:end + 1]
+                offset = end + 1
+                continue
+            data_start = offset + 1
+            if status < 0xF0:
+                running_status = status
+            elif status < 0xF8:
+                running_status = 0
+        elif running_status != 0:
+            status = running_status
+            data_count = lengths[status] - 1
+            data_start = offset
+        else:
+            # octet de donnée orphelin
+            offset += 1
+            continue
+
+        end = data_start + data_count
+        if end > data_length:
+            return
+        # un status byte à la place d'une donnée interrompt le message incomplet
+        if data_count > 0 and view[data_start] >= 0x80:
+            offset = data_start
+            continue
+        if data_count > 1 and view[data_start + 1] >= 0x80:
+            offset = data_start + 1
+            continue
+
+        yield status, view[offset:end]
+        offset = end
+
+def benchmark_midi_framing(iterations=20000):
+    """
+    Compare le découpage d'un changement de chanson typique (20 NRPN de 12 octets et 5 PC)
+    par split_list_into_chunks (une liste par message) et par iter_midi_messages (un seul buffer).
+    Retourne les durées moyennes en microsecondes par changement de chanson (ancien, nouveau).
+    """
+    nrpn = [0xB0, 0x63, 0x40, 0xB0, 0x62, 0x02, 0xB0, 0x06, 0x4B, 0xB0, 0x26, 0x00]
+    program_change = [0xC3, 0x3A]
+    song_messages = [list(nrpn) for _ in range(20)] + [list(program_change) for _ in range(5)]
+    song_buffer = bytes(nrpn * 20 + program_change * 5)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for msg in song_messages:
+            for chunk in split_list_into_chunks(msg):
+                pass
+    split_duration = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for status, midi_msg in iter_midi_messages(song_buffer):
+            pass
+    framer_duration = time.perf_counter() - start
+
+    split_us = split_duration * 1e6 / iterations
+    framer_us = framer_duration * 1e6 / iterations
+    print(f"Découpage d'un changement de chanson (20 NRPN + 5 PC), {iterations} itérations :")
+    print(f"  split_list_into_chunks : {split_us:8.2f} µs")
+    print(f"  iter_midi_messages     : {framer_us:8.2f} µs")
+    return split_us, framer_us
+
 def extraire_chaine_et_nombre(s):
     match = re.match(r"([A-Z]+)(\d*)", s)
     if match:
@@ -187,6 +308,10 @@ def get_interpolated_value(table_valeurs, x_cible):
 # UNITARY TESTS
 # ==============================================================================
 
+def _framed(data):
+    # convertit les tranches en bytes pour pouvoir comparer les résultats du découpage
+    return [(status, bytes(midi_msg)) for status, midi_msg in iter_midi_messages(data)]
+
 TEST_PLAN: test_utility.TestPlan = [
     {
         "chapter_title": "1: Test des fonctions de conversion",
@@ -210,7 +335,42 @@ TEST_PLAN: test_utility.TestPlan = [
                 "function_arguments": [[156, 6, 127, 64530]]
             },
         ]
-    }
+    },
+    {
+        "chapter_title": "2: Découpage d'un flux MIDI en messages",
+        "tests": [
+            {
+                "test_title": "Rappel de scène CQ18T (CC puis PC)",
+                "function_under_test": _framed,
+                "expected_return": [(0xB0, b'\xb0\x00\x00'), (0xC0, b'\xc0\x0b')],
+                "function_arguments": [b'\xb0\x00\x00\xc0\x0b']
+            },
+            {
+                "test_title": "PC suivi d'un CC (mal découpé par split_list_into_chunks)",
+                "function_under_test": _framed,
+                "expected_return": [(0xC5, b'\xc5\x3a'), (0xB5, b'\xb5\x07\x7f'), (0xC6, b'\xc6\x01')],
+                "function_arguments": [b'\xc5\x3a\xb5\x07\x7f\xc6\x01']
+            },
+            {
+                "test_title": "Running status (NRPN sans status répété)",
+                "function_under_test": _framed,
+                "expected_return": [(0xB0, b'\xb0\x63\x40'), (0xB0, b'\x62\x02'), (0xB0, b'\x06\x4b')],
+                "function_arguments": [b'\xb0\x63\x40\x62\x02\x06\x4b']
+            },
+            {
+                "test_title": "SysEx puis Clock au milieu d'un running status",
+                "function_under_test": _framed,
+                "expected_return": [(0xF0, b'\xf0\x00\x01\xf7'), (0x90, b'\x90\x24\x7f'), (0xF8, b'\xf8'), (0x90, b'\x24\x00')],
+                "function_arguments": [b'\xf0\x00\x01\xf7\x90\x24\x7f\xf8\x24\x00']
+            },
+            {
+                "test_title": "Octets orphelins et message final incomplet ignorés",
+                "function_under_test": _framed,
+                "expected_return": [(0xC0, b'\xc0\x05')],
+                "function_arguments": [b'\x12\x34\xc0\x05\xf3\xb0\x07']
+            },
+        ]
+    },
     
 ]  
 